@@ -0,0 +1,341 @@
+import asyncio
+import logging
+import time
+from io import BytesIO
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from telegram import Message, Update
+from telegram.constants import ChatType
+from telegram.error import BadRequest
+from telegram.ext import ContextTypes
+
+from app.bot.filters import message_links
+from app.bot.handlers import (
+    deny_private_access, downloader, enqueue_tweets, media_dir, probe_uncached, reply_media, work_queue,
+)
+from app.core.config import config
+from app.core.metrics import batch_tweets
+from app.core.tracing import trace_failed, tracer
+from app.downloader.twitter import TwitterAPIError
+
+logger = logging.getLogger(__name__)
+
+# Uploaded lists are read in pieces of this size; a piece is cut at its last
+# whitespace so links are never split between two of them
+READ_CHUNK_SIZE = 64 * 1024
+# CSV delimiters and quotes become spaces, the link pattern would run across them
+FIELD_SEPARATORS = str.maketrans({",": " ", ";": " ", '"': " ", "\t": " "})
+MAX_MESSAGE_LENGTH = 4000
+
+BATCH_USAGE_TEXT = (
+    "Send /batch followed by tweet links, reply /batch to a message or link list, "
+    "or upload a .txt/.csv file with one link per line (in groups, with /batch as its caption). "
+    "/batch cancel stops the running batch."
+)
+NO_LINKS_TEXT = "No tweet links found in that file."
+
+# Running batches by chat; a chat runs one batch at a time
+active_batches: Dict[int, "BatchJob"] = {}
+
+def _read_piece(f) -> str:
+    return f.read(READ_CHUNK_SIZE)
+
+async def iter_file_text(path: str) -> AsyncIterator[str]:
+    """Yield the text of a file in whitespace-aligned pieces, reading off the event loop."""
+    f = await asyncio.to_thread(open, path, "r", encoding="utf-8", errors="replace")
+    try:
+        carry = ""
+        while True:
+            piece = await asyncio.to_thread(_read_piece, f)
+            if not piece:
+                break
+            text = carry + piece.translate(FIELD_SEPARATORS)
+            cut = max(text.rfind("\n"), text.rfind(" "))
+            if cut < 0 and len(text) < READ_CHUNK_SIZE * 2:
+                carry = text
+                continue
+            if cut < 0:
+                cut = len(text) - 1
+            yield text[:cut + 1]
+            carry = text[cut + 1:]
+        if carry:
+            yield carry
+    finally:
+        await asyncio.to_thread(f.close)
+
+async def iter_text(text: str) -> AsyncIterator[str]:
+    yield text.translate(FIELD_SEPARATORS)
+
+class BatchJob:
+    """
+    Sends the media of every distinct tweet linked in a stream of text.
+
+    IDs are extracted piece by piece and fed through a bounded queue to a fixed
+    number of workers, so a list is never held in memory in full; only the set
+    of IDs already seen (for deduplication) grows with it. Tweets are sent in
+    the order they finish, not the order they were listed. One progress message,
+    posted once the first tweet ID is found, is edited at most every
+    BATCH_PROGRESS_INTERVAL seconds, and a summary of what failed is posted at
+    the end. A text without tweet IDs gets empty_reply, or nothing if it's None.
+
+    With a work queue configured, the IDs are queued for the workers instead,
+    which reply to the message per tweet like they do for single links.
+    """
+
+    def __init__(
+        self,
+        update: Update,
+        context: ContextTypes.DEFAULT_TYPE,
+        concurrency: int = config.BATCH_CONCURRENCY,
+        max_links: int = config.BATCH_MAX_LINKS,
+        progress_interval: float = config.BATCH_PROGRESS_INTERVAL,
+        empty_reply: Optional[str] = None,
+    ):
+        self.update = update
+        self.context = context
+        self.concurrency = max(1, concurrency)
+        self.max_links = max_links
+        self.progress_interval = progress_interval
+        self.empty_reply = empty_reply
+        self.seen: Set[str] = set()
+        self.sent = 0
+        self.queued = 0
+        self.failures: List[Tuple[str, str]] = []
+        self.truncated = False
+        self.reading = True
+        self.cancelled = False
+        self.task: Optional[asyncio.Task] = None
+        self.progress_message: Optional[Message] = None
+        self._last_progress = ""
+
+    @property
+    def done(self) -> int:
+        return self.sent + len(self.failures)
+
+    async def run(self, pieces: AsyncIterator[str]):
+        if work_queue:
+            try:
+                await self._produce(pieces, self._enqueue)
+            except asyncio.CancelledError:
+                self.cancelled = True
+            finally:
+                self.reading = False
+                await self._send_summary()
+            return
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        workers = [asyncio.create_task(self._worker(queue)) for _ in range(self.concurrency)]
+        reporter = asyncio.create_task(self._report_progress())
+        try:
+            await self._produce(pieces, queue.put)
+            self.reading = False
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        except asyncio.CancelledError:
+            self.cancelled = True
+        finally:
+            self.reading = False
+            for task in workers + [reporter]:
+                task.cancel()
+            await asyncio.gather(*workers, reporter, return_exceptions=True)
+            await self._send_summary()
+
+    async def _produce(self, pieces: AsyncIterator[str], put: Callable[[str], Awaitable[None]]):
+        async for piece in pieces:
+            for tweet_id in downloader.extract_tweet_ids(piece):
+                if tweet_id in self.seen:
+                    continue
+                if len(self.seen) >= self.max_links:
+                    self.truncated = True
+                    return
+                if not self.seen and not work_queue:
+                    self.progress_message = await self.update.message.reply_text("Batch started, reading links...")
+                self.seen.add(tweet_id)
+                # Blocks while the workers are behind, which stops the reading too
+                await put(tweet_id)
+
+    async def _enqueue(self, tweet_id: str):
+        await enqueue_tweets(self.update, [tweet_id], None)
+        self.queued += 1
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            tweet_id = await queue.get()
+            if tweet_id is None:
+                return
+            with tracer.trace("batch_tweet", chat_id=self.update.effective_chat.id, tweet_id=tweet_id):
+                try:
+                    media_list = await downloader.get_tweet_media(tweet_id)
+                    if not media_list:
+                        self._fail(tweet_id, "no media")
+                        continue
+                    await probe_uncached(media_list, tweet_id)
+                    await reply_media(self.update, self.context, media_list, None, tweet_id=tweet_id)
+                    self.sent += 1
+                    batch_tweets.inc(result="sent")
+                except TwitterAPIError as e:
+                    self._fail(tweet_id, str(e))
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning(f"Batch item {tweet_id} failed: {e}", exc_info=True)
+                    self._fail(tweet_id, type(e).__name__)
+
+    def _fail(self, tweet_id: str, reason: str):
+        trace_failed()
+        self.failures.append((tweet_id, reason))
+        batch_tweets.inc(result="failed")
+
+    def _progress_text(self) -> str:
+        total = f"{len(self.seen)}+" if self.reading else str(len(self.seen))
+        return f"Batch: {self.done}/{total} tweets done, {len(self.failures)} failed."
+
+    async def _report_progress(self):
+        last_edit = time.monotonic()
+        while True:
+            await asyncio.sleep(1)
+            if not self.context.application.running:
+                # Application.stop() waits for the batch task, don't hold up shutdown
+                if self.task:
+                    self.task.cancel()
+                return
+            if time.monotonic() - last_edit >= self.progress_interval:
+                last_edit = time.monotonic()
+                await self._edit_progress(self._progress_text())
+
+    async def _edit_progress(self, text: str):
+        if text == self._last_progress or self.progress_message is None:
+            return
+        try:
+            await self.progress_message.edit_text(text)
+            self._last_progress = text
+        except BadRequest as e:
+            logger.debug(f"Couldn't update batch progress: {e}")
+
+    async def _send_summary(self):
+        if not self.seen and not self.cancelled:
+            if self.empty_reply:
+                await self.update.message.reply_text(self.empty_reply)
+            return
+        status = "cancelled" if self.cancelled else "finished"
+        if work_queue:
+            lines = [f"Batch {status}: {self.queued} distinct tweets queued, they'll follow shortly."]
+        else:
+            lines = [
+                f"Batch {status}: {self.sent} sent, {len(self.failures)} failed "
+                f"out of {len(self.seen)} distinct tweets."
+            ]
+        if self.truncated:
+            lines.append(f"Only the first {self.max_links} tweets were processed.")
+        if self.cancelled and not work_queue:
+            lines.append(f"{len(self.seen) - self.done} tweets were not processed.")
+        if self.failures:
+            lines.append("")
+            lines.append("Failed:")
+            lines.extend(f"https://x.com/i/status/{tweet_id} - {reason}" for tweet_id, reason in self.failures)
+        summary = "\n".join(lines)
+        await self._edit_progress(lines[0])
+        try:
+            if len(summary) > MAX_MESSAGE_LENGTH:
+                document = BytesIO(summary.encode())
+                document.name = "batch_report.txt"
+                await self.update.message.reply_document(document=document, caption=lines[0])
+            else:
+                await self.update.message.reply_text(summary, disable_web_page_preview=True)
+        except Exception as e:
+            logger.error(f"Failed to send batch summary: {e}")
+
+def _start_job(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    pieces: AsyncIterator[str],
+    cleanup: Optional[Callable] = None,
+    empty_reply: Optional[str] = None,
+):
+    chat_id = update.effective_chat.id
+    job = BatchJob(update, context, empty_reply=empty_reply)
+    active_batches[chat_id] = job
+
+    async def run():
+        try:
+            await job.run(pieces)
+        finally:
+            active_batches.pop(chat_id, None)
+            if cleanup:
+                cleanup()
+
+    # Runs outside the update so the chat's other messages aren't held up
+    job.task = context.application.create_task(run(), update=update)
+
+async def _document_pieces(update: Update, document) -> Optional[Tuple[AsyncIterator[str], Callable]]:
+    """Download an uploaded link list; returns its text stream and a cleanup callback."""
+    if document.file_size and document.file_size > config.BATCH_MAX_FILE_MB * 1024 * 1024:
+        await update.message.reply_text(f"Link lists are limited to {config.BATCH_MAX_FILE_MB} MB.")
+        return None
+    path = media_dir.new_path(".txt")
+    try:
+        file = await document.get_file()
+        await file.download_to_drive(path)
+    except Exception:
+        media_dir.remove(path)
+        raise
+    return iter_file_text(path), lambda: media_dir.remove(path)
+
+async def batch_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Run a batch over the links given with /batch or in the message it replies to."""
+    if not update.message or await deny_private_access(update):
+        return
+    chat_id = update.effective_chat.id
+    running = active_batches.get(chat_id)
+
+    if context.args and context.args[0].lower() == "cancel":
+        if running and running.task:
+            running.task.cancel()
+        else:
+            await update.message.reply_text("No batch is running.")
+        return
+    if running:
+        await update.message.reply_text("A batch is already running in this chat. Use /batch cancel to stop it.")
+        return
+
+    replied = update.message.reply_to_message
+    if replied and replied.document:
+        source = await _document_pieces(update, replied.document)
+        if source:
+            _start_job(update, context, *source, empty_reply=NO_LINKS_TEXT)
+        return
+
+    text = " ".join(context.args or [])
+    if replied:
+        text = " ".join(filter(None, [text, replied.text, replied.caption, *message_links(replied)]))
+    if not downloader.extract_tweet_ids(text):
+        await update.message.reply_text(BATCH_USAGE_TEXT)
+        return
+    _start_job(update, context, iter_text(text))
+
+def _batch_caption(message: Message, bot_username: Optional[str]) -> bool:
+    """Whether a message's caption starts with /batch (or /batch@<this bot>)."""
+    words = (message.caption or "").split(maxsplit=1)
+    command, _, target = (words[0] if words else "").partition("@")
+    return command.lower() == "/batch" and (not target or target.lower() == (bot_username or "").lower())
+
+async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Run a batch over an uploaded .txt/.csv link list. In groups only files
+    captioned /batch are read; other files there are none of our business.
+    """
+    message = update.message
+    if not message or not message.document:
+        return
+    requested = _batch_caption(message, context.bot.username)
+    if message.chat.type != ChatType.PRIVATE and not requested:
+        return
+    if await deny_private_access(update):
+        return
+    if update.effective_chat.id in active_batches:
+        await message.reply_text("A batch is already running in this chat. Use /batch cancel to stop it.")
+        return
+    source = await _document_pieces(update, message.document)
+    if source:
+        # Files dropped into a private chat without asking stay silent if they hold no links
+        _start_job(update, context, *source, empty_reply=NO_LINKS_TEXT if requested else None)
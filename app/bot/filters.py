@@ -0,0 +1,71 @@
+from typing import List
+
+from telegram import Message, MessageEntity
+from telegram.ext.filters import MessageFilter
+
+from app.core.metrics import messages_skipped
+
+LINK_ENTITIES = (MessageEntity.URL, MessageEntity.TEXT_LINK)
+# Twitter itself and the embed-fixing mirrors whose links url_pattern also
+# extracts IDs from, because their names end in "twitter.com" or "x.com";
+# subdomains (www., mobile., d.) count too. A host added here that doesn't
+# would pass the pre-filter only to get "No supported tweet link found."
+TWEET_HOSTS = (
+    "twitter.com",
+    "x.com",
+    "vxtwitter.com",
+    "fxtwitter.com",
+    "fixupx.com",
+    "fixvx.com",
+)
+
+def is_tweet_host(url: str) -> bool:
+    """Cheap host check for a URL as it appears in a message, with or without scheme."""
+    start = url.find("://")
+    host = url[start + 3:] if start >= 0 else url
+    host = host.split("/", 1)[0].split("?", 1)[0].rsplit("@", 1)[-1].split(":", 1)[0]
+    host = host.lower().rstrip(".")
+    # Whole labels only: netflix.com must not pass as x.com
+    return any(host == domain or host.endswith("." + domain) for domain in TWEET_HOSTS)
+
+def message_links(message: Message) -> List[str]:
+    """URLs of a message's url entities and the targets of its text_link entities."""
+    links = []
+    for entity in message.entities:
+        if entity.type == MessageEntity.URL:
+            links.append(message.parse_entity(entity))
+        elif entity.type == MessageEntity.TEXT_LINK and entity.url:
+            links.append(entity.url)
+    return links
+
+def tweet_link_text(message: Message) -> str:
+    """
+    The part of a message worth scanning for tweet links: its links joined by
+    spaces, or the whole text for messages without entities (e.g. built by hand).
+    """
+    if not message.entities:
+        return message.text or ""
+    return " ".join(link for link in message_links(message) if is_tweet_host(link))
+
+class TweetLinkFilter(MessageFilter):
+    """
+    Passes messages with a URL or text_link entity pointing at a tweet host.
+    Telegram marks every link it recognises with an entity, so most chatter in
+    busy groups is dropped after looking at entity types, before any regex or
+    handler runs. Dropped messages are counted in bot_messages_skipped_total.
+    """
+
+    __slots__ = ()
+
+    def filter(self, message: Message) -> bool:
+        entities = message.entities
+        if not entities or not any(entity.type in LINK_ENTITIES for entity in entities):
+            messages_skipped.inc(reason="no_links")
+            return False
+        for link in message_links(message):
+            if is_tweet_host(link):
+                return True
+        messages_skipped.inc(reason="other_hosts")
+        return False
+
+tweet_links = TweetLinkFilter(name="tweet_links")
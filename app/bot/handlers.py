@@ -1,12 +1,15 @@
+import asyncio
 import logging
 import html
 import json
 import traceback
 import os
 import re
+import time
 import httpx
+from contextlib import ExitStack
 from io import BytesIO
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Coroutine, Optional, Set, Tuple
 
 from telegram import (
     Update, 
@@ -19,12 +22,80 @@ from telegram import (
 )
 from telegram.ext import ContextTypes
 from telegram.error import BadRequest, Conflict, Forbidden
+from telegram.helpers import escape_markdown
 
+from app.bot.filters import is_tweet_host, tweet_link_text
+from app.bot.update_processor import ChatSerializingUpdateProcessor
 from app.core.config import config
+from app.core.file_cache import FileIdCache
+from app.core.http import http_pool
+from app.core.media_dir import MediaDirectory
+from app.core.metrics import (
+    metrics,
+    bytes_transferred,
+    media_sent,
+    messages_handled,
+    photo_sends,
+    queue_jobs,
+    stage_latency,
+    transfers_active,
+    transfers_waiting,
+    tweet_cache,
+    update_wait,
+    updates_active,
+    updates_queued,
+    video_faststart,
+    video_sends,
+)
+from app.core.profiler import profiler
+from app.core.scheduler import TransferScheduler
+from app.core.tracing import span, trace_failed, tracer
+from app.core.work_queue import work_queue_from_config
+from app.downloader.faststart import FaststartError, faststart
+from app.downloader.photos import PhotoDownloadError, PhotoDownloader, original_photo_url, split_groups
+from app.downloader.probe import MediaProber, SEND_BY_URL, TOO_LARGE
+from app.downloader.segmented import SegmentedDownloader
 from app.downloader.twitter import TwitterDownloader, TwitterAPIError
 
 logger = logging.getLogger(__name__)
 downloader = TwitterDownloader()
+prober = MediaProber(ttl=config.PROBE_CACHE_TTL, timeout=config.PROBE_TIMEOUT)
+photo_downloader = PhotoDownloader(
+    max_album_bytes=config.PHOTO_FALLBACK_MAX_MB * 1024 * 1024,
+    concurrency=config.PHOTO_FALLBACK_CONCURRENCY,
+    timeout=config.HTTP_TIMEOUT,
+)
+file_id_cache = FileIdCache(config.FILE_ID_CACHE_PATH, max_entries=config.FILE_ID_CACHE_MAX_ENTRIES)
+# Fallback downloads go straight into the directory shared with a Local Bot API
+# Server when one is configured, so they can be sent by path
+if config.BOT_API_BASE_URL and config.LOCAL_BOT_API_SHARED_DIR:
+    media_dir = MediaDirectory(
+        config.LOCAL_BOT_API_SHARED_DIR,
+        server_directory=config.LOCAL_BOT_API_SERVER_DIR or config.LOCAL_BOT_API_SHARED_DIR,
+    )
+else:
+    media_dir = MediaDirectory("data")
+transfer_scheduler = TransferScheduler(
+    max_active=config.MAX_ACTIVE_TRANSFERS,
+    max_per_user=config.MAX_TRANSFERS_PER_USER,
+    directory=media_dir.directory,
+    min_free_bytes=config.TRANSFER_MIN_FREE_MB * 1024 * 1024,
+    default_reserve_bytes=config.TRANSFER_DEFAULT_SIZE_MB * 1024 * 1024,
+    position_interval=config.TRANSFER_POSITION_INTERVAL,
+)
+
+# With a queue configured, tweets go to worker processes instead of being handled here
+work_queue = work_queue_from_config()
+
+transfers_active.function = lambda: transfer_scheduler.active
+transfers_waiting.function = lambda: transfer_scheduler.waiting
+
+DOWNLOADING_LOCALLY_TEXT = (
+    "Telegram API rejected the URL. Downloading locally to re-upload (this might take a while)..."
+)
+UPLOADING_LARGE_TEXT = (
+    "Video is too large to send by URL. Downloading locally to re-upload (this might take a while)..."
+)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send a message when the command /start is issued."""
@@ -36,94 +107,307 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send a message when the command /help is issued."""
-    await update.message.reply_text('Send tweet link here and I will download media in the best available quality for you.')
+    await update.message.reply_text(
+        'Send tweet link here and I will download media in the best available quality for you.\n'
+        'For many links at once, send /batch followed by the links or upload a .txt/.csv file with them (captioned /batch in groups).'
+    )
 
 async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send stats when the command /stats is issued."""
-    stats = context.bot_data.get('stats', {'messages_handled': 0, 'media_downloaded': 0})
-    await update.message.reply_markdown_v2(
-        f"*Bot stats:*\n"
-        f"Messages handled: *{stats.get('messages_handled')}*\n"
-        f"Media downloaded: *{stats.get('media_downloaded')}*"
-    )
+    url_sends = video_sends.get(path="url")
+    fallbacks = video_sends.get(path="upload")
+    fallback_rate = fallbacks / (url_sends + fallbacks) if url_sends + fallbacks else 0.0
+    lines = [
+        "*Bot stats:*",
+        f"Messages handled: *{int(messages_handled.total())}*",
+        f"Media downloaded: *{int(media_sent.total())}*",
+        f"Video fallback rate: *{escape_markdown(f'{fallback_rate:.1%}', version=2)}*",
+        f"Tweet cache: *{int(tweet_cache.get(result='hit'))}* hits, "
+        f"*{int(tweet_cache.get(result='miss'))}* misses, "
+        f"*{int(tweet_cache.get(result='coalesced'))}* coalesced",
+        f"Transfers: *{int(transfers_active.get())}* active, *{int(transfers_waiting.get())}* waiting",
+    ]
+    for stage, label in (("api_fetch", "API fetch"), ("send_url", "Send by URL"),
+                         ("download", "Download"), ("upload", "Upload")):
+        lines.append(f"{label}: {_format_percentiles(stage_latency, stage=stage)}")
+    if isinstance(context.application.update_processor, ChatSerializingUpdateProcessor):
+        lines.append(
+            f"Updates: *{int(updates_active.get())}* active, *{int(updates_queued.get())}* queued"
+        )
+        lines.append(f"Update wait: {_format_percentiles(update_wait)}")
+    if work_queue:
+        counts = await work_queue.counts()
+        lines.append(
+            f"Work queue: *{counts['ready']}* ready, *{counts['delayed']}* delayed, *{counts['dead']}* dead"
+        )
+    await update.message.reply_markdown_v2("\n".join(lines))
+
+def _format_percentiles(histogram, **labels) -> str:
+    """Render p50/p95/p99 of a latency histogram for a MarkdownV2 message."""
+    count = histogram.count(**labels)
+    if not count:
+        return "no data"
+    parts = []
+    for q in (0.5, 0.95, 0.99):
+        value = escape_markdown(f"{histogram.percentile(q, **labels):.2f}s", version=2)
+        parts.append(f"p{int(q * 100)} *{value}*")
+    return ", ".join(parts) + f" \\({count}\\)"
 
 async def reset_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Reset stats when the command /resetstats is issued."""
-    context.bot_data['stats'] = {'messages_handled': 0, 'media_downloaded': 0}
+    metrics.reset()
     await update.message.reply_text("Bot stats have been reset")
 
-async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle the user message."""
-    if not update.message or not update.message.text:
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Profile the event loop for N seconds when the command /profile [seconds] is issued."""
+    try:
+        seconds = int(context.args[0]) if context.args else 10
+    except ValueError:
+        await update.message.reply_text("Usage: /profile [seconds]")
+        return
+    seconds = max(1, min(seconds, config.PROFILE_MAX_SECONDS))
+    try:
+        # Stop early on shutdown, Application.stop() waits for the task
+        profile = profiler.run(seconds, should_stop=lambda: not context.application.running)
+    except RuntimeError as e:
+        await update.message.reply_text(str(e))
         return
+    # In the background: without concurrent updates this handler would block every chat
+    context.application.create_task(_send_profile(context, profile), update=update)
+    await update.message.reply_text(f"Profiling the event loop for {seconds} seconds...")
+
+async def _send_profile(context: ContextTypes.DEFAULT_TYPE, profile: Coroutine[Any, Any, str]):
+    report = await profile
+    document = BytesIO(report.encode())
+    document.name = "profile_report.txt"
+    await context.bot.send_document(
+        chat_id=config.DEVELOPER_ID,
+        document=document,
+        caption="#profile"
+    )
 
-    # Check privacy
+async def deny_private_access(update: Update) -> bool:
+    """Tell users other than the developer they can't use a private bot; True if denied."""
     if config.IS_BOT_PRIVATE and update.effective_user.id != config.DEVELOPER_ID:
         logger.info(f"Access denied to user {update.effective_user.id}")
         await update.message.reply_text(f"Access denied. Your id ({update.effective_user.id}) is not whitelisted.")
+        return True
+    return False
+
+async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle the user message."""
+    if not update.message or not update.message.text:
         return
 
-    text = update.message.text
-    tweet_ids = downloader.extract_tweet_ids(text)
-    tag = downloader.extract_tweet_tag(text)
+    if await deny_private_access(update):
+        return
+
+    with tracer.trace("message", chat_id=update.effective_chat.id, message_id=update.message.message_id):
+        await _handle_links(update, context)
+
+async def _handle_links(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    with span("extract") as attrs:
+        # Only the links, including targets of text_link entities the text doesn't show
+        text = tweet_link_text(update.message)
+        tweet_ids = downloader.extract_tweet_ids(text)
+        tag = downloader.extract_tweet_tag(text)
+        attrs["tweets"] = len(tweet_ids)
 
-    # Update stats
-    if 'stats' not in context.bot_data:
-        context.bot_data['stats'] = {'messages_handled': 0, 'media_downloaded': 0}
-    context.bot_data['stats']['messages_handled'] += 1
+    messages_handled.inc()
 
     if not tweet_ids:
         # Only reply if it looks like they tried to send a link but failed or if it's a private chat
-        if "twitter.com" in text.lower() or "x.com" in text.lower():
+        if any(is_tweet_host(word) for word in text.split()):
             await update.message.reply_text("No supported tweet link found.")
         return
 
+    if work_queue:
+        await enqueue_tweets(update, tweet_ids, tag)
+        return
+
+    # Resolve all tweets concurrently, but send the replies in link order
+    semaphore = asyncio.Semaphore(config.MAX_CONCURRENT_TWEETS)
+
+    async def prepare(tweet_id: str) -> List[Dict[str, Any]]:
+        async with semaphore:
+            media_list = await downloader.get_tweet_media(tweet_id)
+            # Learn video sizes now so the send path is known when it's this tweet's turn
+            await probe_uncached(media_list, tweet_id)
+            return media_list
+
+    prepared = [asyncio.ensure_future(prepare(tweet_id)) for tweet_id in tweet_ids]
+    try:
+        for tweet_id, task in zip(tweet_ids, prepared):
+            await _reply_tweet(update, context, tweet_id, task, tag)
+    finally:
+        for task in prepared:
+            task.cancel()
+
+async def probe_uncached(media_list: List[Dict[str, Any]], tweet_id: Optional[str]):
+    """
+    Probe the videos of a tweet ahead of sending, except those reply_media will
+    send by cached file_id without looking at their size.
+    """
+    uncached = [
+        m for m in media_list
+        if m.get("type") == "video" and not (tweet_id and file_id_cache.get(tweet_id, m["url"]))
+    ]
+    if uncached:
+        with span("probe", tweet_id=tweet_id):
+            await prober.probe_media(uncached)
+
+async def enqueue_tweets(update: Update, tweet_ids: List[str], tag: Optional[str]):
+    """Queue one job per tweet; a worker replies to the message when it's done."""
+    message = update.to_dict()
     for tweet_id in tweet_ids:
+        await work_queue.put({"tweet_id": tweet_id, "tag": tag, "update": message})
+    queue_jobs.inc(len(tweet_ids), result="enqueued")
+
+async def _reply_tweet(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    tweet_id: str,
+    prepared: "asyncio.Future[List[Dict[str, Any]]]",
+    tag: Optional[str],
+):
+    """Wait for a tweet's prepared media and send it, reporting errors per tweet."""
+    try:
+        media_list = await prepared
+        if not media_list:
+            await update.message.reply_text(f"Tweet {tweet_id} has no media.")
+            return
+
+        await reply_media(update, context, media_list, tag, tweet_id=tweet_id)
+
+    except TwitterAPIError as e:
+        trace_failed()
+        await update.message.reply_text(f"Error scraping tweet {tweet_id}: {str(e)}")
+    except Exception as e:
+        trace_failed()
+        logger.error(f"Error handling tweet {tweet_id}: {traceback.format_exc()}")
         try:
-            media_list = await downloader.get_tweet_media(tweet_id)
-            if not media_list:
-                await update.message.reply_text(f"Tweet {tweet_id} has no media.")
-                continue
-
-            await reply_media(update, context, media_list, tag)
-            
-        except TwitterAPIError as e:
-            await update.message.reply_text(f"Error scraping tweet {tweet_id}: {str(e)}")
-        except Exception as e:
-            logger.error(f"Error handling tweet {tweet_id}: {traceback.format_exc()}")
-            try:
-                await update.message.reply_text(f"An unexpected error occurred for tweet {tweet_id}.")
-            except Exception:
-                pass
+            await update.message.reply_text(f"An unexpected error occurred for tweet {tweet_id}.")
+        except Exception:
+            pass
 
-async def reply_media(update: Update, context: ContextTypes.DEFAULT_TYPE, media_list: List[Dict[str, Any]], tag: str):
+def _sent_file_id(message) -> Optional[str]:
+    """Return the file_id of the media carried by a sent message, if any."""
+    if message is None:
+        return None
+    for attr in ("video", "animation", "document"):
+        media = getattr(message, attr, None)
+        if media is not None:
+            return media.file_id
+    if message.photo:
+        # Largest size comes last
+        return message.photo[-1].file_id
+    return None
+
+def _remember_file_id(tweet_id: Optional[str], media_url: str, media_type: str, message):
+    if not tweet_id:
+        return
+    file_id = _sent_file_id(message)
+    if file_id:
+        file_id_cache.set(tweet_id, media_url, media_type, file_id)
+
+async def _reply_photos(update: Update, media: List[Any], caption: str) -> List[Any]:
+    """Send one photo, or a media group of 2-10 photos; returns the sent messages."""
+    if len(media) == 1:
+        return [await update.message.reply_photo(photo=media[0], caption=caption)]
+    return list(await update.message.reply_media_group(media=[
+        InputMediaPhoto(media=item, caption=caption if i == 0 else "")
+        for i, item in enumerate(media)
+    ]))
+
+async def _send_photos(update: Update, photos: List[Dict[str, Any]], caption: str, tweet_id: Optional[str]):
+    """Send up to 10 photos by cached file_id, by URL, or downloaded and uploaded by us."""
+    cached_photo_ids = [file_id_cache.get(tweet_id, p['url']) for p in photos] if tweet_id else []
+    if cached_photo_ids and all(cached_photo_ids):
+        try:
+            await _reply_photos(update, cached_photo_ids, caption)
+            media_sent.inc(len(photos), type="image")
+            photo_sends.inc(path="file_id")
+            return
+        except BadRequest as e:
+            logger.warning(f"Cached photo file_ids rejected, sending by URL: {e}")
+            for photo in photos:
+                file_id_cache.delete(tweet_id, photo['url'])
+
+    # Try to get original size
+    photo_urls = [original_photo_url(p['url']) for p in photos]
+    try:
+        with stage_latency.time(stage="send_url"), span("send_url", type="image", count=len(photos)):
+            messages = await _reply_photos(update, photo_urls, caption)
+        path = "url"
+    except BadRequest as e:
+        logger.warning(f"Failed to send photos by URL: {e}. Falling back to upload.")
+        messages = await _upload_photos(update, photo_urls, caption)
+        if messages is None:
+            return
+        path = "upload"
+    for photo, message in zip(photos, messages):
+        _remember_file_id(tweet_id, photo['url'], 'image', message)
+    media_sent.inc(len(photos), type="image")
+    photo_sends.inc(path=path)
+
+async def _upload_photos(update: Update, photo_urls: List[str], caption: str) -> Optional[List[Any]]:
+    """Download photos Telegram couldn't fetch into memory, all at once, and upload them as one group."""
+    try:
+        with stage_latency.time(stage="photo_download"), span("download", type="image", count=len(photo_urls)) as attrs:
+            buffers = await photo_downloader.download(photo_urls)
+            size = sum(buffer.getbuffer().nbytes for buffer in buffers)
+            attrs["bytes"] = size
+        bytes_transferred.inc(size, direction="download")
+        with stage_latency.time(stage="photo_upload"), span("upload", type="image", count=len(buffers)):
+            messages = await _reply_photos(update, buffers, caption)
+        bytes_transferred.inc(size, direction="upload")
+        return messages
+    except (PhotoDownloadError, BadRequest) as e:
+        logger.error(f"Failed to upload photos: {e}")
+        await update.message.reply_text("❌ Failed to send photos. Direct links:\n" + "\n".join(photo_urls))
+        return None
+
+async def reply_media(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    media_list: List[Dict[str, Any]],
+    tag: str,
+    tweet_id: Optional[str] = None,
+    delivered: Optional[Set[str]] = None,
+):
+    # URLs of media handled so far: skipped here and added to as items go out,
+    # so a retried job doesn't send what an earlier attempt already delivered
+    delivered = delivered if delivered is not None else set()
+    media_list = [m for m in media_list if m['url'] not in delivered]
     photos = [m for m in media_list if m['type'] == 'image']
     videos = [m for m in media_list if m['type'] == 'video']
     gifs = [m for m in media_list if m['type'] == 'gif']
     
     caption = tag if tag else ""
 
-    # Handle Photos
-    if photos:
-        media_group = []
-        for i, photo in enumerate(photos):
-            # Try to get original size
-            photo_url = photo['url']
-            if 'format=' not in photo_url:
-                if '?' in photo_url:
-                    photo_url += "&name=orig"
-                else:
-                    photo_url += "?name=orig"
-            
-            media_group.append(InputMediaPhoto(media=photo_url, caption=caption if i == 0 else ""))
-        
-        await update.message.reply_media_group(media=media_group)
-        context.bot_data['stats']['media_downloaded'] += len(photos)
+    # Handle Photos, in as many media groups as it takes
+    for i, group in enumerate(split_groups(photos)):
+        await _send_photos(update, group, caption if i == 0 else "", tweet_id)
+        delivered.update(p['url'] for p in group)
 
     # Handle GIFs
     for gif in gifs:
-        await update.message.reply_animation(animation=gif['url'], caption=caption)
-        context.bot_data['stats']['media_downloaded'] += 1
+        file_id = file_id_cache.get(tweet_id, gif['url']) if tweet_id else None
+        if file_id:
+            try:
+                await update.message.reply_animation(animation=file_id, caption=caption)
+                media_sent.inc(type="gif")
+                delivered.add(gif['url'])
+                continue
+            except BadRequest as e:
+                logger.warning(f"Cached GIF file_id rejected, sending by URL: {e}")
+                file_id_cache.delete(tweet_id, gif['url'])
+
+        with stage_latency.time(stage="send_url"), span("send_url", type="gif"):
+            message = await update.message.reply_animation(animation=gif['url'], caption=caption)
+        _remember_file_id(tweet_id, gif['url'], 'gif', message)
+        media_sent.inc(type="gif")
+        delivered.add(gif['url'])
 
     # Handle Videos
     def _safe_int(v):
@@ -142,10 +426,25 @@ async def reply_media(update: Update, context: ContextTypes.DEFAULT_TYPE, media_
         return _safe_int(m.group("w")), _safe_int(m.group("h"))
 
     for video in videos:
-        # Debug log to see what the API returns
-        logger.info(f"DEBUG: Processing video data: {video}")
+        logger.debug(f"Processing video data: {video}")
 
         video_url = video["url"]
+
+        file_id = file_id_cache.get(tweet_id, video_url) if tweet_id else None
+        if file_id:
+            try:
+                await update.message.reply_video(
+                    video=file_id,
+                    caption=caption,
+                    supports_streaming=True,
+                )
+                media_sent.inc(type="video")
+                video_sends.inc(path="file_id")
+                delivered.add(video_url)
+                continue
+            except BadRequest as e:
+                logger.warning(f"Cached video file_id rejected, sending by URL: {e}")
+                file_id_cache.delete(tweet_id, video_url)
         
         # vxtwitter uses 'size' dictionary for width/height
         size_data = video.get("size", {})
@@ -171,103 +470,216 @@ async def reply_media(update: Update, context: ContextTypes.DEFAULT_TYPE, media_
             if height is None:
                 height = uh
 
-        # Use Local Bot API to handle up to 2GB.
-        # We can just pass the URL, and if the Local Bot API Server is configured,
-        # it will handle the download/upload.
-        try:
-            await update.message.reply_video(
-                video=video_url,
-                caption=caption,
-                supports_streaming=True,
-                width=width,
-                height=height,
+        # Pick the variant and send path from the probed size instead of
+        # letting Telegram reject a URL it was never going to accept.
+        plan = await prober.plan_video(
+            video,
+            url_limit=config.URL_UPLOAD_LIMIT_MB * 1024 * 1024,
+            upload_limit=config.UPLOAD_LIMIT_MB * 1024 * 1024,
+        )
+        if plan.method == TOO_LARGE:
+            size_mb = plan.size // (1024 * 1024)
+            await update.message.reply_text(
+                f"Video is too large to send ({size_mb} MB). Direct link: {video_url}"
             )
-            context.bot_data["stats"]["media_downloaded"] += 1
+            delivered.add(video_url)
             continue
-        except Exception as e:
-            logger.warning(
-                f"Failed to send video by URL: {e}. Falling back to local download/upload.",
-                exc_info=True,
-            )
-
-        status_msg = None
-        try:
-            status_msg = await update.message.reply_text(
-                "Telegram API rejected the URL. Downloading locally to re-upload (this might take a while)..."
+        if plan.url != video_url:
+            logger.info(f"Sending lower bitrate variant {plan.url} ({plan.size} bytes) of {video_url}")
+            uw, uh = _extract_resolution_from_url(plan.url)
+            if uw and uh:
+                width, height = uw, uh
+
+        if plan.method == SEND_BY_URL:
+            # With a Local Bot API Server this may also succeed for larger files.
+            try:
+                with stage_latency.time(stage="send_url"), span("send_url", type="video", size=plan.size):
+                    message = await update.message.reply_video(
+                        video=plan.url,
+                        caption=caption,
+                        supports_streaming=True,
+                        width=width,
+                        height=height,
+                    )
+                _remember_file_id(tweet_id, video_url, "video", message)
+                media_sent.inc(type="video")
+                video_sends.inc(path="url")
+                delivered.add(video_url)
+                continue
+            except Exception as e:
+                logger.warning(
+                    f"Failed to send video by URL: {e}. Falling back to local download/upload.",
+                    exc_info=True,
+                )
+            status_text = DOWNLOADING_LOCALLY_TEXT
+        else:
+            status_text = UPLOADING_LARGE_TEXT
+
+        await _send_video_fallback(
+            update,
+            context,
+            video,
+            caption,
+            width,
+            height,
+            thumbnail_url,
+            tweet_id,
+            download_url=plan.url,
+            expected_bytes=plan.size,
+            status_text=status_text,
+        )
+        delivered.add(video_url)
+
+async def _download_thumbnail(thumbnail_url: str, path: str) -> bool:
+    try:
+        with span("thumbnail"):
+            r = await http_pool.client.get(thumbnail_url)
+            r.raise_for_status()
+            with open(path, "wb") as tf:
+                tf.write(r.content)
+        return True
+    except Exception:
+        logger.warning(
+            "Failed to download thumbnail for fallback upload; sending without thumb",
+            exc_info=True,
+        )
+        return False
+
+async def _make_faststart(path: str):
+    """Move moov to the front so recipients can start playing before the whole video arrives."""
+    try:
+        with stage_latency.time(stage="faststart"), span("faststart"):
+            moved = await asyncio.to_thread(faststart, path)
+        video_faststart.inc(result="moved" if moved else "already")
+    except FaststartError as e:
+        logger.info(f"Sending {path} as downloaded: {e}")
+        video_faststart.inc(result="unsupported")
+
+async def _send_video_fallback(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    video: Dict[str, Any],
+    caption: str,
+    width: Optional[int],
+    height: Optional[int],
+    thumbnail_url: Optional[str],
+    tweet_id: Optional[str],
+    download_url: Optional[str] = None,
+    expected_bytes: Optional[int] = None,
+    status_text: str = DOWNLOADING_LOCALLY_TEXT,
+):
+    """Download a video Telegram couldn't fetch by URL and upload it ourselves."""
+    video_url = video["url"]
+    download_url = download_url or video_url
+    status_msg = None
+    try:
+        status_msg = await update.message.reply_text(status_text)
+    except Exception:
+        # Non-fatal: we can still try the fallback
+        pass
+
+    queue_state = {"queued": False, "started": False}
+    # Keeps a position edit still in flight from landing after the "starting" edit
+    status_lock = asyncio.Lock()
+
+    async def on_position(position: int):
+        async with status_lock:
+            if queue_state["started"] or status_msg is None:
+                return
+            queue_state["queued"] = True
+            await status_msg.edit_text(
+                f"⏳ Waiting for a free download slot (position {position} in queue)..."
             )
-        except Exception:
-            # Non-fatal: we can still try the fallback
-            pass
 
-        os.makedirs("data", exist_ok=True)
-        base_id = video.get("id_str") or video.get("id") or update.update_id
-        temp_video_file = os.path.join("data", f"temp_video_{base_id}.mp4")
-        temp_thumb_file = os.path.join("data", f"temp_thumb_{base_id}.jpg") if thumbnail_url else None
-        
-        upload_success = False
-        try:
-            timeout = httpx.Timeout(1200.0)
-            async with httpx.AsyncClient(follow_redirects=True, timeout=timeout) as client:
-                # Download video
-                async with client.stream("GET", video_url) as response:
-                    response.raise_for_status()
-                    with open(temp_video_file, "wb") as f:
-                        async for chunk in response.aiter_bytes():
-                            f.write(chunk)
-
-                # Download thumbnail (Telegram doesn't accept thumb as URL for upload)
-                if thumbnail_url and temp_thumb_file:
+    temp_video_file = media_dir.new_path(".mp4")
+    temp_thumb_file = media_dir.new_path(".jpg") if thumbnail_url else None
+    
+    upload_success = False
+    keep_files = False
+    try:
+        async with transfer_scheduler.slot(
+            update.effective_user.id if update.effective_user else update.effective_chat.id,
+            expected_bytes=expected_bytes,
+            on_position=on_position,
+        ):
+            async with status_lock:
+                queue_state["started"] = True
+                if queue_state["queued"] and status_msg is not None:
                     try:
-                        r = await client.get(thumbnail_url)
-                        r.raise_for_status()
-                        with open(temp_thumb_file, "wb") as tf:
-                            tf.write(r.content)
+                        await status_msg.edit_text(status_text)
                     except Exception:
-                        logger.warning(
-                            "Failed to download thumbnail for fallback upload; sending without thumb",
-                            exc_info=True,
-                        )
-                        temp_thumb_file = None
+                        pass
+
+            # Download thumbnail alongside the video (Telegram doesn't accept thumb as URL for upload)
+            thumb_task = None
+            if thumbnail_url and temp_thumb_file:
+                thumb_task = asyncio.ensure_future(_download_thumbnail(thumbnail_url, temp_thumb_file))
+            try:
+                # Download video in parallel ranges, resuming missing ranges on errors
+                with stage_latency.time(stage="download"), span("download", size=expected_bytes) as attrs:
+                    downloaded = await SegmentedDownloader(
+                        http_pool.download_client,
+                        segments=config.DOWNLOAD_SEGMENTS,
+                        min_segment_size=config.DOWNLOAD_MIN_SEGMENT_MB * 1024 * 1024,
+                        retries=config.DOWNLOAD_RETRIES,
+                        timeout=httpx.Timeout(1200.0),
+                    ).download(download_url, temp_video_file)
+                    attrs["bytes"] = downloaded
+                bytes_transferred.inc(downloaded, direction="download")
+            except BaseException:
+                if thumb_task is not None:
+                    thumb_task.cancel()
+                raise
+            if thumb_task is not None and not await thumb_task:
+                temp_thumb_file = None
+            if config.FASTSTART_VIDEOS:
+                await _make_faststart(temp_video_file)
 
             # Send via local upload with preserved metadata
-            if temp_thumb_file and os.path.exists(temp_thumb_file):
-                with open(temp_video_file, "rb") as video_fp, open(temp_thumb_file, "rb") as thumb_fp:
-                    try:
-                        await update.message.reply_video(
-                            video=video_fp,
-                            caption=caption,
-                            supports_streaming=True,
-                            width=width,
-                            height=height,
-                            thumbnail=thumb_fp,
-                        )
-                        upload_success = True
-                    except BadRequest as e:
-                        # Telegram is picky about thumb (format/size/dimensions). If thumb fails,
-                        # retry without thumb rather than failing the whole send.
-                        logger.warning(f"Thumb rejected by Telegram, retrying without thumb: {e}")
-                        video_fp.seek(0)
-                        await update.message.reply_video(
-                            video=video_fp,
-                            caption=caption,
-                            supports_streaming=True,
-                            width=width,
-                            height=height,
-                        )
-                        upload_success = True
-            else:
-                with open(temp_video_file, "rb") as video_fp:
-                    await update.message.reply_video(
-                        video=video_fp,
+            with ExitStack() as stack:
+                has_thumb = bool(temp_thumb_file) and os.path.exists(temp_thumb_file)
+                if media_dir.shared:
+                    # The Local Bot API Server reads the files from the shared directory itself
+                    video_input = media_dir.server_uri(temp_video_file)
+                    thumb_input = media_dir.server_uri(temp_thumb_file) if has_thumb else None
+                else:
+                    video_input = stack.enter_context(open(temp_video_file, "rb"))
+                    thumb_input = stack.enter_context(open(temp_thumb_file, "rb")) if has_thumb else None
+                stack.enter_context(span("upload", shared=media_dir.shared))
+                upload_started = time.perf_counter()
+                try:
+                    message = await update.message.reply_video(
+                        video=video_input,
+                        caption=caption,
+                        supports_streaming=True,
+                        width=width,
+                        height=height,
+                        thumbnail=thumb_input,
+                    )
+                except BadRequest as e:
+                    if thumb_input is None:
+                        raise
+                    # Telegram is picky about thumb (format/size/dimensions). If thumb fails,
+                    # retry without thumb rather than failing the whole send.
+                    logger.warning(f"Thumb rejected by Telegram, retrying without thumb: {e}")
+                    if hasattr(video_input, "seek"):
+                        video_input.seek(0)
+                    message = await update.message.reply_video(
+                        video=video_input,
                         caption=caption,
                         supports_streaming=True,
                         width=width,
                         height=height,
                     )
-                    upload_success = True
+                upload_success = True
+                stage_latency.observe(time.perf_counter() - upload_started, stage="upload")
+                if not media_dir.shared:
+                    bytes_transferred.inc(os.path.getsize(temp_video_file), direction="upload")
 
             if upload_success:
-                context.bot_data["stats"]["media_downloaded"] += 1
+                _remember_file_id(tweet_id, video_url, "video", message)
+                media_sent.inc(type="video")
+                video_sends.inc(path="upload")
                 if status_msg is not None:
                     try:
                         await status_msg.delete()
@@ -278,37 +690,36 @@ async def reply_media(update: Update, context: ContextTypes.DEFAULT_TYPE, media_
                         except Exception:
                             pass
 
-        except Exception as e:
-            # Check if this is a timeout during what was likely a successful upload
-            is_timeout = "timeout" in str(e).lower()
-            
-            if upload_success or is_timeout:
-                if is_timeout:
-                    logger.warning(f"Upload timed out but might have succeeded: {e}")
-                    if status_msg is not None:
-                        try:
-                            await status_msg.edit_text("⏳ Upload timed out, but the video may still appear shortly...")
-                        except Exception:
-                            pass
-                else:
-                    logger.warning(f"Upload was successful but post-upload cleanup failed: {e}")
-            else:
-                logger.error("Failed to send video after local download/upload", exc_info=True)
+    except Exception as e:
+        # Check if this is a timeout during what was likely a successful upload
+        is_timeout = "timeout" in str(e).lower()
+        
+        if upload_success or is_timeout:
+            if is_timeout:
+                logger.warning(f"Upload timed out but might have succeeded: {e}")
+                # The Bot API Server may still be reading the file; the periodic sweep removes it later
+                keep_files = media_dir.shared and not upload_success
                 if status_msg is not None:
                     try:
-                        await status_msg.edit_text(f"❌ Failed to send video. Direct link: {video_url}")
+                        await status_msg.edit_text("⏳ Upload timed out, but the video may still appear shortly...")
                     except Exception:
                         pass
-        finally:
-            # Clean up temp files
-            for p in (temp_video_file, temp_thumb_file):
-                if not p:
-                    continue
+            else:
+                logger.warning(f"Upload was successful but post-upload cleanup failed: {e}")
+        else:
+            logger.error("Failed to send video after local download/upload", exc_info=True)
+            if status_msg is not None:
                 try:
-                    if os.path.exists(p):
-                        os.remove(p)
+                    await status_msg.edit_text(f"❌ Failed to send video. Direct link: {video_url}")
                 except Exception:
-                    logger.warning(f"Failed to remove temp file: {p}", exc_info=True)
+                    pass
+    finally:
+        # Clean up temp files
+        media_dir.remove(f"{temp_video_file}.parts")
+        if not keep_files:
+            media_dir.remove(temp_video_file)
+            media_dir.remove(temp_thumb_file)
+
 
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Log the error and send a telegram message to notify the developer."""
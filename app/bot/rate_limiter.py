@@ -0,0 +1,189 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from datetime import timedelta
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Union
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from app.core.metrics import outbound_retry_after, outbound_throttled
+
+logger = logging.getLogger(__name__)
+
+# Lower value = served first
+PRIORITY_TEXT = 0
+PRIORITY_MEDIA = 1
+
+# Cheap requests that should never queue behind big uploads
+TEXT_ENDPOINTS = {
+    "sendMessage",
+    "editMessageText",
+    "editMessageCaption",
+    "sendChatAction",
+}
+
+class TokenBucket:
+    """
+    Token bucket where waiters are served by priority, then arrival order.
+    Requests for more tokens than the capacity are capped to the capacity.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._waiters: List[list] = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def idle(self) -> bool:
+        self._refill()
+        return not self._waiters and self._tokens >= self.capacity
+
+    async def acquire(self, tokens: float = 1, priority: int = PRIORITY_MEDIA):
+        tokens = min(tokens, self.capacity)
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, [priority, next(self._seq), tokens, future])
+        self._wake()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just before cancellation: give the tokens back
+                self._tokens = min(self.capacity, self._tokens + tokens)
+            self._wake()
+            raise
+
+    def pause(self, seconds: float):
+        """Grant nothing for the next seconds, e.g. after a flood-control error."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        # Resume with a single request's worth instead of the whole burst
+        self._tokens = min(self._tokens, 1.0)
+        self._wake()
+
+    def _refill(self):
+        now = time.monotonic()
+        start = max(self._updated, self._paused_until)
+        if now > start:
+            self._tokens = min(self.capacity, self._tokens + (now - start) * self.rate)
+        self._updated = max(now, self._updated)
+
+    def _wake(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._refill()
+        now = time.monotonic()
+        while self._waiters:
+            _, _, tokens, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if now < self._paused_until or self._tokens < tokens:
+                break
+            heapq.heappop(self._waiters)
+            self._tokens -= tokens
+            future.set_result(None)
+        if self._waiters:
+            tokens = self._waiters[0][2]
+            delay = max(self._paused_until - now, 0.0) + max(tokens - self._tokens, 0.0) / self.rate
+            self._timer = asyncio.get_running_loop().call_later(delay, self._wake)
+
+class TelegramRateLimiter(BaseRateLimiter[int]):
+    """
+    Throttles outgoing Bot API requests with a global token bucket plus one
+    bucket per chat, sized after Telegram's documented limits (~30 messages/s
+    overall, ~1 message/s per private chat, 20 messages/min per group).
+
+    Text replies and edits are served ahead of media uploads. A media group
+    counts as one message per item. RetryAfter errors pause the affected
+    buckets for the requested time and the request is retried automatically.
+    Pass an int priority as rate_limit_args to override the default priority.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30.0,
+        private_chat_rate: float = 1.0,
+        private_chat_burst: float = 3.0,
+        group_rate_per_minute: float = 20.0,
+        max_retries: int = 3,
+    ):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.private_chat_rate = private_chat_rate
+        self.private_chat_burst = private_chat_burst
+        self.group_rate_per_minute = group_rate_per_minute
+        self.max_retries = max_retries
+        self._chat_buckets: Dict[Union[int, str], TokenBucket] = {}
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _chat_bucket(self, chat_id: Union[int, str]) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) > 10000:
+                # Forget chats whose buckets are back to full
+                for key in [k for k, b in self._chat_buckets.items() if b.idle]:
+                    del self._chat_buckets[key]
+            if isinstance(chat_id, int) and chat_id > 0:
+                bucket = TokenBucket(self.private_chat_rate, self.private_chat_burst)
+            else:
+                # Groups, supergroups and channels (negative ids or @usernames)
+                bucket = TokenBucket(self.group_rate_per_minute / 60.0, self.group_rate_per_minute)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], List[Dict[str, Any]]]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[int],
+    ) -> Union[bool, Dict[str, Any], List[Dict[str, Any]]]:
+        chat_id = data.get("chat_id")
+        throttled = endpoint.startswith(("send", "edit", "copy", "forward"))
+        if rate_limit_args is not None:
+            priority = rate_limit_args
+        else:
+            priority = PRIORITY_TEXT if endpoint in TEXT_ENDPOINTS else PRIORITY_MEDIA
+        weight = (len(data.get("media") or []) or 1) if endpoint == "sendMediaGroup" else 1
+
+        attempt = 0
+        while True:
+            if throttled:
+                started = time.monotonic()
+                if chat_id is not None:
+                    await self._chat_bucket(chat_id).acquire(weight, priority)
+                await self.global_bucket.acquire(weight, priority)
+                if time.monotonic() - started > 0.01:
+                    outbound_throttled.inc()
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                outbound_retry_after.inc()
+                if attempt >= self.max_retries:
+                    raise
+                retry_after = e.retry_after
+                if isinstance(retry_after, timedelta):
+                    retry_after = retry_after.total_seconds()
+                logger.warning(f"Flood control on {endpoint} for chat {chat_id}, retrying in {retry_after}s")
+                if not throttled:
+                    await asyncio.sleep(retry_after)
+                elif chat_id is not None:
+                    # The next acquire waits out the pause
+                    self._chat_bucket(chat_id).pause(retry_after)
+                else:
+                    self.global_bucket.pause(retry_after)
+                attempt += 1
@@ -0,0 +1,78 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from app.core.metrics import update_wait, updates_active, updates_queued
+
+logger = logging.getLogger(__name__)
+
+class ChatSerializingUpdateProcessor(BaseUpdateProcessor):
+    """
+    Processes updates from different chats concurrently (up to max_active at once)
+    while keeping updates from the same chat strictly in arrival order.
+
+    The per-chat lock is taken before a global slot, so a chat flooding the bot
+    only queues behind itself instead of holding slots other chats could use.
+    """
+
+    def __init__(self, max_active: int, max_pending: int = 1024):
+        super().__init__(max_pending)
+        self.max_active = max_active
+        self._active = asyncio.BoundedSemaphore(max_active)
+        # chat id -> [lock, number of updates holding or waiting for it]
+        self._chats: Dict[int, list] = {}
+        self.stats = {'queued': 0, 'active': 0}
+        updates_queued.function = lambda: self.stats['queued']
+        updates_active.function = lambda: self.stats['active']
+
+    @staticmethod
+    def _chat_id(update: object) -> Optional[int]:
+        if isinstance(update, Update) and update.effective_chat is not None:
+            return update.effective_chat.id
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        chat_id = self._chat_id(update)
+        entry = None
+        if chat_id is not None:
+            entry = self._chats.setdefault(chat_id, [asyncio.Lock(), 0])
+            entry[1] += 1
+
+        queued_at = time.monotonic()
+        self.stats['queued'] += 1
+        started = False
+        try:
+            if entry is not None:
+                await entry[0].acquire()
+            try:
+                async with self._active:
+                    update_wait.observe(time.monotonic() - queued_at)
+                    self.stats['queued'] -= 1
+                    self.stats['active'] += 1
+                    started = True
+                    try:
+                        await coroutine
+                    finally:
+                        self.stats['active'] -= 1
+            finally:
+                if entry is not None:
+                    entry[0].release()
+        finally:
+            if not started:
+                self.stats['queued'] -= 1
+                # Cancelled while queued: avoid a "coroutine was never awaited" warning
+                coroutine.close()
+            if entry is not None:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._chats[chat_id]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
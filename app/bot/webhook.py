@@ -0,0 +1,129 @@
+import asyncio
+import hmac
+import json
+import logging
+import signal
+import ssl
+from typing import Optional
+
+from telegram import Update
+from telegram.ext import Application
+
+from app.core.http_server import HttpServer, Request, Response
+from app.core.metrics import webhook_updates
+
+logger = logging.getLogger(__name__)
+
+def make_ssl_context(cert_path: Optional[str], key_path: Optional[str]) -> Optional[ssl.SSLContext]:
+    if not cert_path:
+        return None
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(cert_path, key_path)
+    return context
+
+class WebhookServer:
+    """
+    Receives updates pushed by the Bot API and puts them straight on the
+    application's update queue, answering 200 before they are processed.
+    Requests without the expected X-Telegram-Bot-Api-Secret-Token are refused.
+    """
+
+    SECRET_HEADER = "x-telegram-bot-api-secret-token"
+
+    def __init__(
+        self,
+        application: Application,
+        host: str,
+        port: int,
+        path: str,
+        secret_token: Optional[str] = None,
+        ssl_context: Optional[ssl.SSLContext] = None,
+        health_path: Optional[str] = "/healthz",
+    ):
+        self.application = application
+        self.path = "/" + path.lstrip("/")
+        self.secret_token = secret_token
+        self.server = HttpServer(host, port, ssl_context=ssl_context)
+        self.server.route("POST", self.path, self.handle_update)
+        if health_path:
+            self.server.route("GET", health_path, self.health)
+
+    async def start(self):
+        await self.server.start()
+
+    async def stop(self):
+        await self.server.stop()
+
+    async def handle_update(self, request: Request) -> Response:
+        if self.secret_token:
+            received = request.headers.get(self.SECRET_HEADER, "")
+            if not hmac.compare_digest(received.encode(), self.secret_token.encode()):
+                webhook_updates.inc(result="forbidden")
+                return Response(403, b"Forbidden")
+        try:
+            update = Update.de_json(json.loads(request.body), self.application.bot)
+        except Exception as e:
+            logger.warning(f"Received an invalid update on the webhook: {e}")
+            webhook_updates.inc(result="invalid")
+            return Response(400, b"Invalid update")
+        self.application.update_queue.put_nowait(update)
+        webhook_updates.inc(result="accepted")
+        return Response(200, b"OK")
+
+    async def health(self, request: Request) -> Response:
+        if self.application.running:
+            return Response(200, b"OK")
+        return Response(503, b"Not running")
+
+async def run_webhook(
+    application: Application,
+    server: WebhookServer,
+    webhook_url: str,
+    certificate: Optional[str] = None,
+    drop_pending_updates: bool = False,
+    stop_event: Optional[asyncio.Event] = None,
+):
+    """
+    Counterpart of Application.run_polling() for our own webhook server: runs
+    the same initialize/post_init/start ... stop/post_stop/shutdown/post_shutdown
+    sequence and blocks until SIGINT, SIGTERM or stop_event is set.
+    """
+    stop_event = stop_event or asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            pass
+
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        cert = None
+        if certificate:
+            # Self-signed certificates have to be uploaded to Telegram
+            with open(certificate, "rb") as f:
+                cert = f.read()
+        await application.start()
+        await server.start()
+        try:
+            await application.bot.set_webhook(
+                webhook_url,
+                certificate=cert,
+                secret_token=server.secret_token,
+                allowed_updates=Update.ALL_TYPES,
+                drop_pending_updates=drop_pending_updates,
+            )
+            logger.info(f"Webhook set to {webhook_url}")
+            await stop_event.wait()
+        finally:
+            await server.stop()
+            if application.running:
+                await application.stop()
+                if application.post_stop:
+                    await application.post_stop(application)
+    finally:
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
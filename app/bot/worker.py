@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import signal
+from typing import Optional, Set
+
+import httpx
+from telegram import Update
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+from telegram.ext import Application
+
+from app.bot.handlers import downloader, probe_uncached, reply_media
+from app.core.metrics import queue_jobs
+from app.core.tracing import trace_failed, tracer
+from app.core.work_queue import Job, WorkQueue
+from app.downloader.twitter import TweetNotFoundError, TwitterAPIError
+
+logger = logging.getLogger(__name__)
+
+class RetryJob(Exception):
+    """The job failed in a way another attempt may fix."""
+
+class QueueWorker:
+    """
+    Takes tweet jobs queued by the front end and runs the same pipeline as
+    handle_message (lookup, probe, reply_media), replying to the original
+    message. Up to `concurrency` jobs run at once. Leases are renewed while a
+    job runs, so slow uploads aren't handed to a second worker; transient
+    failures are retried with exponential backoff and the user is only told
+    about a failure once the last attempt has failed. Media delivered before a
+    failure are recorded in the job's payload and not sent again on retry.
+    """
+
+    def __init__(
+        self,
+        application: Application,
+        queue: WorkQueue,
+        concurrency: int = 8,
+        poll_interval: float = 0.5,
+        retry_delay: float = 5,
+    ):
+        self.application = application
+        self.queue = queue
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def run(self, stop_event: asyncio.Event):
+        """Take jobs until stop_event is set, then let the running ones finish."""
+        slots = asyncio.Semaphore(self.concurrency)
+        while not stop_event.is_set():
+            await slots.acquire()
+            if stop_event.is_set():
+                slots.release()
+                break
+            try:
+                job = await self.queue.get()
+            except Exception:
+                logger.error("Couldn't take a job from the work queue", exc_info=True)
+                job = None
+            if job is None:
+                slots.release()
+                try:
+                    await asyncio.wait_for(stop_event.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            task = asyncio.create_task(self._handle(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            task.add_done_callback(lambda _: slots.release())
+        if self._tasks:
+            logger.info(f"Waiting for {len(self._tasks)} running jobs")
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _handle(self, job: Job):
+        keeper = asyncio.create_task(self._keep_leased(job))
+        delivered: Set[str] = set(job.payload.get("delivered") or [])
+        before = len(delivered)
+        try:
+            await self._process(job, delivered)
+        except RetryJob as e:
+            final = job.attempts >= self.queue.max_attempts
+            logger.warning(f"Job {job.id} attempt {job.attempts} failed: {e}" + (", giving up" if final else ""))
+            if final:
+                await self._notify(job, f"An unexpected error occurred for tweet {job.payload['tweet_id']}.")
+            payload = dict(job.payload, delivered=sorted(delivered)) if len(delivered) > before else None
+            await self.queue.fail(job, delay=self.retry_delay * 2 ** (job.attempts - 1), payload=payload)
+            queue_jobs.inc(result="dead" if final else "retried")
+            return
+        except Exception:
+            # Bugs don't get better with retries
+            logger.error(f"Job {job.id} failed", exc_info=True)
+            await self._notify(job, f"An unexpected error occurred for tweet {job.payload['tweet_id']}.")
+            queue_jobs.inc(result="failed")
+        else:
+            queue_jobs.inc(result="done")
+        finally:
+            keeper.cancel()
+        await self.queue.ack(job)
+
+    async def _process(self, job: Job, delivered: Set[str]):
+        update = Update.de_json(job.payload["update"], self.application.bot)
+        context = self.application.context_types.context.from_update(update, self.application)
+        tweet_id = job.payload["tweet_id"]
+        with tracer.trace("job", job_id=job.id, tweet_id=tweet_id, attempt=job.attempts):
+            try:
+                media_list = await downloader.get_tweet_media(tweet_id)
+                if not media_list:
+                    await update.message.reply_text(f"Tweet {tweet_id} has no media.")
+                    return
+                await probe_uncached(media_list, tweet_id)
+                await reply_media(
+                    update, context, media_list, job.payload.get("tag"), tweet_id=tweet_id, delivered=delivered
+                )
+            except TweetNotFoundError as e:
+                trace_failed()
+                await update.message.reply_text(f"Error scraping tweet {tweet_id}: {str(e)}")
+            except Forbidden:
+                trace_failed()
+                # The user blocked the bot or it was removed from the chat
+                logger.info(f"Dropping job {job.id}, chat {update.effective_chat.id} is gone")
+            except BadRequest:
+                # A NetworkError subclass, but resending the same request won't help
+                raise
+            except (TwitterAPIError, NetworkError, RetryAfter, httpx.HTTPError, OSError) as e:
+                # Tweet backends down, network trouble, Bot API timeouts or flood control
+                raise RetryJob(str(e)) from e
+
+    async def _keep_leased(self, job: Job):
+        while True:
+            await asyncio.sleep(self.queue.visibility_timeout / 3)
+            try:
+                if not await self.queue.extend(job):
+                    logger.warning(f"Lost the lease of job {job.id}, another worker may repeat it")
+                    return
+            except Exception:
+                logger.warning(f"Couldn't renew the lease of job {job.id}", exc_info=True)
+
+    async def _notify(self, job: Job, text: str):
+        try:
+            update = Update.de_json(job.payload["update"], self.application.bot)
+            await update.message.reply_text(text)
+        except Exception as e:
+            logger.warning(f"Couldn't tell the user job {job.id} failed: {e}")
+
+async def run_worker(application: Application, worker: QueueWorker, stop_event: Optional[asyncio.Event] = None):
+    """
+    Worker counterpart of run_webhook(): initializes the application (for its
+    bot and rate limiter, no updates are fetched), runs post_init, works the
+    queue until SIGINT, SIGTERM or stop_event, then shuts everything down.
+    """
+    stop_event = stop_event or asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            pass
+
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        logger.info(f"Worker started, running up to {worker.concurrency} jobs at a time")
+        await worker.run(stop_event)
+    finally:
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
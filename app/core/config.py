@@ -9,7 +9,133 @@ class Config:
     IS_BOT_PRIVATE = os.getenv("IS_BOT_PRIVATE", "True").lower() == "true"
     # Local Bot API Server base URL, e.g., http://localhost:8081/bot
     BOT_API_BASE_URL = os.getenv("BOT_API_BASE_URL")
+    # Directory shared with the Local Bot API Server (as seen by this bot, and as
+    # seen by the server if mounted elsewhere). Fallback videos are sent by path.
+    LOCAL_BOT_API_SHARED_DIR = os.getenv("LOCAL_BOT_API_SHARED_DIR")
+    LOCAL_BOT_API_SERVER_DIR = os.getenv("LOCAL_BOT_API_SERVER_DIR")
+    # Files in it older than this (seconds) are treated as orphans
+    SHARED_DIR_ORPHAN_AGE = int(os.getenv("SHARED_DIR_ORPHAN_AGE", "21600"))
     # Persistence file path
     PERSISTENCE_PATH = os.getenv("PERSISTENCE_PATH", "data/persistence")
+    # "pickle" rewrites PERSISTENCE_PATH on every flush; "sqlite" writes only
+    # changed keys to SQLITE_PERSISTENCE_PATH (the pickle file is imported once)
+    PERSISTENCE_BACKEND = os.getenv("PERSISTENCE_BACKEND", "pickle").lower()
+    SQLITE_PERSISTENCE_PATH = os.getenv("SQLITE_PERSISTENCE_PATH", "data/persistence.sqlite3")
+    # How updates are received: "polling" (getUpdates) or "webhook". In webhook
+    # mode the bot listens on WEBHOOK_LISTEN:WEBHOOK_PORT and registers
+    # WEBHOOK_URL (the public URL Telegram posts to, ending in WEBHOOK_PATH)
+    UPDATE_MODE = os.getenv("UPDATE_MODE", "polling").lower()
+    WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+    WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+    WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+    WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+    WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN")
+    # Serve HTTPS directly (otherwise terminate TLS in a reverse proxy)
+    WEBHOOK_TLS_CERT = os.getenv("WEBHOOK_TLS_CERT")
+    WEBHOOK_TLS_KEY = os.getenv("WEBHOOK_TLS_KEY")
+    # Health-check route on the webhook server (empty disables it)
+    WEBHOOK_HEALTH_PATH = os.getenv("WEBHOOK_HEALTH_PATH", "/healthz")
+    # Metrics: JSON snapshot flushed every METRICS_FLUSH_INTERVAL seconds, and a
+    # Prometheus endpoint on METRICS_HOST:METRICS_PORT (port 0 disables it)
+    METRICS_PATH = os.getenv("METRICS_PATH", "data/stats.json")
+    METRICS_FLUSH_INTERVAL = int(os.getenv("METRICS_FLUSH_INTERVAL", "60"))
+    METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+    METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+    # Per-request traces as JSON lines (empty TRACE_PATH disables them): a
+    # TRACE_SAMPLE_RATE share of requests plus every failed one and every one
+    # slower than TRACE_SLOW_SECONDS (0 = off); rotated to <path>.1 at TRACE_MAX_MB
+    TRACE_PATH = os.getenv("TRACE_PATH", "data/traces.jsonl")
+    TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+    TRACE_SLOW_SECONDS = float(os.getenv("TRACE_SLOW_SECONDS", "30"))
+    TRACE_MAX_MB = int(os.getenv("TRACE_MAX_MB", "100"))
+    # Longest run of the /profile developer command
+    PROFILE_MAX_SECONDS = int(os.getenv("PROFILE_MAX_SECONDS", "300"))
+    # Tweet metadata cache (entries, seconds); 404s are cached for a shorter time
+    TWEET_CACHE_SIZE = int(os.getenv("TWEET_CACHE_SIZE", "2048"))
+    TWEET_CACHE_TTL = float(os.getenv("TWEET_CACHE_TTL", "600"))
+    TWEET_NEGATIVE_CACHE_TTL = float(os.getenv("TWEET_NEGATIVE_CACHE_TTL", "60"))
+    # Tweet metadata backends, in order of preference, and their base URLs
+    TWEET_BACKENDS = [b.strip().lower() for b in os.getenv("TWEET_BACKENDS", "vxtwitter,fxtwitter").split(",") if b.strip()]
+    VXTWITTER_API_URL = os.getenv("VXTWITTER_API_URL", "https://api.vxtwitter.com")
+    FXTWITTER_API_URL = os.getenv("FXTWITTER_API_URL", "https://api.fxtwitter.com")
+    TWEET_BACKEND_TIMEOUT = float(os.getenv("TWEET_BACKEND_TIMEOUT", "10"))
+    # Ask the next backend too once the current one is slower than this
+    # percentile of its recent latencies (clamped to the min/max delay, seconds)
+    TWEET_HEDGE_PERCENTILE = float(os.getenv("TWEET_HEDGE_PERCENTILE", "0.9"))
+    TWEET_HEDGE_MIN_DELAY = float(os.getenv("TWEET_HEDGE_MIN_DELAY", "0.25"))
+    TWEET_HEDGE_MAX_DELAY = float(os.getenv("TWEET_HEDGE_MAX_DELAY", "2"))
+    # Skip a backend for TWEET_BREAKER_RESET seconds after this many failures in a row
+    TWEET_BREAKER_FAILURES = int(os.getenv("TWEET_BREAKER_FAILURES", "5"))
+    TWEET_BREAKER_RESET = float(os.getenv("TWEET_BREAKER_RESET", "30"))
+    # Telegram file_id cache used to re-send media without downloading it again
+    FILE_ID_CACHE_PATH = os.getenv("FILE_ID_CACHE_PATH", "data/file_ids.sqlite3")
+    FILE_ID_CACHE_MAX_ENTRIES = int(os.getenv("FILE_ID_CACHE_MAX_ENTRIES", "50000"))
+    # How many tweets from a single message are resolved at the same time
+    MAX_CONCURRENT_TWEETS = int(os.getenv("MAX_CONCURRENT_TWEETS", "4"))
+    # Bulk mode (/batch and uploaded .txt/.csv link lists)
+    BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+    BATCH_MAX_LINKS = int(os.getenv("BATCH_MAX_LINKS", "5000"))
+    # Uploaded lists larger than this are refused (the cloud Bot API serves files up to 20 MB)
+    BATCH_MAX_FILE_MB = int(os.getenv("BATCH_MAX_FILE_MB", "20"))
+    # Minimum seconds between edits of the progress message
+    BATCH_PROGRESS_INTERVAL = float(os.getenv("BATCH_PROGRESS_INTERVAL", "5"))
+    # Hand tweets to separate worker processes (python main.py worker) through
+    # a durable queue: "sqlite" (same host) or "redis"; empty = in-process
+    WORK_QUEUE_BACKEND = os.getenv("WORK_QUEUE_BACKEND", "").lower()
+    WORK_QUEUE_PATH = os.getenv("WORK_QUEUE_PATH", "data/work_queue.sqlite3")
+    WORK_QUEUE_REDIS_URL = os.getenv("WORK_QUEUE_REDIS_URL", "redis://localhost:6379/0")
+    # Seconds a taken job stays invisible to other workers unless renewed
+    WORK_QUEUE_VISIBILITY_TIMEOUT = float(os.getenv("WORK_QUEUE_VISIBILITY_TIMEOUT", "120"))
+    WORK_QUEUE_MAX_ATTEMPTS = int(os.getenv("WORK_QUEUE_MAX_ATTEMPTS", "5"))
+    # First retry delay in seconds, doubled on every further attempt
+    WORK_QUEUE_RETRY_DELAY = float(os.getenv("WORK_QUEUE_RETRY_DELAY", "5"))
+    WORK_QUEUE_POLL_INTERVAL = float(os.getenv("WORK_QUEUE_POLL_INTERVAL", "0.5"))
+    # Jobs each worker process runs at the same time
+    WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "8"))
+    # Prometheus endpoint of a worker process (0 disables it)
+    WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "0"))
+    # Process updates from different chats concurrently; each chat stays in order
+    CONCURRENT_UPDATES = os.getenv("CONCURRENT_UPDATES", "False").lower() == "true"
+    MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "16"))
+    MAX_PENDING_UPDATES = int(os.getenv("MAX_PENDING_UPDATES", "1024"))
+    # Local download/re-upload fallback: concurrency caps and disk budget
+    MAX_ACTIVE_TRANSFERS = int(os.getenv("MAX_ACTIVE_TRANSFERS", "4"))
+    MAX_TRANSFERS_PER_USER = int(os.getenv("MAX_TRANSFERS_PER_USER", "1"))
+    TRANSFER_MIN_FREE_MB = int(os.getenv("TRANSFER_MIN_FREE_MB", "1024"))
+    # Disk space reserved for a transfer whose size isn't known up front
+    TRANSFER_DEFAULT_SIZE_MB = int(os.getenv("TRANSFER_DEFAULT_SIZE_MB", "256"))
+    # Minimum seconds between queue position edits of one waiting transfer's status message
+    TRANSFER_POSITION_INTERVAL = float(os.getenv("TRANSFER_POSITION_INTERVAL", "3"))
+    # Parallel HTTP Range downloads for the fallback path
+    DOWNLOAD_SEGMENTS = int(os.getenv("DOWNLOAD_SEGMENTS", "4"))
+    DOWNLOAD_MIN_SEGMENT_MB = int(os.getenv("DOWNLOAD_MIN_SEGMENT_MB", "4"))
+    DOWNLOAD_RETRIES = int(os.getenv("DOWNLOAD_RETRIES", "3"))
+    # Photos Telegram can't fetch by URL are downloaded into memory and uploaded:
+    # at most PHOTO_FALLBACK_MAX_MB per album, PHOTO_FALLBACK_CONCURRENCY albums at a time
+    PHOTO_FALLBACK_MAX_MB = int(os.getenv("PHOTO_FALLBACK_MAX_MB", "50"))
+    PHOTO_FALLBACK_CONCURRENCY = int(os.getenv("PHOTO_FALLBACK_CONCURRENCY", "4"))
+    # Move the moov box of downloaded MP4s to the front before uploading, so
+    # clients can start playback without fetching the whole file
+    FASTSTART_VIDEOS = os.getenv("FASTSTART_VIDEOS", "True").lower() == "true"
+    # Size limits (MB) for Telegram fetching a URL itself and for uploads.
+    # A Local Bot API Server accepts uploads up to 2000 MB.
+    URL_UPLOAD_LIMIT_MB = int(os.getenv("URL_UPLOAD_LIMIT_MB", "20"))
+    UPLOAD_LIMIT_MB = int(os.getenv("UPLOAD_LIMIT_MB", "2000" if BOT_API_BASE_URL else "50"))
+    # Media size probes (HEAD / ranged GET), cached per URL
+    PROBE_CACHE_TTL = float(os.getenv("PROBE_CACHE_TTL", "3600"))
+    PROBE_TIMEOUT = float(os.getenv("PROBE_TIMEOUT", "10"))
+    # Outbound Bot API throttling (messages/s overall and per private chat,
+    # messages/min per group) and automatic retries on flood control
+    RATE_LIMITER = os.getenv("RATE_LIMITER", "True").lower() == "true"
+    RATE_LIMIT_GLOBAL = float(os.getenv("RATE_LIMIT_GLOBAL", "30"))
+    RATE_LIMIT_PRIVATE_CHAT = float(os.getenv("RATE_LIMIT_PRIVATE_CHAT", "1"))
+    RATE_LIMIT_GROUP_PER_MINUTE = float(os.getenv("RATE_LIMIT_GROUP_PER_MINUTE", "20"))
+    RATE_LIMIT_MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "3"))
+    # Shared outbound HTTP connection pool
+    HTTP2 = os.getenv("HTTP2", "True").lower() == "true"
+    HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))
+    HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+    HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
     
 config = Config()
@@ -0,0 +1,133 @@
+import logging
+import os
+import sqlite3
+import time
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class FileIdCache:
+    """
+    Persistent mapping of (tweet id, media URL) to the Telegram file_id of media
+    we already sent, so repeat requests can be answered without re-uploading.
+
+    Lookups run on the event loop, so a hit only notes the time in memory; the
+    last_used updates are written in one transaction every touch_interval
+    seconds (or touch_batch hits) and on close(). Once the table grows past
+    max_entries, the least recently used entries are evicted down to 90% of
+    it, so the eviction scan doesn't run on every insert.
+    """
+
+    def __init__(self, path: str, max_entries: int = 50000, touch_interval: float = 5.0, touch_batch: int = 500):
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        self.touch_batch = touch_batch
+        self._conn: Optional[sqlite3.Connection] = None
+        # (tweet_id, media_url) -> last use not yet written
+        self._touched: Dict[Tuple[str, str], float] = {}
+        self._last_touch_flush = time.monotonic()
+        self._rows = 0
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # WAL is still consistent after a crash; a lost last commit only costs a cache entry
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS file_ids ("
+                " tweet_id TEXT NOT NULL,"
+                " media_url TEXT NOT NULL,"
+                " media_type TEXT NOT NULL,"
+                " file_id TEXT NOT NULL,"
+                " last_used REAL NOT NULL,"
+                " PRIMARY KEY (tweet_id, media_url))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_file_ids_last_used ON file_ids (last_used)")
+            self._conn.commit()
+            self._rows = self._conn.execute("SELECT COUNT(*) FROM file_ids").fetchone()[0]
+        return self._conn
+
+    def get(self, tweet_id: str, media_url: str) -> Optional[str]:
+        try:
+            row = self.conn.execute(
+                "SELECT file_id FROM file_ids WHERE tweet_id = ? AND media_url = ?",
+                (tweet_id, media_url),
+            ).fetchone()
+            if row is None:
+                return None
+            self._touched[(tweet_id, media_url)] = time.time()
+            if (
+                len(self._touched) >= self.touch_batch
+                or time.monotonic() - self._last_touch_flush >= self.touch_interval
+            ):
+                self.flush_touches()
+            return row[0]
+        except sqlite3.Error:
+            logger.warning("File id cache lookup failed", exc_info=True)
+            return None
+
+    def set(self, tweet_id: str, media_url: str, media_type: str, file_id: str):
+        try:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO file_ids (tweet_id, media_url, media_type, file_id, last_used)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (tweet_id, media_url, media_type, file_id, time.time()),
+            )
+            self.conn.commit()
+            self._touched.pop((tweet_id, media_url), None)
+            # Replacing an entry counts too; the eviction recounts anyway
+            self._rows += 1
+            if self._rows > self.max_entries:
+                self._evict()
+        except sqlite3.Error:
+            logger.warning("File id cache store failed", exc_info=True)
+
+    def _evict(self):
+        # Recent hits decide what stays
+        self.flush_touches()
+        keep = self.max_entries * 9 // 10
+        self.conn.execute(
+            "DELETE FROM file_ids WHERE rowid IN ("
+            " SELECT rowid FROM file_ids ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (keep,),
+        )
+        self.conn.commit()
+        self._rows = self.conn.execute("SELECT COUNT(*) FROM file_ids").fetchone()[0]
+
+    def flush_touches(self):
+        """Write the last_used times of the hits since the previous flush."""
+        self._last_touch_flush = time.monotonic()
+        if not self._touched:
+            return
+        touched, self._touched = self._touched, {}
+        try:
+            self.conn.executemany(
+                "UPDATE file_ids SET last_used = ? WHERE tweet_id = ? AND media_url = ?",
+                [(used, tweet_id, media_url) for (tweet_id, media_url), used in touched.items()],
+            )
+            self.conn.commit()
+        except sqlite3.Error:
+            logger.warning("File id cache touch update failed", exc_info=True)
+
+    def delete(self, tweet_id: str, media_url: str):
+        try:
+            self.conn.execute(
+                "DELETE FROM file_ids WHERE tweet_id = ? AND media_url = ?",
+                (tweet_id, media_url),
+            )
+            self.conn.commit()
+            self._rows = max(0, self._rows - 1)
+        except sqlite3.Error:
+            logger.warning("File id cache delete failed", exc_info=True)
+
+    def close(self):
+        if self._conn is not None:
+            self.flush_touches()
+            self._conn.close()
+            self._conn = None
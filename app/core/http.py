@@ -0,0 +1,73 @@
+import importlib.util
+import logging
+from typing import Optional
+
+import httpx
+
+from app.core.config import config
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+)
+
+def http2_available() -> bool:
+    """HTTP/2 needs the optional h2 package (httpx[http2])."""
+    return importlib.util.find_spec("h2") is not None
+
+class HttpClientPool:
+    """
+    Owner of the httpx.AsyncClients used for all outbound media traffic, so
+    connections to the same hosts are pooled and kept alive across requests.
+    `client` (HTTP/2 when enabled) serves tweet API lookups, probes, photos and
+    thumbnails. `download_client` always speaks HTTP/1.1: HTTP/2 would
+    multiplex the parallel Range requests of a segmented video download over
+    a single TCP connection, which is what segmenting is meant to avoid.
+    """
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self._download_client: Optional[httpx.AsyncClient] = None
+
+    def _build(self, http2: bool) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            http2=http2,
+            timeout=httpx.Timeout(config.HTTP_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=config.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=config.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY,
+            ),
+            follow_redirects=True,
+            headers={"User-Agent": USER_AGENT},
+        )
+
+    async def open(self) -> httpx.AsyncClient:
+        return self.client
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Created lazily as well, so code paths running before open() still work
+        if self._client is None or self._client.is_closed:
+            http2 = config.HTTP2 and http2_available()
+            if config.HTTP2 and not http2:
+                logger.info("h2 is not installed, outbound HTTP stays on HTTP/1.1")
+            self._client = self._build(http2)
+        return self._client
+
+    @property
+    def download_client(self) -> httpx.AsyncClient:
+        """HTTP/1.1 client for segmented downloads: one connection per segment."""
+        if self._download_client is None or self._download_client.is_closed:
+            self._download_client = self._build(http2=False)
+        return self._download_client
+
+    async def close(self):
+        for client in (self._client, self._download_client):
+            if client is not None:
+                await client.aclose()
+        self._client = self._download_client = None
+
+http_pool = HttpClientPool()
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import ssl
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_SIZE = 16 * 1024 * 1024
+# Idle keep-alive connections are closed after this many seconds
+KEEPALIVE_TIMEOUT = 75
+
+class Request(NamedTuple):
+    method: str
+    path: str
+    query: Dict[str, list]
+    headers: Dict[str, str]
+    body: bytes
+
+class Response(NamedTuple):
+    status: int
+    body: bytes = b""
+    content_type: str = "text/plain; charset=utf-8"
+
+Handler = Callable[[Request], Awaitable[Response]]
+
+REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+           405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error",
+           503: "Service Unavailable"}
+
+class HttpServer:
+    """
+    Minimal asyncio HTTP/1.1 server for the bot's own endpoints (metrics, health,
+    webhook). Connections are kept alive between requests unless the client
+    asks otherwise; routes are matched on exact paths.
+    """
+
+    def __init__(self, host: str, port: int, ssl_context: Optional[ssl.SSLContext] = None):
+        self.host = host
+        self.port = port
+        self.ssl_context = ssl_context
+        self._routes: Dict[Tuple[str, str], Handler] = {}
+        self._server: Optional[asyncio.base_events.Server] = None
+
+    def route(self, method: str, path: str, handler: Handler):
+        self._routes[(method.upper(), path)] = handler
+
+    @property
+    def bound_port(self) -> int:
+        return self._server.sockets[0].getsockname()[1] if self._server else self.port
+
+    async def start(self):
+        self._server = await asyncio.start_server(
+            self._handle, self.host, self.port, ssl=self.ssl_context
+        )
+        logger.info(f"HTTP server listening on {self.host}:{self.bound_port}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), KEEPALIVE_TIMEOUT)
+                except ValueError as e:
+                    await self._write_response(writer, Response(400, str(e).encode()), keep_alive=False)
+                    return
+                if request is None:
+                    return
+                keep_alive = request.headers.get("connection", "").lower() != "close"
+                response = await self._dispatch(request)
+                await self._write_response(writer, response, keep_alive)
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, request: Request) -> Response:
+        handler = self._routes.get((request.method, request.path))
+        if handler is None:
+            if any(path == request.path for _, path in self._routes):
+                return Response(405, b"Method Not Allowed")
+            return Response(404, b"Not Found")
+        try:
+            return await handler(request)
+        except Exception:
+            logger.error(f"Error handling {request.method} {request.path}", exc_info=True)
+            return Response(500, b"Internal Server Error")
+
+    @staticmethod
+    async def _read_head(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str]]]:
+        """Request line and headers as (method, target, lower-cased headers)."""
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        try:
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise ValueError("Malformed request line")
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return method.upper(), target, headers
+
+    @classmethod
+    async def _read_request(cls, reader: asyncio.StreamReader) -> Optional[Request]:
+        head = await cls._read_head(reader)
+        if head is None:
+            return None
+        method, target, headers = head
+        length = int(headers.get("content-length") or 0)
+        if length > MAX_BODY_SIZE:
+            raise ValueError("Request body too large")
+        body = await reader.readexactly(length) if length else b""
+        url = urlsplit(target)
+        return Request(method, url.path, parse_qs(url.query), headers, body)
+
+    @staticmethod
+    async def _write_response(writer: asyncio.StreamWriter, response: Response, keep_alive: bool = False):
+        head = (
+            f"HTTP/1.1 {response.status} {REASONS.get(response.status, '')}\r\n"
+            f"Content-Type: {response.content_type}\r\n"
+            f"Content-Length: {len(response.body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + response.body)
+        await writer.drain()
@@ -0,0 +1,68 @@
+import logging
+import os
+import time
+import uuid
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+class MediaDirectory:
+    """
+    Working directory for fallback downloads.
+
+    Files get unique names with a common prefix, so concurrent transfers of the
+    same video never collide and files left behind by a crash can be swept.
+    When the directory is shared with a Local Bot API Server, server_uri() gives
+    the file:// URI under which the server sees a file, so it can be sent by
+    path instead of streaming its bytes through the bot.
+    """
+
+    PREFIX = "tgdl_"
+
+    def __init__(self, directory: str, server_directory: Optional[str] = None):
+        self.directory = directory
+        self.server_directory = server_directory
+
+    @property
+    def shared(self) -> bool:
+        return self.server_directory is not None
+
+    def new_path(self, suffix: str) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        return os.path.join(self.directory, f"{self.PREFIX}{uuid.uuid4().hex}{suffix}")
+
+    def server_uri(self, path: str) -> str:
+        relative = os.path.relpath(path, self.directory)
+        return "file://" + os.path.join(os.path.abspath(self.server_directory), relative)
+
+    def remove(self, path: Optional[str]):
+        if not path:
+            return
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+        except Exception:
+            logger.warning(f"Failed to remove temp file: {path}", exc_info=True)
+
+    def sweep_orphans(self, max_age: float = 0.0) -> int:
+        """Delete our files older than max_age seconds and return how many were removed."""
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return 0
+        cutoff = time.time() - max_age
+        removed = 0
+        for entry in entries:
+            if not entry.name.startswith(self.PREFIX) or not entry.is_file():
+                continue
+            try:
+                if entry.stat().st_mtime <= cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+            except OSError:
+                logger.warning(f"Failed to remove orphaned file: {entry.path}", exc_info=True)
+        if removed:
+            logger.info(f"Removed {removed} orphaned file(s) from {self.directory}")
+        return removed
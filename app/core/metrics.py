@@ -0,0 +1,260 @@
+import json
+import logging
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.core.config import config
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200)
+
+LabelValues = Tuple[str, ...]
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(self._key(labels), 0)
+
+    def total(self) -> float:
+        return sum(self.values.values())
+
+    def render(self) -> Iterable[str]:
+        for key, value in sorted(self.values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+    def dump(self) -> dict:
+        return {"|".join(k): v for k, v in self.values.items()}
+
+    def load(self, data: dict):
+        self.values = {tuple(k.split("|")) if self.labelnames else (): v for k, v in data.items()}
+
+    def reset(self):
+        self.values.clear()
+
+class Gauge(_Metric):
+    """A value read from a callback when metrics are collected."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, function: Optional[Callable[[], float]] = None):
+        super().__init__(name, help)
+        self.function = function
+
+    def get(self) -> float:
+        if self.function is None:
+            return 0
+        try:
+            return self.function()
+        except Exception:
+            logger.warning(f"Failed to read gauge {self.name}", exc_info=True)
+            return 0
+
+    def render(self) -> Iterable[str]:
+        yield f"{self.name} {_format_value(self.get())}"
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last one is +Inf), sum, count]
+        self.values: Dict[LabelValues, list] = {}
+
+    def _series(self, key: LabelValues) -> list:
+        series = self.values.get(key)
+        if series is None:
+            series = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        return series
+
+    def observe(self, value: float, **labels):
+        series = self._series(self._key(labels))
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        series = self.values.get(self._key(labels))
+        return series[2] if series else 0
+
+    def percentile(self, q: float, **labels) -> Optional[float]:
+        """Estimate the q-th quantile (0..1) by interpolating within buckets."""
+        series = self.values.get(self._key(labels))
+        if not series or not series[2]:
+            return None
+        target = q * series[2]
+        cumulative = 0
+        for i, count in enumerate(series[0]):
+            if count and cumulative + count >= target:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i]
+                return lower + (upper - lower) * (target - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def render(self) -> Iterable[str]:
+        for key, (counts, total, count) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(list(self.buckets) + ["+Inf"], counts):
+                cumulative += bucket_count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {count}"
+
+    def dump(self) -> dict:
+        # Copy the series: observe() keeps mutating them in place
+        return {"|".join(k): [list(counts), total, count] for k, (counts, total, count) in self.values.items()}
+
+    def load(self, data: dict):
+        self.values = {}
+        for k, series in data.items():
+            if len(series[0]) == len(self.buckets) + 1:
+                self.values[tuple(k.split("|")) if self.labelnames else ()] = series
+
+    def reset(self):
+        self.values.clear()
+
+class MetricsRegistry:
+    """
+    In-memory counters, gauges and histograms. Updates are plain dict operations;
+    the state is written to disk in batches by flush() and exposed in Prometheus
+    text format by render().
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, function: Optional[Callable[[], float]] = None) -> Gauge:
+        return self._register(Gauge(name, help, function))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def dump(self) -> dict:
+        return {
+            name: metric.dump()
+            for name, metric in self._metrics.items()
+            if isinstance(metric, (Counter, Histogram))
+        }
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            logger.warning(f"Couldn't read metrics from {self.path}", exc_info=True)
+            return
+        for name, values in data.items():
+            metric = self._metrics.get(name)
+            if isinstance(metric, (Counter, Histogram)):
+                metric.load(values)
+
+    def flush(self):
+        self.write(self.dump())
+
+    def write(self, data: dict):
+        """
+        Write a dump() snapshot to disk. Safe to run in a worker thread as long
+        as the snapshot was taken on the thread that updates the metrics.
+        """
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def reset(self):
+        for metric in self._metrics.values():
+            if isinstance(metric, (Counter, Histogram)):
+                metric.reset()
+
+metrics = MetricsRegistry(config.METRICS_PATH)
+
+messages_handled = metrics.counter("bot_messages_handled_total", "Messages with text passed to the tweet handler")
+messages_skipped = metrics.counter("bot_messages_skipped_total", "Text messages dropped by the tweet link pre-filter", ["reason"])
+media_sent = metrics.counter("bot_media_sent_total", "Media items delivered to chats", ["type"])
+video_sends = metrics.counter("bot_video_sends_total", "Videos sent, by delivery path", ["path"])
+stage_latency = metrics.histogram("bot_stage_latency_seconds", "Latency of pipeline stages", ["stage"])
+bytes_transferred = metrics.counter("bot_bytes_transferred_total", "Media bytes moved by the bot itself", ["direction"])
+tweet_cache = metrics.counter("bot_tweet_cache_total", "Tweet metadata lookups by cache outcome", ["result"])
+tweet_backend_requests = metrics.counter("bot_tweet_backend_requests_total", "Tweet metadata backend calls by outcome", ["backend", "result"])
+tweet_hedges = metrics.counter("bot_tweet_hedges_total", "Hedged requests sent to a second tweet backend")
+update_wait = metrics.histogram("bot_update_wait_seconds", "Time updates spent queued before processing")
+updates_queued = metrics.gauge("bot_updates_queued", "Updates waiting for their chat or a processing slot")
+updates_active = metrics.gauge("bot_updates_active", "Updates currently being processed")
+transfers_active = metrics.gauge("bot_transfers_active", "Local download/upload transfers running")
+transfers_waiting = metrics.gauge("bot_transfers_waiting", "Local download/upload transfers waiting for a slot")
+outbound_throttled = metrics.counter("bot_outbound_throttled_total", "Bot API requests delayed by the rate limiter")
+webhook_updates = metrics.counter("bot_webhook_updates_total", "Webhook requests by outcome", ["result"])
+outbound_retry_after = metrics.counter("bot_outbound_retry_after_total", "Flood-control (RetryAfter) errors from the Bot API")
+batch_tweets = metrics.counter("bot_batch_tweets_total", "Tweets processed in bulk mode by outcome", ["result"])
+queue_jobs = metrics.counter("bot_queue_jobs_total", "Work queue jobs by outcome (enqueued by the front end, the rest by workers)", ["result"])
+video_faststart = metrics.counter("bot_video_faststart_total", "Fallback videos by moov relocation outcome", ["result"])
+photo_sends = metrics.counter("bot_photo_sends_total", "Photo groups sent, by delivery path", ["path"])
@@ -0,0 +1,312 @@
+import asyncio
+import copy
+import hashlib
+import logging
+import os
+import pickle
+import sqlite3
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from telegram.ext import BasePersistence, ContextTypes, PersistenceInput, PicklePersistence
+
+logger = logging.getLogger(__name__)
+
+class TrackingDict(dict):
+    """
+    dict that remembers which top-level keys were read or written since the last
+    persistence flush. Reads count too, because values are usually mutated in
+    place (bot_data["x"]["y"] += 1). Use it as bot_data via ContextTypes so
+    SQLitePersistence only re-serialises the keys that may have changed.
+
+    A deep copy holds only the changed keys and takes over the pending changes,
+    which is all update_bot_data needs from the copy Application makes on every
+    flush. The original starts collecting the next round's changes.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dirty = set(self.keys())
+        self.deleted = set()
+
+    def _touch(self, key):
+        self.dirty.add(key)
+        self.deleted.discard(key)
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.dirty.add(key)
+        return value
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._touch(key)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.dirty.discard(key)
+        self.deleted.add(key)
+
+    def get(self, key, default=None):
+        if key in self:
+            self.dirty.add(key)
+        return super().get(key, default)
+
+    def setdefault(self, key, default=None):
+        self._touch(key)
+        return super().setdefault(key, default)
+
+    def pop(self, key, *args):
+        if key in self:
+            self.dirty.discard(key)
+            self.deleted.add(key)
+        return super().pop(key, *args)
+
+    def popitem(self):
+        key, value = super().popitem()
+        self.dirty.discard(key)
+        self.deleted.add(key)
+        return key, value
+
+    def update(self, *args, **kwargs):
+        other = dict(*args, **kwargs)
+        super().update(other)
+        for key in other:
+            self._touch(key)
+
+    def clear(self):
+        self.deleted.update(self.keys())
+        self.dirty.clear()
+        super().clear()
+
+    def values(self):
+        self.dirty.update(self.keys())
+        return super().values()
+
+    def items(self):
+        self.dirty.update(self.keys())
+        return super().items()
+
+    def __deepcopy__(self, memo):
+        # Application.update_persistence runs this on the event loop before
+        # every flush, so copy the changed entries only, not the whole dict
+        result = type(self).__new__(type(self))
+        memo[id(self)] = result
+        dirty, deleted = self.take_changes()
+        for key in dirty:
+            if key in self:
+                dict.__setitem__(result, copy.deepcopy(key, memo), copy.deepcopy(dict.__getitem__(self, key), memo))
+        result.dirty, result.deleted = dirty, deleted
+        return result
+
+    def take_changes(self) -> Tuple[set, set]:
+        dirty, deleted = self.dirty, self.deleted
+        self.dirty, self.deleted = set(), set()
+        return dirty, deleted
+
+    def restore_changes(self, dirty: Iterable, deleted: Iterable):
+        """Mark changes taken by a flush that failed as pending again."""
+        self.dirty.update(key for key in dirty if key in self)
+        self.deleted.update(key for key in deleted if key not in self)
+
+class SQLitePersistence(BasePersistence):
+    """
+    BasePersistence backed by SQLite in WAL mode.
+
+    Every bot_data key, every chat's and user's data, each conversation handler's
+    state and the callback data are stored as separate pickled rows. Only rows
+    whose content changed since they were last written are sent to the database,
+    and all database work runs in a worker thread so flushes don't block the
+    event loop. Values are pickled with the standard pickler, so they must not
+    hold references to the Bot instance.
+    """
+
+    def __init__(
+        self,
+        filepath: str,
+        store_data: Optional[PersistenceInput] = None,
+        update_interval: float = 60,
+        context_types: Optional[ContextTypes] = None,
+    ):
+        super().__init__(store_data=store_data, update_interval=update_interval)
+        self.filepath = filepath
+        self.context_types = context_types or ContextTypes()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = asyncio.Lock()
+        # (namespace, key) -> digest of the last written value
+        self._digests: Dict[Tuple[str, bytes], bytes] = {}
+        self._conversations: Optional[Dict[str, Dict]] = None
+        # The live bot_data handed out by get_bot_data, to hand back the changes
+        # of a failed flush
+        self._bot_data: Any = None
+
+    # -- database -----------------------------------------------------------
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.filepath)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.filepath, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS persistence ("
+                " namespace TEXT NOT NULL,"
+                " key BLOB NOT NULL,"
+                " value BLOB NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def _read_namespace(self, namespace: str) -> List[Tuple[bytes, bytes]]:
+        return self._connect().execute(
+            "SELECT key, value FROM persistence WHERE namespace = ?", (namespace,)
+        ).fetchall()
+
+    def _apply(self, upserts: List[Tuple[str, bytes, bytes]], deletes: List[Tuple[str, bytes]]):
+        conn = self._connect()
+        with conn:
+            if upserts:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO persistence (namespace, key, value) VALUES (?, ?, ?)",
+                    upserts,
+                )
+            if deletes:
+                conn.executemany("DELETE FROM persistence WHERE namespace = ? AND key = ?", deletes)
+
+    async def _load(self, namespace: str) -> Dict[Any, Any]:
+        async with self._lock:
+            rows = await asyncio.to_thread(self._read_namespace, namespace)
+        result = {}
+        for key, value in rows:
+            self._digests[(namespace, key)] = hashlib.blake2b(value, digest_size=16).digest()
+            result[pickle.loads(key)] = pickle.loads(value)
+        return result
+
+    async def _write(self, namespace: str, items: Iterable[Tuple[Any, Any]], removed: Iterable[Any] = ()):
+        """Pickle items on the loop (values may change later) and write the changed ones."""
+        upserts, deletes, digests = [], [], {}
+        for key, value in items:
+            key_blob = pickle.dumps(key, protocol=pickle.HIGHEST_PROTOCOL)
+            value_blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            digest = hashlib.blake2b(value_blob, digest_size=16).digest()
+            if self._digests.get((namespace, key_blob)) != digest:
+                upserts.append((namespace, key_blob, value_blob))
+                digests[(namespace, key_blob)] = digest
+        for key in removed:
+            key_blob = pickle.dumps(key, protocol=pickle.HIGHEST_PROTOCOL)
+            deletes.append((namespace, key_blob))
+            digests[(namespace, key_blob)] = None
+        if not upserts and not deletes:
+            return
+        async with self._lock:
+            await asyncio.to_thread(self._apply, upserts, deletes)
+        for key, digest in digests.items():
+            if digest is None:
+                self._digests.pop(key, None)
+            else:
+                self._digests[key] = digest
+
+    # -- BasePersistence ----------------------------------------------------
+
+    async def get_bot_data(self) -> Any:
+        data = await self._load("bot_data")
+        bot_data = self.context_types.bot_data()
+        if isinstance(bot_data, TrackingDict):
+            dict.update(bot_data, data)
+            bot_data.take_changes()
+        else:
+            bot_data.update(data)
+        self._bot_data = bot_data
+        return bot_data
+
+    async def update_bot_data(self, data: Any) -> None:
+        if isinstance(data, TrackingDict):
+            # A deep copy holds just the changed keys and the pending changes
+            dirty, deleted = data.take_changes()
+            try:
+                await self._write("bot_data", [(key, dict.__getitem__(data, key)) for key in dirty if key in data], deleted)
+            except BaseException:
+                if isinstance(self._bot_data, TrackingDict) and self._bot_data is not data:
+                    self._bot_data.restore_changes(dirty, deleted)
+                raise
+            return
+        stored = {key for (namespace, key) in self._digests if namespace == "bot_data"}
+        current = {pickle.dumps(key, protocol=pickle.HIGHEST_PROTOCOL) for key in data}
+        removed = [pickle.loads(key) for key in stored - current]
+        await self._write("bot_data", list(data.items()), removed)
+
+    async def refresh_bot_data(self, bot_data: Any) -> None:
+        pass
+
+    async def get_chat_data(self) -> Dict[int, Any]:
+        return await self._load("chat_data")
+
+    async def update_chat_data(self, chat_id: int, data: Any) -> None:
+        await self._write("chat_data", [(chat_id, data)])
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Any) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        await self._write("chat_data", [], [chat_id])
+
+    async def get_user_data(self) -> Dict[int, Any]:
+        return await self._load("user_data")
+
+    async def update_user_data(self, user_id: int, data: Any) -> None:
+        await self._write("user_data", [(user_id, data)])
+
+    async def refresh_user_data(self, user_id: int, user_data: Any) -> None:
+        pass
+
+    async def drop_user_data(self, user_id: int) -> None:
+        await self._write("user_data", [], [user_id])
+
+    async def get_callback_data(self) -> Optional[Any]:
+        data = await self._load("callback_data")
+        return data.get("callback_data")
+
+    async def update_callback_data(self, data: Any) -> None:
+        await self._write("callback_data", [("callback_data", data)])
+
+    async def get_conversations(self, name: str) -> Dict:
+        if self._conversations is None:
+            self._conversations = await self._load("conversations")
+        return dict(self._conversations.get(name, {}))
+
+    async def update_conversation(self, name: str, key: Tuple[int, ...], new_state: Optional[object]) -> None:
+        if self._conversations is None:
+            self._conversations = await self._load("conversations")
+        conversations = self._conversations.setdefault(name, {})
+        if new_state is None:
+            conversations.pop(key, None)
+        else:
+            conversations[key] = new_state
+        await self._write("conversations", [(name, conversations)])
+
+    async def flush(self) -> None:
+        async with self._lock:
+            if self._conn is not None:
+                conn, self._conn = self._conn, None
+                await asyncio.to_thread(conn.close)
+
+async def migrate_pickle(pickle_path: str, sqlite_path: str) -> SQLitePersistence:
+    """One-shot import of a single-file PicklePersistence into a SQLite database."""
+    source = PicklePersistence(filepath=pickle_path)
+    target = SQLitePersistence(sqlite_path)
+    await target.update_bot_data(dict(await source.get_bot_data()))
+    for chat_id, data in (await source.get_chat_data()).items():
+        await target.update_chat_data(chat_id, data)
+    for user_id, data in (await source.get_user_data()).items():
+        await target.update_user_data(user_id, data)
+    callback_data = await source.get_callback_data()
+    if callback_data is not None:
+        await target.update_callback_data(callback_data)
+    for name, conversations in (source.conversations or {}).items():
+        for key, state in conversations.items():
+            await target.update_conversation(name, key, state)
+    await target.flush()
+    logger.info(f"Migrated {pickle_path} into {sqlite_path}")
+    return target
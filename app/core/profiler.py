@@ -0,0 +1,196 @@
+import asyncio
+import functools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Coroutine, List, Optional, Tuple
+
+# Innermost frames kept per stack sample
+MAX_DEPTH = 64
+# Top lines of each report section
+TOP_ENTRIES = 25
+
+Stack = Tuple[str, ...]
+
+@functools.lru_cache(maxsize=4096)
+def _short_path(filename: str) -> str:
+    """A file name relative to the import path entry it was found under."""
+    prefixes = sorted({os.path.abspath(p) for p in sys.path if p} | {os.getcwd()}, key=len, reverse=True)
+    for prefix in prefixes:
+        if filename.startswith(prefix + os.sep):
+            return filename[len(prefix) + 1:]
+    return filename
+
+def _label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({_short_path(code.co_filename)}:{frame.f_lineno})"
+
+def _frame_stack(frame) -> Stack:
+    """Labels from the outermost to the innermost frame."""
+    labels = []
+    while frame is not None and len(labels) < MAX_DEPTH:
+        labels.append(_label(frame))
+        frame = frame.f_back
+    return tuple(reversed(labels))
+
+def _await_chain(task: asyncio.Task) -> Stack:
+    """Labels of the coroutines a task is suspended in, from the task's own to the innermost."""
+    labels = []
+    coro = task.get_coro()
+    while coro is not None and len(labels) < MAX_DEPTH:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is not None:
+            labels.append(_label(frame))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return tuple(labels)
+
+def _is_idle(frame) -> bool:
+    # The loop is waiting for I/O in selectors.*Selector.select
+    return frame.f_code.co_name == "select" and frame.f_code.co_filename.endswith("selectors.py")
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class LoopProfiler:
+    """
+    Sampling profiler for the asyncio event loop, run on demand.
+
+    While running, a thread samples the Python stack of the loop's thread every
+    `interval` seconds (where CPU time on the loop goes), a task walks the await
+    chain of every pending task every `task_interval` seconds (where requests
+    spend their time waiting) and a probe sleeping `lag_interval` seconds
+    measures how late the loop wakes it up. Nothing is installed while idle.
+    """
+
+    def __init__(self, interval: float = 0.005, task_interval: float = 0.05, lag_interval: float = 0.02):
+        self.interval = interval
+        self.task_interval = task_interval
+        self.lag_interval = lag_interval
+        self.running = False
+
+    def run(self, seconds: float, should_stop: Optional[Callable[[], bool]] = None) -> Coroutine[Any, Any, str]:
+        """
+        Claim the profiler and return a coroutine that profiles the running loop
+        for `seconds` (or until should_stop() is true) and returns a text report.
+        Raises RuntimeError right away if a profile is already running.
+        """
+        if self.running:
+            raise RuntimeError("A profile is already running")
+        self.running = True
+        return self._run(seconds, should_stop)
+
+    async def _run(self, seconds: float, should_stop: Optional[Callable[[], bool]]) -> str:
+        try:
+            return await self._profile(seconds, should_stop)
+        finally:
+            self.running = False
+
+    async def _profile(self, seconds: float, should_stop: Optional[Callable[[], bool]]) -> str:
+        stacks: Counter = Counter()
+        chains: Counter = Counter()
+        lags: List[float] = []
+        task_samples = [0, 0]
+        samples = [0]
+        done = threading.Event()
+        loop_thread = threading.get_ident()
+        probe = asyncio.current_task()
+
+        def sample_thread():
+            # Samples are weighted by the time since the previous one: while the
+            # loop holds the GIL this thread wakes up late, and counting samples
+            # alone would understate busy stretches
+            last = time.perf_counter()
+            while not done.wait(self.interval):
+                frame = sys._current_frames().get(loop_thread)
+                now = time.perf_counter()
+                if frame is not None:
+                    stacks[_frame_stack(frame) if not _is_idle(frame) else ()] += now - last
+                    samples[0] += 1
+                last = now
+
+        async def sample_tasks():
+            me = asyncio.current_task()
+            while True:
+                await asyncio.sleep(self.task_interval)
+                task_samples[0] += 1
+                for task in asyncio.all_tasks():
+                    if task is not me and task is not probe:
+                        chains[_await_chain(task)] += 1
+                        task_samples[1] += 1
+
+        sampler = threading.Thread(target=sample_thread, name="loop-profiler", daemon=True)
+        tasks = asyncio.ensure_future(sample_tasks())
+        started = time.perf_counter()
+        deadline = started + seconds
+        stopped_early = False
+        sampler.start()
+        try:
+            while time.perf_counter() < deadline:
+                if should_stop is not None and should_stop():
+                    stopped_early = True
+                    break
+                before = time.perf_counter()
+                await asyncio.sleep(self.lag_interval)
+                lags.append(max(0.0, time.perf_counter() - before - self.lag_interval))
+        finally:
+            done.set()
+            tasks.cancel()
+            await asyncio.gather(tasks, return_exceptions=True)
+            await asyncio.to_thread(sampler.join)
+        elapsed = time.perf_counter() - started
+        return self._report(elapsed, stopped_early, samples[0], stacks, chains, lags, *task_samples)
+
+    def _report(self, elapsed: float, stopped_early: bool, samples: int, stacks: Counter, chains: Counter,
+                lags: List[float], task_rounds: int, task_count: int) -> str:
+        total = sum(stacks.values())
+        idle = stacks.pop((), 0)
+        busy = total - idle
+        lines = [
+            f"Event loop profile of {elapsed:.1f}s (pid {os.getpid()})" + (", stopped early" if stopped_early else ""),
+            "",
+            f"Event loop lag, probed every {self.lag_interval * 1000:.0f} ms ({len(lags)} probes):",
+        ]
+        if lags:
+            lines.append(
+                f"  mean {sum(lags) / len(lags) * 1000:.1f} ms, p50 {_percentile(lags, 0.5) * 1000:.1f} ms, "
+                f"p95 {_percentile(lags, 0.95) * 1000:.1f} ms, p99 {_percentile(lags, 0.99) * 1000:.1f} ms, "
+                f"max {max(lags) * 1000:.1f} ms, over 100 ms: {sum(1 for lag in lags if lag > 0.1)}"
+            )
+        lines += [
+            "",
+            f"Loop thread: {samples} samples every {self.interval * 1000:.0f} ms, "
+            f"{busy / total if total else 0:.1%} busy (not waiting for I/O)",
+            "",
+            "Functions by busy time (own = innermost frame, total = anywhere on the stack):",
+            "   own%  total%  function",
+        ]
+        own: Counter = Counter()
+        anywhere: Counter = Counter()
+        for stack, count in stacks.items():
+            own[stack[-1]] += count
+            for label in set(stack):
+                anywhere[label] += count
+        for label, count in own.most_common(TOP_ENTRIES):
+            lines.append(f"  {count / busy:6.1%}  {anywhere[label] / busy:6.1%}  {label}")
+
+        lines += [
+            "",
+            f"Task await points ({task_rounds} rounds, {task_count / task_rounds if task_rounds else 0:.1f} "
+            "pending tasks on average; share of task samples, innermost coroutine first):",
+        ]
+        for chain, count in chains.most_common(TOP_ENTRIES):
+            lines.append(f"  {count / task_count:6.1%}  {chain[-1] if chain else '<no coroutine>'}")
+            for label in reversed(chain[:-1]):
+                lines.append(f"            <- {label}")
+
+        lines += ["", "Collapsed busy stacks of the loop thread in ms (for flamegraph.pl or speedscope):"]
+        for stack, seconds in stacks.most_common():
+            lines.append(f"{';'.join(stack)} {max(1, round(seconds * 1000))}")
+        return "\n".join(lines) + "\n"
+
+profiler = LoopProfiler()
@@ -0,0 +1,207 @@
+import asyncio
+import logging
+import shutil
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Deque, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+PositionCallback = Callable[[int], Awaitable[None]]
+
+class InsufficientDiskSpace(Exception):
+    pass
+
+class _Waiter:
+    __slots__ = ("user_id", "reserve", "future", "on_position", "position", "reported", "reported_at", "deferred")
+
+    def __init__(self, user_id: Hashable, reserve: int, on_position: Optional[PositionCallback]):
+        self.user_id = user_id
+        self.reserve = reserve
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.on_position = on_position
+        self.position: Optional[int] = None
+        # Last position passed to on_position, when, and a report held back until then
+        self.reported: Optional[int] = None
+        self.reported_at = float("-inf")
+        self.deferred: Optional[asyncio.TimerHandle] = None
+
+class TransferScheduler:
+    """
+    Admission control for local download/upload transfers.
+
+    At most max_active transfers run at once and at most max_per_user of them
+    belong to the same user. Waiting users are served round-robin, so a user with
+    a long queue can't starve the others. A transfer only starts if the disk under
+    directory keeps min_free_bytes free after reserving its expected size.
+    Position reports are sent at most once per position_interval seconds per
+    waiter; changes in between are folded into one report of the latest position.
+    """
+
+    def __init__(
+        self,
+        max_active: int,
+        max_per_user: int,
+        directory: str = "data",
+        min_free_bytes: int = 0,
+        default_reserve_bytes: int = 0,
+        position_interval: float = 0,
+    ):
+        self.max_active = max_active
+        self.max_per_user = max_per_user
+        self.directory = directory
+        self.min_free_bytes = min_free_bytes
+        self.default_reserve_bytes = default_reserve_bytes
+        self.position_interval = position_interval
+        # user id -> waiting transfers; iteration order is the round-robin order
+        self._queues: "OrderedDict[Hashable, Deque[_Waiter]]" = OrderedDict()
+        self._active_per_user: Dict[Hashable, int] = {}
+        self._active = 0
+        self._reserved = 0
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        user_id: Hashable,
+        expected_bytes: Optional[int] = None,
+        on_position: Optional[PositionCallback] = None,
+    ):
+        """
+        Wait for a transfer slot. on_position is awaited with the 1-based queue
+        position whenever it changes while the transfer is waiting, throttled to
+        one call per position_interval.
+        """
+        reserve = expected_bytes if expected_bytes is not None else self.default_reserve_bytes
+        waiter = _Waiter(user_id, reserve, on_position)
+        self._queues.setdefault(user_id, deque()).append(waiter)
+        self._dispatch()
+        try:
+            await waiter.future
+        except BaseException:
+            if waiter.future.done() and not waiter.future.cancelled() and waiter.future.exception() is None:
+                # Granted just before we were cancelled
+                self._release(waiter)
+            else:
+                self._discard(waiter)
+            raise
+        try:
+            yield
+        finally:
+            self._release(waiter)
+
+    def _free_bytes(self) -> Optional[int]:
+        try:
+            return shutil.disk_usage(self.directory).free
+        except OSError:
+            logger.warning(f"Couldn't check free disk space of {self.directory}", exc_info=True)
+            return None
+
+    def _fits(self, reserve: int) -> bool:
+        free = self._free_bytes()
+        if free is None:
+            return True
+        return free - self._reserved - reserve >= self.min_free_bytes
+
+    def _dispatch(self):
+        granted = True
+        while granted and self._active < self.max_active:
+            granted = False
+            for user_id in list(self._queues):
+                if self._active_per_user.get(user_id, 0) >= self.max_per_user:
+                    continue
+                queue = self._queues[user_id]
+                waiter = queue[0]
+                if not self._fits(waiter.reserve):
+                    if self._active == 0:
+                        # Nothing will free up space for this one; fail it instead of waiting forever
+                        queue.popleft()
+                        waiter.future.set_exception(InsufficientDiskSpace(
+                            f"Not enough disk space for a {waiter.reserve} byte transfer"
+                        ))
+                        if not queue:
+                            del self._queues[user_id]
+                        granted = True
+                        break
+                    continue
+                queue.popleft()
+                if queue:
+                    # Served: move to the back of the round-robin order
+                    self._queues.move_to_end(user_id)
+                else:
+                    del self._queues[user_id]
+                self._active += 1
+                self._active_per_user[user_id] = self._active_per_user.get(user_id, 0) + 1
+                self._reserved += waiter.reserve
+                waiter.future.set_result(None)
+                granted = True
+                break
+        self._notify_positions()
+
+    def _release(self, waiter: _Waiter):
+        self._active -= 1
+        self._reserved -= waiter.reserve
+        remaining = self._active_per_user.get(waiter.user_id, 1) - 1
+        if remaining > 0:
+            self._active_per_user[waiter.user_id] = remaining
+        else:
+            self._active_per_user.pop(waiter.user_id, None)
+        self._dispatch()
+
+    def _discard(self, waiter: _Waiter):
+        queue = self._queues.get(waiter.user_id)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del self._queues[waiter.user_id]
+        self._dispatch()
+
+    def _notify_positions(self):
+        """Report queue positions in the order the round-robin would serve them."""
+        queues = [list(q) for q in self._queues.values()]
+        position = 0
+        for depth in range(max((len(q) for q in queues), default=0)):
+            for queue in queues:
+                if depth >= len(queue):
+                    continue
+                position += 1
+                waiter = queue[depth]
+                waiter.position = position
+                if waiter.on_position is not None and waiter.reported != position:
+                    self._schedule_report(waiter)
+
+    def _schedule_report(self, waiter: _Waiter):
+        if waiter.deferred is not None:
+            # Already held back; it reports whatever the position is by then
+            return
+        loop = asyncio.get_running_loop()
+        wait = waiter.reported_at + self.position_interval - loop.time()
+        if wait > 0:
+            waiter.deferred = loop.call_later(wait, self._deferred_report, waiter)
+        else:
+            self._report_position(waiter)
+
+    def _deferred_report(self, waiter: _Waiter):
+        waiter.deferred = None
+        # Nothing to report once the waiter was granted, failed or cancelled
+        if not waiter.future.done() and waiter.position != waiter.reported:
+            self._report_position(waiter)
+
+    def _report_position(self, waiter: _Waiter):
+        waiter.reported = waiter.position
+        waiter.reported_at = asyncio.get_running_loop().time()
+        asyncio.ensure_future(self._report(waiter.on_position, waiter.position))
+
+    @staticmethod
+    async def _report(callback: PositionCallback, position: int):
+        try:
+            await callback(position)
+        except Exception:
+            logger.warning("Failed to report transfer queue position", exc_info=True)
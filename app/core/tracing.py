@@ -0,0 +1,139 @@
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from app.core.config import config
+
+logger = logging.getLogger(__name__)
+
+class Trace:
+    def __init__(self, name: str, attrs: Dict[str, Any]):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = attrs
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self.error = False
+
+    def to_dict(self, duration: float) -> Dict[str, Any]:
+        return {
+            "trace_id": self.id,
+            "name": self.name,
+            "start": round(self.started_at, 3),
+            "duration_ms": round(duration * 1000, 1),
+            "error": self.error,
+            "attrs": self.attrs,
+            "spans": self.spans,
+        }
+
+current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("current_trace", default=None)
+
+class Tracer:
+    """
+    Per-request traces written as JSON lines. Every request records its spans
+    (cheap: a dict per span), but only a sample_rate share of traces is written,
+    plus every failed request and every trace slower than slow_seconds. A span
+    the exception passes through records it, but the request only counts as
+    failed if the exception escapes the trace or the handler calls
+    trace_failed(): stages like send_url raise errors their callers recover from. Spans opened in tasks started during a trace belong to it, as
+    tasks inherit the context. The file is rotated to <path>.1 at max_bytes.
+    """
+
+    def __init__(self, path: Optional[str], sample_rate: float = 0.01, slow_seconds: float = 0, max_bytes: int = 0):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+        self.max_bytes = max_bytes
+        self._file = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    @contextlib.contextmanager
+    def trace(self, name: str, **attrs):
+        """Trace the enclosed request; nested calls join the outer trace."""
+        if not self.enabled or current_trace.get() is not None:
+            yield current_trace.get()
+            return
+        trace = Trace(name, attrs)
+        token = current_trace.set(trace)
+        try:
+            yield trace
+        except BaseException:
+            trace.error = True
+            raise
+        finally:
+            current_trace.reset(token)
+            self._finish(trace, time.perf_counter() - trace.started)
+
+    def _finish(self, trace: Trace, duration: float):
+        keep = (
+            trace.error
+            or (self.slow_seconds and duration >= self.slow_seconds)
+            or random.random() < self.sample_rate
+        )
+        if not keep:
+            return
+        try:
+            self._write(json.dumps(trace.to_dict(duration), default=str))
+        except OSError:
+            logger.warning(f"Couldn't write trace to {self.path}", exc_info=True)
+
+    def _write(self, line: str):
+        if self._file is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(self.path, "a", buffering=1)
+        self._file.write(line + "\n")
+        if self.max_bytes and self._file.tell() >= self.max_bytes:
+            self._file.close()
+            self._file = None
+            os.replace(self.path, f"{self.path}.1")
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+@contextlib.contextmanager
+def span(name: str, **attrs):
+    """
+    Time a stage of the current trace; does nothing outside a trace. Yields the
+    span's attributes, which the stage can add to.
+    """
+    trace = current_trace.get()
+    if trace is None:
+        yield attrs
+        return
+    started = time.perf_counter()
+    record: Dict[str, Any] = {"name": name, "offset_ms": round((started - trace.started) * 1000, 1), "attrs": attrs}
+    try:
+        yield attrs
+    except BaseException as e:
+        record["error"] = type(e).__name__
+        raise
+    finally:
+        record["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        trace.spans.append(record)
+
+def trace_failed():
+    """Mark the current request as failed, e.g. when its handler reports an error to the user."""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.error = True
+
+tracer = Tracer(
+    config.TRACE_PATH,
+    sample_rate=config.TRACE_SAMPLE_RATE,
+    slow_seconds=config.TRACE_SLOW_SECONDS,
+    max_bytes=config.TRACE_MAX_MB * 1024 * 1024,
+)
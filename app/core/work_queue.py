@@ -0,0 +1,323 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Dict, NamedTuple, Optional
+
+from app.core.config import config
+
+logger = logging.getLogger(__name__)
+
+class Job(NamedTuple):
+    id: str
+    payload: Dict[str, Any]
+    # Deliveries so far, including this one
+    attempts: int
+    # Token of this delivery; ack/fail/extend only apply while it is current
+    lease: str
+
+class WorkQueue(ABC):
+    """
+    Durable at-least-once job queue shared by the front end and the workers.
+
+    Every job has a time from which it may be delivered. Taking a job leases it
+    by moving that time visibility_timeout seconds ahead, so a job whose worker
+    died becomes visible again once the lease runs out; workers holding a job
+    for longer call extend(). ack() removes a job, fail() makes it available
+    again after a delay. A job delivered max_attempts times without being acked
+    is moved aside as dead instead of being delivered again.
+    """
+
+    def __init__(self, visibility_timeout: float = 120, max_attempts: int = 5):
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+
+    @abstractmethod
+    async def put(self, payload: Dict[str, Any], delay: float = 0) -> str:
+        ...
+
+    @abstractmethod
+    async def get(self) -> Optional[Job]:
+        """Lease the next available job, or None if there is nothing to do."""
+
+    @abstractmethod
+    async def ack(self, job: Job) -> bool:
+        ...
+
+    @abstractmethod
+    async def fail(self, job: Job, delay: float = 0, payload: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        Give a job back for another attempt; returns False if it was moved to the
+        dead jobs. A payload replaces the job's, e.g. to record partial progress.
+        """
+
+    @abstractmethod
+    async def extend(self, job: Job) -> bool:
+        """Renew the lease of a job still being worked on; False if it was lost."""
+
+    @abstractmethod
+    async def counts(self) -> Dict[str, int]:
+        """Number of jobs that are ready, delayed (leased or waiting for a retry) and dead."""
+
+    async def close(self):
+        pass
+
+class SQLiteWorkQueue(WorkQueue):
+    """WorkQueue in a SQLite file (WAL mode), for a front end and workers on the same host."""
+
+    def __init__(self, path: str, visibility_timeout: float = 120, max_attempts: int = 5):
+        super().__init__(visibility_timeout, max_attempts)
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = asyncio.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Transactions are explicit; other processes may hold the write lock for a moment
+            self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " payload TEXT NOT NULL,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " available_at REAL NOT NULL,"
+                " lease TEXT,"
+                " dead INTEGER NOT NULL DEFAULT 0)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_available ON jobs (dead, available_at)")
+        return self._conn
+
+    async def _run(self, func, *args):
+        async with self._lock:
+            return await asyncio.to_thread(func, *args)
+
+    def _put(self, payload: str, delay: float) -> str:
+        cursor = self._connect().execute(
+            "INSERT INTO jobs (payload, available_at) VALUES (?, ?)", (payload, time.time() + delay)
+        )
+        return str(cursor.lastrowid)
+
+    def _get(self, lease: str) -> Optional[Job]:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            while True:
+                now = time.time()
+                row = conn.execute(
+                    "SELECT id, payload, attempts FROM jobs WHERE dead = 0 AND available_at <= ?"
+                    " ORDER BY available_at, id LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is None:
+                    return None
+                job_id, payload, attempts = row
+                if attempts >= self.max_attempts:
+                    # Its last lease ran out, most likely the job keeps killing workers
+                    logger.warning(f"Job {job_id} expired after {attempts} attempts, moving it to the dead jobs")
+                    conn.execute("UPDATE jobs SET dead = 1, lease = NULL WHERE id = ?", (job_id,))
+                    continue
+                conn.execute(
+                    "UPDATE jobs SET attempts = ?, available_at = ?, lease = ? WHERE id = ?",
+                    (attempts + 1, now + self.visibility_timeout, lease, job_id),
+                )
+                return Job(str(job_id), json.loads(payload), attempts + 1, lease)
+        finally:
+            conn.execute("COMMIT")
+
+    def _ack(self, job: Job) -> bool:
+        cursor = self._connect().execute("DELETE FROM jobs WHERE id = ? AND lease = ?", (int(job.id), job.lease))
+        return cursor.rowcount > 0
+
+    def _fail(self, job: Job, delay: float, payload: Optional[str]) -> bool:
+        conn = self._connect()
+        if job.attempts >= self.max_attempts:
+            conn.execute(
+                "UPDATE jobs SET dead = 1, lease = NULL, payload = COALESCE(?, payload) WHERE id = ? AND lease = ?",
+                (payload, int(job.id), job.lease),
+            )
+            return False
+        cursor = conn.execute(
+            "UPDATE jobs SET available_at = ?, lease = NULL, payload = COALESCE(?, payload) WHERE id = ? AND lease = ?",
+            (time.time() + delay, payload, int(job.id), job.lease),
+        )
+        return cursor.rowcount > 0
+
+    def _extend(self, job: Job) -> bool:
+        cursor = self._connect().execute(
+            "UPDATE jobs SET available_at = ? WHERE id = ? AND lease = ?",
+            (time.time() + self.visibility_timeout, int(job.id), job.lease),
+        )
+        return cursor.rowcount > 0
+
+    def _counts(self) -> Dict[str, int]:
+        ready, delayed, dead = self._connect().execute(
+            "SELECT"
+            " COALESCE(SUM(dead = 0 AND available_at <= :now), 0),"
+            " COALESCE(SUM(dead = 0 AND available_at > :now), 0),"
+            " COALESCE(SUM(dead = 1), 0)"
+            " FROM jobs",
+            {"now": time.time()},
+        ).fetchone()
+        return {"ready": ready, "delayed": delayed, "dead": dead}
+
+    async def put(self, payload: Dict[str, Any], delay: float = 0) -> str:
+        return await self._run(self._put, json.dumps(payload), delay)
+
+    async def get(self) -> Optional[Job]:
+        return await self._run(self._get, uuid.uuid4().hex)
+
+    async def ack(self, job: Job) -> bool:
+        return await self._run(self._ack, job)
+
+    async def fail(self, job: Job, delay: float = 0, payload: Optional[Dict[str, Any]] = None) -> bool:
+        return await self._run(self._fail, job, delay, json.dumps(payload) if payload is not None else None)
+
+    async def extend(self, job: Job) -> bool:
+        return await self._run(self._extend, job)
+
+    async def counts(self) -> Dict[str, int]:
+        return await self._run(self._counts)
+
+    async def close(self):
+        async with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+# Scripts keep every state change atomic and use the Redis server's clock, so
+# workers on hosts with skewed clocks agree on when a lease runs out.
+# KEYS: schedule (zset id -> available at), jobs, attempts, leases, dead (hashes)
+_REDIS_NOW = "local t = redis.call('TIME') local now = tonumber(t[1]) + tonumber(t[2]) / 1000000 "
+
+_REDIS_PUT = _REDIS_NOW + """
+local id = redis.call('INCR', KEYS[6])
+redis.call('HSET', KEYS[2], id, ARGV[1])
+redis.call('ZADD', KEYS[1], now + tonumber(ARGV[2]), id)
+return id
+"""
+
+_REDIS_GET = _REDIS_NOW + """
+while true do
+    local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', now, 'LIMIT', 0, 1)
+    if #ids == 0 then return false end
+    local id = ids[1]
+    local payload = redis.call('HGET', KEYS[2], id)
+    local attempts = tonumber(redis.call('HGET', KEYS[3], id) or '0')
+    if not payload or attempts >= tonumber(ARGV[3]) then
+        redis.call('ZREM', KEYS[1], id)
+        redis.call('HDEL', KEYS[2], id)
+        redis.call('HDEL', KEYS[3], id)
+        redis.call('HDEL', KEYS[4], id)
+        if payload then redis.call('HSET', KEYS[5], id, payload) end
+    else
+        redis.call('ZADD', KEYS[1], now + tonumber(ARGV[2]), id)
+        redis.call('HSET', KEYS[3], id, attempts + 1)
+        redis.call('HSET', KEYS[4], id, ARGV[1])
+        return {id, payload, attempts + 1}
+    end
+end
+"""
+
+_REDIS_ACK = """
+if redis.call('HGET', KEYS[4], ARGV[1]) ~= ARGV[2] then return 0 end
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('HDEL', KEYS[2], ARGV[1])
+redis.call('HDEL', KEYS[3], ARGV[1])
+redis.call('HDEL', KEYS[4], ARGV[1])
+return 1
+"""
+
+_REDIS_FAIL = _REDIS_NOW + """
+if redis.call('HGET', KEYS[4], ARGV[1]) ~= ARGV[2] then return 0 end
+redis.call('HDEL', KEYS[4], ARGV[1])
+if ARGV[5] ~= '' then redis.call('HSET', KEYS[2], ARGV[1], ARGV[5]) end
+if tonumber(redis.call('HGET', KEYS[3], ARGV[1]) or '0') >= tonumber(ARGV[4]) then
+    local payload = redis.call('HGET', KEYS[2], ARGV[1])
+    redis.call('ZREM', KEYS[1], ARGV[1])
+    if payload then redis.call('HSET', KEYS[5], ARGV[1], payload) end
+    redis.call('HDEL', KEYS[2], ARGV[1])
+    redis.call('HDEL', KEYS[3], ARGV[1])
+    return 0
+end
+redis.call('ZADD', KEYS[1], now + tonumber(ARGV[3]), ARGV[1])
+return 1
+"""
+
+_REDIS_EXTEND = _REDIS_NOW + """
+if redis.call('HGET', KEYS[4], ARGV[1]) ~= ARGV[2] then return 0 end
+redis.call('ZADD', KEYS[1], 'XX', now + tonumber(ARGV[3]), ARGV[1])
+return 1
+"""
+
+_REDIS_COUNTS = _REDIS_NOW + """
+local ready = redis.call('ZCOUNT', KEYS[1], '-inf', now)
+return {ready, redis.call('ZCARD', KEYS[1]) - ready, redis.call('HLEN', KEYS[5])}
+"""
+
+class RedisWorkQueue(WorkQueue):
+    """WorkQueue in Redis, for workers spread over several hosts. Needs the redis package."""
+
+    def __init__(self, url: str, prefix: str = "tgdl:work", visibility_timeout: float = 120, max_attempts: int = 5):
+        super().__init__(visibility_timeout, max_attempts)
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("The redis work queue needs the redis package (pip install redis)")
+        self.redis = redis.from_url(url)
+        self.keys = [f"{prefix}:{name}" for name in ("schedule", "jobs", "attempts", "leases", "dead", "seq")]
+        self._put = self.redis.register_script(_REDIS_PUT)
+        self._get = self.redis.register_script(_REDIS_GET)
+        self._ack = self.redis.register_script(_REDIS_ACK)
+        self._fail = self.redis.register_script(_REDIS_FAIL)
+        self._extend = self.redis.register_script(_REDIS_EXTEND)
+        self._counts = self.redis.register_script(_REDIS_COUNTS)
+
+    async def put(self, payload: Dict[str, Any], delay: float = 0) -> str:
+        job_id = await self._put(keys=self.keys, args=[json.dumps(payload), delay])
+        return str(job_id)
+
+    async def get(self) -> Optional[Job]:
+        lease = uuid.uuid4().hex
+        result = await self._get(keys=self.keys, args=[lease, self.visibility_timeout, self.max_attempts])
+        if not result:
+            return None
+        job_id, payload, attempts = result
+        if isinstance(job_id, bytes):
+            job_id = job_id.decode()
+        return Job(str(job_id), json.loads(payload), int(attempts), lease)
+
+    async def ack(self, job: Job) -> bool:
+        return bool(await self._ack(keys=self.keys, args=[job.id, job.lease]))
+
+    async def fail(self, job: Job, delay: float = 0, payload: Optional[Dict[str, Any]] = None) -> bool:
+        data = json.dumps(payload) if payload is not None else ""
+        return bool(await self._fail(keys=self.keys, args=[job.id, job.lease, delay, self.max_attempts, data]))
+
+    async def extend(self, job: Job) -> bool:
+        return bool(await self._extend(keys=self.keys, args=[job.id, job.lease, self.visibility_timeout]))
+
+    async def counts(self) -> Dict[str, int]:
+        ready, delayed, dead = await self._counts(keys=self.keys)
+        return {"ready": int(ready), "delayed": int(delayed), "dead": int(dead)}
+
+    async def close(self):
+        await self.redis.aclose()
+
+def work_queue_from_config() -> Optional[WorkQueue]:
+    """The configured queue between front end and workers, or None to do all work in-process."""
+    options = dict(visibility_timeout=config.WORK_QUEUE_VISIBILITY_TIMEOUT, max_attempts=config.WORK_QUEUE_MAX_ATTEMPTS)
+    if config.WORK_QUEUE_BACKEND == "sqlite":
+        return SQLiteWorkQueue(config.WORK_QUEUE_PATH, **options)
+    if config.WORK_QUEUE_BACKEND == "redis":
+        return RedisWorkQueue(config.WORK_QUEUE_REDIS_URL, **options)
+    if config.WORK_QUEUE_BACKEND:
+        raise ValueError(f"Unknown WORK_QUEUE_BACKEND {config.WORK_QUEUE_BACKEND!r}")
+    return None
@@ -0,0 +1,217 @@
+import logging
+import os
+import struct
+from typing import Callable, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# Boxes on the path from moov to the chunk offset tables
+CONTAINERS = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+# moov is read into memory; anything bigger isn't a real-world MP4
+MAX_MOOV_SIZE = 64 * 1024 * 1024
+MAX_UINT32 = 0xFFFFFFFF
+
+class FaststartError(ValueError):
+    """The file isn't an MP4 we can rewrite. It hasn't been modified."""
+
+class TopLevelBox(NamedTuple):
+    type: bytes
+    offset: int
+    size: int
+
+class Box:
+    """A box inside moov: containers keep their children, everything else its raw payload."""
+
+    def __init__(self, type: bytes, payload: bytes = b"", children: Optional[List["Box"]] = None, large: bool = False):
+        self.type = type
+        self.payload = payload
+        self.children = children
+        # Written with a 64-bit size field in the source file
+        self.large = large
+
+    def body_size(self) -> int:
+        if self.children is None:
+            return len(self.payload)
+        return sum(child.size() for child in self.children)
+
+    def size(self) -> int:
+        size = 8 + self.body_size()
+        return size + 8 if self.large or size > MAX_UINT32 else size
+
+    def serialize(self) -> bytes:
+        size = self.size()
+        if size - self.body_size() == 16:
+            header = struct.pack(">I4sQ", 1, self.type, size)
+        else:
+            header = struct.pack(">I4s", size, self.type)
+        if self.children is None:
+            return header + self.payload
+        return header + b"".join(child.serialize() for child in self.children)
+
+    def walk(self):
+        yield self
+        for child in self.children or ():
+            yield from child.walk()
+
+class ChunkOffsets:
+    """An stco/co64 table, converted to co64 when an offset outgrows 32 bits."""
+
+    def __init__(self, box: Box):
+        self.box = box
+        if len(box.payload) < 8:
+            raise FaststartError(f"Truncated {box.type.decode()} table")
+        version_flags, count = struct.unpack(">4sI", box.payload[:8])
+        width = "Q" if box.type == b"co64" else "I"
+        if len(box.payload) < 8 + count * struct.calcsize(width):
+            raise FaststartError(f"Truncated {box.type.decode()} table")
+        self.version_flags = version_flags
+        self.offsets = list(struct.unpack(f">{count}{width}", box.payload[8:8 + count * struct.calcsize(width)]))
+
+    def convert_to_co64(self):
+        self.box.type = b"co64"
+        self.update(self.offsets)
+
+    def update(self, offsets: List[int]):
+        width = "Q" if self.box.type == b"co64" else "I"
+        self.box.payload = self.version_flags + struct.pack(f">I{len(offsets)}{width}", len(offsets), *offsets)
+
+def read_top_level(f, file_size: int) -> List[TopLevelBox]:
+    """List the top-level boxes of a file from their headers, without reading their contents."""
+    boxes = []
+    offset = 0
+    while offset < file_size:
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) < 8:
+            raise FaststartError(f"Truncated box header at {offset}")
+        size, box_type = struct.unpack(">I4s", header)
+        if size == 1:
+            large = f.read(8)
+            if len(large) < 8:
+                raise FaststartError(f"Truncated box header at {offset}")
+            size = struct.unpack(">Q", large)[0]
+        elif size == 0:
+            size = file_size - offset
+        if size < 8 or offset + size > file_size:
+            raise FaststartError(f"Invalid {box_type!r} box size {size} at {offset}")
+        boxes.append(TopLevelBox(box_type, offset, size))
+        offset += size
+    return boxes
+
+def parse_boxes(data: bytes, start: int = 0, end: Optional[int] = None) -> List[Box]:
+    end = len(data) if end is None else end
+    boxes = []
+    offset = start
+    while offset < end:
+        if end - offset < 8:
+            raise FaststartError("Truncated box inside moov")
+        size, box_type = struct.unpack_from(">I4s", data, offset)
+        header_size = 8
+        if size == 1:
+            if end - offset < 16:
+                raise FaststartError("Truncated box inside moov")
+            size = struct.unpack_from(">Q", data, offset + 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size or offset + size > end:
+            raise FaststartError(f"Invalid {box_type!r} box size {size} inside moov")
+        body_start, body_end = offset + header_size, offset + size
+        if box_type in CONTAINERS:
+            box = Box(box_type, children=parse_boxes(data, body_start, body_end), large=header_size == 16)
+        else:
+            box = Box(box_type, payload=data[body_start:body_end], large=header_size == 16)
+        boxes.append(box)
+        offset += size
+    return boxes
+
+def _move_up(f, start: int, length: int, shift: int, buffer: bytearray):
+    """Move [start, start + length) shift bytes towards the end of the file, last chunk first."""
+    view = memoryview(buffer)
+    remaining = length
+    while remaining > 0:
+        n = min(len(buffer), remaining)
+        remaining -= n
+        f.seek(start + remaining)
+        if f.readinto(view[:n]) != n:
+            raise OSError(f"Short read at {start + remaining}")
+        f.seek(start + remaining + shift)
+        f.write(view[:n])
+
+def faststart(path: str, chunk_size: int = 8 * 1024 * 1024) -> bool:
+    """
+    Move the moov box of an MP4 in front of its media data, in place, so players
+    can start before the whole file has arrived. Returns False if moov already
+    comes first. Only moov is read into memory; the media data is shifted back
+    to front in chunk_size pieces, so no second copy of the file is needed.
+    stco tables whose offsets no longer fit in 32 bits are rewritten as co64.
+
+    FaststartError means nothing was changed. An OSError during the move leaves
+    the file unusable.
+    """
+    file_size = os.path.getsize(path)
+    with open(path, "r+b") as f:
+        top = read_top_level(f, file_size)
+        types = [box.type for box in top]
+        if b"moov" not in types or b"mdat" not in types:
+            raise FaststartError("Not an MP4 file with moov and mdat boxes")
+        if b"moof" in types:
+            raise FaststartError("Fragmented MP4s are streamable already")
+        moov_entry = top[types.index(b"moov")]
+        first_mdat = top[types.index(b"mdat")]
+        if moov_entry.offset < first_mdat.offset:
+            return False
+        if moov_entry.size > MAX_MOOV_SIZE:
+            raise FaststartError(f"moov box of {moov_entry.size} bytes is too large")
+
+        f.seek(moov_entry.offset)
+        moov_data = f.read(moov_entry.size)
+        (moov,) = parse_boxes(moov_data)
+        tables = [ChunkOffsets(box) for box in moov.walk() if box.type in (b"stco", b"co64")]
+
+        # New layout: [head][moov][head end .. old moov][old moov end .. EOF]
+        insert_at = first_mdat.offset
+        moov_end = moov_entry.offset + moov_entry.size
+
+        def relocate(shift_before: int, shift_after: int) -> Callable[[int], int]:
+            def new_offset(offset: int) -> int:
+                if insert_at <= offset < moov_entry.offset:
+                    return offset + shift_before
+                if offset >= moov_end:
+                    return offset + shift_after
+                if offset < insert_at:
+                    return offset
+                raise FaststartError(f"Chunk offset {offset} points into moov")
+            return new_offset
+
+        # The new moov grows if a table has to become co64, which moves the data further
+        while True:
+            new_size = moov.size()
+            new_offset = relocate(new_size, new_size - moov_entry.size)
+            overflowing = [
+                table for table in tables
+                if table.box.type == b"stco" and any(new_offset(o) > MAX_UINT32 for o in table.offsets)
+            ]
+            if not overflowing:
+                break
+            for table in overflowing:
+                table.convert_to_co64()
+        for table in tables:
+            table.update([new_offset(o) for o in table.offsets])
+        new_moov = moov.serialize()
+        shift = len(new_moov)
+        if shift < moov_entry.size:
+            # Rewriting only ever grows moov; a shrink means we misparsed it
+            raise FaststartError("Rewritten moov is smaller than the original")
+
+        buffer = bytearray(chunk_size)
+        # Whatever follows moov moves by its growth, then the media data by the full moov size
+        tail = file_size - moov_end
+        if tail and shift > moov_entry.size:
+            _move_up(f, moov_end, tail, shift - moov_entry.size, buffer)
+        _move_up(f, insert_at, moov_entry.offset - insert_at, shift, buffer)
+        f.seek(insert_at)
+        f.write(new_moov)
+        f.truncate(file_size + shift - moov_entry.size)
+    logger.debug(f"Moved moov ({shift} bytes) of {path} to offset {insert_at}")
+    return True
@@ -0,0 +1,106 @@
+import asyncio
+from io import BytesIO
+from typing import List, Optional, Sequence, TypeVar
+
+import httpx
+
+from app.core.http import http_pool
+
+T = TypeVar("T")
+
+# Telegram's limits: 2-10 items per media group, 10 MB per uploaded photo
+MAX_GROUP_SIZE = 10
+PHOTO_UPLOAD_LIMIT = 10 * 1024 * 1024
+
+class PhotoDownloadError(Exception):
+    pass
+
+def split_groups(items: Sequence[T], max_size: int = MAX_GROUP_SIZE) -> List[List[T]]:
+    """
+    Split an album into as few media groups as possible, with sizes as even as
+    possible: 11 photos become 6 + 5 rather than 10 + a group of one, which
+    sendMediaGroup would reject.
+    """
+    if not items:
+        return []
+    count = -(-len(items) // max_size)
+    size, extra = divmod(len(items), count)
+    groups, start = [], 0
+    for i in range(count):
+        end = start + size + (1 if i < extra else 0)
+        groups.append(list(items[start:end]))
+        start = end
+    return groups
+
+def original_photo_url(url: str) -> str:
+    """The full-size variant of a twimg photo URL."""
+    if "format=" in url:
+        return url
+    return url + ("&name=orig" if "?" in url else "?name=orig")
+
+class PhotoDownloader:
+    """
+    Downloads an album into memory so it can be uploaded when Telegram can't
+    fetch the URLs itself. All photos of an album are fetched at once, so an
+    album takes about as long as its slowest photo. An album may hold at most
+    max_album_bytes and only `concurrency` albums are buffered at a time, which
+    bounds the memory used to concurrency * max_album_bytes.
+    """
+
+    def __init__(
+        self,
+        client: Optional[httpx.AsyncClient] = None,
+        max_album_bytes: int = 50 * 1024 * 1024,
+        max_photo_bytes: int = PHOTO_UPLOAD_LIMIT,
+        concurrency: int = 4,
+        timeout: float = 30.0,
+    ):
+        self._client = client
+        self.max_album_bytes = max_album_bytes
+        self.max_photo_bytes = max_photo_bytes
+        self.timeout = timeout
+        self._slots = asyncio.Semaphore(concurrency)
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return self._client if self._client is not None else http_pool.client
+
+    async def download(self, urls: Sequence[str]) -> List[BytesIO]:
+        """Fetch every URL concurrently; any failure cancels the rest and raises."""
+        async with self._slots:
+            budget = [self.max_album_bytes]
+            tasks = [asyncio.ensure_future(self._fetch(url, budget)) for url in urls]
+            try:
+                return await asyncio.gather(*tasks)
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+    async def _fetch(self, url: str, budget: List[int]) -> BytesIO:
+        buffer = BytesIO()
+        try:
+            async with self.client.stream("GET", url, timeout=self.timeout) as response:
+                response.raise_for_status()
+                reserved = 0
+                if "content-length" in response.headers:
+                    reserved = self._reserve(url, int(response.headers["content-length"]), reserved, budget)
+                async for chunk in response.aiter_bytes():
+                    buffer.write(chunk)
+                    if buffer.tell() > reserved:
+                        # No or a wrong Content-Length: charge the budget as the data arrives
+                        reserved = self._reserve(url, buffer.tell(), reserved, budget)
+        except httpx.HTTPError as e:
+            raise PhotoDownloadError(f"Couldn't download {url}: {e}") from e
+        buffer.seek(0)
+        # Upload as a .jpg like the original; the extension only matters for the MIME type guess
+        buffer.name = "photo.jpg"
+        return buffer
+
+    def _reserve(self, url: str, size: int, reserved: int, budget: List[int]) -> int:
+        """Charge a photo now known to be `size` bytes to the album budget; returns the new charge."""
+        if size > self.max_photo_bytes:
+            raise PhotoDownloadError(f"{url} is larger than {self.max_photo_bytes} bytes")
+        if size - reserved > budget[0]:
+            raise PhotoDownloadError(f"Album is larger than {self.max_album_bytes} bytes")
+        budget[0] -= size - reserved
+        return size
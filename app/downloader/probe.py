@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import re
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+import httpx
+
+from app.core.cache import TTLCache
+from app.core.http import http_pool
+
+logger = logging.getLogger(__name__)
+
+CONTENT_RANGE_TOTAL_PATTERN = re.compile(r"bytes\s+\d+-\d+/(\d+)")
+
+# How a video should be delivered to Telegram
+SEND_BY_URL = "url"
+SEND_BY_UPLOAD = "upload"
+TOO_LARGE = "too_large"
+
+# Probe results that failed are cached as this, separately from "not probed yet"
+_UNKNOWN = -1
+
+class VideoPlan(NamedTuple):
+    url: str
+    size: Optional[int]
+    method: str
+
+class MediaProber:
+    """
+    Learns media sizes with HEAD (or a one-byte ranged GET when HEAD is unhelpful)
+    and picks the send path and video variant before anything is sent.
+    """
+
+    def __init__(
+        self,
+        client: Optional[httpx.AsyncClient] = None,
+        cache_size: int = 4096,
+        ttl: float = 3600.0,
+        unknown_ttl: float = 60.0,
+        timeout: float = 10.0,
+    ):
+        self._client = client
+        self.cache = TTLCache(maxsize=cache_size, ttl=ttl)
+        self.unknown_ttl = unknown_ttl
+        self.timeout = timeout
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return self._client if self._client is not None else http_pool.client
+
+    async def content_length(self, url: str) -> Optional[int]:
+        cached = self.cache.get(url)
+        if cached is not None:
+            return None if cached == _UNKNOWN else cached
+
+        size = None
+        try:
+            size = await self._probe(url)
+        except Exception as e:
+            logger.warning(f"Failed to probe size of {url}: {e}")
+        if size is None:
+            self.cache.set(url, _UNKNOWN, ttl=self.unknown_ttl)
+        else:
+            self.cache.set(url, size)
+        return size
+
+    async def _probe(self, url: str) -> Optional[int]:
+        response = await self.client.head(url, timeout=self.timeout)
+        if response.status_code < 400 and "content-length" in response.headers:
+            return int(response.headers["content-length"])
+
+        async with self.client.stream(
+            "GET", url, headers={"Range": "bytes=0-0"}, timeout=self.timeout
+        ) as response:
+            response.raise_for_status()
+            match = CONTENT_RANGE_TOTAL_PATTERN.match(response.headers.get("content-range", ""))
+            if response.status_code == 206 and match:
+                return int(match.group(1))
+            if "content-length" in response.headers:
+                return int(response.headers["content-length"])
+        return None
+
+    async def probe_many(self, urls: Iterable[str]) -> Dict[str, Optional[int]]:
+        urls = list(dict.fromkeys(urls))
+        sizes = await asyncio.gather(*(self.content_length(url) for url in urls))
+        return dict(zip(urls, sizes))
+
+    async def probe_media(self, media_list: List[Dict[str, Any]]):
+        """Warm the cache for every video variant of a tweet."""
+        await self.probe_many(
+            url for video in media_list if video.get("type") == "video"
+            for url in video_candidates(video)
+        )
+
+    async def plan_video(self, video: Dict[str, Any], url_limit: int, upload_limit: int) -> VideoPlan:
+        """
+        Pick the best variant that can be delivered at all and how to deliver it:
+        by URL when Telegram can fetch it itself, otherwise by uploading it.
+        """
+        candidates = video_candidates(video)
+        sizes = await self.probe_many(candidates)
+        for url in candidates:
+            size = sizes[url]
+            if size is None:
+                # Unknown size: let Telegram try the URL and fall back as before
+                return VideoPlan(url, None, SEND_BY_URL)
+            if size <= url_limit:
+                return VideoPlan(url, size, SEND_BY_URL)
+            if size <= upload_limit:
+                return VideoPlan(url, size, SEND_BY_UPLOAD)
+        return VideoPlan(candidates[-1], sizes[candidates[-1]], TOO_LARGE)
+
+def video_candidates(video: Dict[str, Any]) -> List[str]:
+    """Video URLs of a media item, best bitrate first."""
+    variants = [
+        v for v in video.get("variants") or []
+        if v.get("url") and v.get("content_type", "video/mp4") == "video/mp4"
+    ]
+    variants.sort(key=lambda v: v.get("bitrate") or 0, reverse=True)
+    urls = [video["url"]] + [v["url"] for v in variants]
+    return list(dict.fromkeys(urls))
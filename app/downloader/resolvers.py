@@ -0,0 +1,271 @@
+import asyncio
+import html
+import logging
+import re
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Any, Dict, List, Optional, Sequence
+
+import httpx
+
+from app.core.config import config
+from app.core.metrics import tweet_backend_requests, tweet_hedges
+
+logger = logging.getLogger(__name__)
+
+class BackendError(Exception):
+    pass
+
+class TweetNotFound(BackendError):
+    """The backend answered and the tweet doesn't exist or is private."""
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures and rejects calls for
+    reset_timeout seconds, then lets a single trial call through (half-open).
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._trial_running:
+            self._trial_running = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial_running or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self._trial_running = False
+
+    def release(self):
+        """The call was abandoned (e.g. lost a hedge race) without a verdict."""
+        self._trial_running = False
+
+class TweetBackend(ABC):
+    """
+    A tweet metadata API. fetch() returns media in vxtwitter's media_extended
+    shape: dicts with type (image/video/gif), url, thumbnail_url, size
+    {width, height}, duration_millis and, for videos, mp4 variants.
+    """
+
+    name = ""
+
+    def __init__(self, base_url: str, timeout: float = 10.0, breaker: Optional[CircuitBreaker] = None):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+        # Recent successful latencies, used to decide when to hedge
+        self.latencies: deque = deque(maxlen=200)
+
+    def latency_percentile(self, q: float) -> Optional[float]:
+        if len(self.latencies) < 10:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    @abstractmethod
+    async def fetch(self, client: httpx.AsyncClient, tweet_id: str) -> List[Dict[str, Any]]:
+        ...
+
+    async def _get_json(self, client: httpx.AsyncClient, url: str) -> Any:
+        try:
+            response = await client.get(url, timeout=self.timeout)
+        except httpx.HTTPError as e:
+            raise BackendError(f"{type(e).__name__}: {e}")
+        if response.status_code == 404:
+            raise TweetNotFound("Tweet not found or is private.")
+        if response.status_code >= 400:
+            # Try to extract error message from og:description if possible
+            match = re.search(r'<meta content="(.*?)" property="og:description" />', response.text)
+            if match:
+                raise BackendError(f"API Error: {html.unescape(match.group(1))}")
+            raise BackendError(f"HTTP Error {response.status_code}")
+        try:
+            return response.json()
+        except ValueError:
+            raise BackendError("Invalid JSON response")
+
+class VxTwitterBackend(TweetBackend):
+    name = "vxtwitter"
+
+    async def fetch(self, client: httpx.AsyncClient, tweet_id: str) -> List[Dict[str, Any]]:
+        data = await self._get_json(client, f"{self.base_url}/Twitter/status/{tweet_id}")
+        return data.get("media_extended", [])
+
+class FxTwitterBackend(TweetBackend):
+    name = "fxtwitter"
+
+    TYPES = {"photo": "image", "video": "video", "gif": "gif"}
+
+    async def fetch(self, client: httpx.AsyncClient, tweet_id: str) -> List[Dict[str, Any]]:
+        data = await self._get_json(client, f"{self.base_url}/status/{tweet_id}")
+        if data.get("code") == 404:
+            raise TweetNotFound("Tweet not found or is private.")
+        tweet = data.get("tweet")
+        if not isinstance(tweet, dict):
+            raise BackendError(f"API Error: {data.get('message', 'no tweet in response')}")
+        return [self.normalise(item) for item in (tweet.get("media") or {}).get("all", [])]
+
+    @classmethod
+    def normalise(cls, item: Dict[str, Any]) -> Dict[str, Any]:
+        media_type = cls.TYPES.get(item.get("type"), item.get("type"))
+        duration = item.get("duration")
+        return {
+            "type": media_type,
+            "url": item.get("url"),
+            "thumbnail_url": item.get("thumbnail_url") or (item.get("url") if media_type == "image" else None),
+            "size": {"width": item.get("width"), "height": item.get("height")},
+            "duration_millis": int(duration * 1000) if duration else None,
+            "altText": item.get("altText"),
+            "variants": [
+                {"content_type": v.get("content_type"), "bitrate": v.get("bitrate"), "url": v.get("url")}
+                for v in item.get("variants") or []
+            ],
+        }
+
+BACKENDS = {
+    VxTwitterBackend.name: VxTwitterBackend,
+    FxTwitterBackend.name: FxTwitterBackend,
+}
+
+class TweetResolver:
+    """
+    Resolves tweet media through several backends in preference order.
+
+    The first healthy backend is asked first. If it hasn't answered after its
+    recent hedge_percentile latency (clamped to min/max delay), the next backend
+    is asked as well and whichever answers first wins. A failure starts the next
+    backend right away. Backends whose circuit breaker is open are skipped.
+    """
+
+    def __init__(
+        self,
+        backends: Sequence[TweetBackend],
+        hedge_percentile: float = 0.9,
+        min_hedge_delay: float = 0.25,
+        max_hedge_delay: float = 2.0,
+    ):
+        if not backends:
+            raise ValueError("At least one tweet backend is required")
+        self.backends = list(backends)
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay
+        self.max_hedge_delay = max_hedge_delay
+
+    @classmethod
+    def from_config(cls) -> "TweetResolver":
+        base_urls = {
+            VxTwitterBackend.name: config.VXTWITTER_API_URL,
+            FxTwitterBackend.name: config.FXTWITTER_API_URL,
+        }
+        backends = []
+        for name in config.TWEET_BACKENDS:
+            if name not in BACKENDS:
+                logger.warning(f"Unknown tweet backend {name!r}, ignoring it")
+                continue
+            breaker = CircuitBreaker(config.TWEET_BREAKER_FAILURES, config.TWEET_BREAKER_RESET)
+            backends.append(BACKENDS[name](base_urls[name], timeout=config.TWEET_BACKEND_TIMEOUT, breaker=breaker))
+        return cls(
+            backends,
+            hedge_percentile=config.TWEET_HEDGE_PERCENTILE,
+            min_hedge_delay=config.TWEET_HEDGE_MIN_DELAY,
+            max_hedge_delay=config.TWEET_HEDGE_MAX_DELAY,
+        )
+
+    def hedge_delay(self, backend: TweetBackend) -> float:
+        delay = backend.latency_percentile(self.hedge_percentile)
+        if delay is None:
+            return self.max_hedge_delay
+        return min(max(delay, self.min_hedge_delay), self.max_hedge_delay)
+
+    async def _attempt(self, backend: TweetBackend, client: httpx.AsyncClient, tweet_id: str):
+        started = time.monotonic()
+        try:
+            media = await backend.fetch(client, tweet_id)
+        except asyncio.CancelledError:
+            backend.breaker.release()
+            tweet_backend_requests.inc(backend=backend.name, result="cancelled")
+            raise
+        except TweetNotFound:
+            # A definitive answer: the backend itself is healthy
+            backend.breaker.record_success()
+            tweet_backend_requests.inc(backend=backend.name, result="not_found")
+            raise
+        except Exception as e:
+            backend.breaker.record_failure()
+            tweet_backend_requests.inc(backend=backend.name, result="error")
+            logger.warning(f"Tweet backend {backend.name} failed for {tweet_id}: {e}")
+            raise
+        backend.breaker.record_success()
+        backend.latencies.append(time.monotonic() - started)
+        tweet_backend_requests.inc(backend=backend.name, result="ok")
+        return media
+
+    async def resolve(self, client: httpx.AsyncClient, tweet_id: str) -> List[Dict[str, Any]]:
+        queue = [b for b in self.backends if b.breaker.allow()]
+        if not queue:
+            raise BackendError("All tweet backends are temporarily unavailable")
+
+        pending: Dict[asyncio.Future, TweetBackend] = {}
+        last_error: Optional[Exception] = None
+
+        def launch():
+            backend = queue.pop(0)
+            pending[asyncio.ensure_future(self._attempt(backend, client, tweet_id))] = backend
+            return backend
+
+        current = launch()
+        try:
+            while pending:
+                timeout = self.hedge_delay(current) if queue else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    tweet_hedges.inc()
+                    logger.info(f"Tweet backend {current.name} slow for {tweet_id}, hedging")
+                    current = launch()
+                    continue
+                # Retrieve the outcome of every finished task before acting on
+                # any, or the ones left over are logged as never retrieved
+                outcomes = [(task, task.exception()) for task in done]
+                for task, error in outcomes:
+                    pending.pop(task)
+                for task, error in outcomes:
+                    if error is None:
+                        return task.result()
+                for task, error in outcomes:
+                    if isinstance(error, TweetNotFound):
+                        raise error
+                    last_error = error
+                    if queue:
+                        current = launch()
+            raise last_error or BackendError("No tweet backend answered")
+        finally:
+            for task in pending:
+                task.cancel()
+            # Backends that were allowed but never asked keep their trial call
+            for backend in queue:
+                backend.breaker.release()
@@ -0,0 +1,159 @@
+import asyncio
+import json
+import logging
+import os
+import re
+from typing import List, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+CONTENT_RANGE_PATTERN = re.compile(r"bytes\s+(\d+)-(\d+)/(\d+)")
+
+class SegmentedDownloadError(Exception):
+    pass
+
+class SegmentedDownloader:
+    """
+    Download a file with parallel HTTP Range requests into a preallocated file.
+
+    Progress is kept in a "<path>.parts" JSON file next to the download, so after a
+    failure only the missing byte ranges are fetched again, both by the built-in
+    retries and by a later download() call for the same URL and path. Servers that
+    don't answer Range requests with 206 are read with a single plain stream.
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        segments: int = 4,
+        min_segment_size: int = 4 * 1024 * 1024,
+        retries: int = 3,
+        timeout: Optional[httpx.Timeout] = None,
+    ):
+        self.client = client
+        self.segments = max(1, segments)
+        self.min_segment_size = min_segment_size
+        self.retries = retries
+        self.timeout = timeout
+
+    def _request_kwargs(self) -> dict:
+        return {"timeout": self.timeout} if self.timeout is not None else {}
+
+    async def download(self, url: str, path: str) -> int:
+        """Download url to path and return the number of bytes written."""
+        state_path = f"{path}.parts"
+        async with self.client.stream(
+            "GET", url, headers={"Range": "bytes=0-0"}, **self._request_kwargs()
+        ) as response:
+            response.raise_for_status()
+            match = CONTENT_RANGE_PATTERN.match(response.headers.get("content-range", ""))
+            if response.status_code != 206 or not match:
+                # No range support: this response already carries the whole body
+                logger.info(f"Server ignored Range request, streaming {url} in one piece")
+                return await self._write_stream(response, path)
+            await response.aread()
+            total = int(match.group(3))
+            validator = response.headers.get("etag") or response.headers.get("last-modified")
+
+        state = self._load_state(state_path, url, total, validator)
+        if state is None or not os.path.exists(path):
+            state = {
+                "url": url,
+                "size": total,
+                "validator": validator,
+                "segments": self._plan(total),
+            }
+            with open(path, "wb") as f:
+                f.truncate(total)
+            self._save_state(state_path, state)
+
+        for attempt in range(self.retries + 1):
+            missing = self._missing(state)
+            if not missing:
+                break
+            if attempt:
+                logger.warning(f"Resuming {len(missing)} incomplete range(s) of {url} (attempt {attempt + 1})")
+                await asyncio.sleep(min(2 ** attempt, 10))
+            results = await asyncio.gather(
+                *(self._fetch_segment(url, path, segment, validator) for segment in missing),
+                return_exceptions=True,
+            )
+            self._save_state(state_path, state)
+            errors = [r for r in results if isinstance(r, BaseException)]
+            for error in errors:
+                if isinstance(error, asyncio.CancelledError):
+                    raise error
+                logger.warning(f"Range download of {url} failed: {error!r}")
+        # The last attempt may have fetched everything that was left
+        if self._missing(state):
+            raise SegmentedDownloadError(f"Failed to download {url} after {self.retries + 1} attempts")
+
+        os.remove(state_path)
+        return total
+
+    @staticmethod
+    def _missing(state: dict) -> List[List[int]]:
+        return [s for s in state["segments"] if s[2] < s[1] - s[0] + 1]
+
+    def _plan(self, total: int) -> List[List[int]]:
+        """Split [0, total) into [start, end, done] segments (end inclusive)."""
+        count = max(1, min(self.segments, total // max(1, self.min_segment_size)))
+        size = max(1, -(-total // count))
+        return [
+            [start, min(start + size, total) - 1, 0]
+            for start in range(0, total, size)
+        ]
+
+    async def _fetch_segment(self, url: str, path: str, segment: List[int], validator: Optional[str]):
+        start, end, done = segment
+        headers = {"Range": f"bytes={start + done}-{end}"}
+        if validator:
+            # Don't stitch ranges from a file that changed under us
+            headers["If-Range"] = validator
+        async with self.client.stream("GET", url, headers=headers, **self._request_kwargs()) as response:
+            response.raise_for_status()
+            if response.status_code != 206:
+                raise SegmentedDownloadError(
+                    f"Expected 206 for range {start + done}-{end}, got {response.status_code}"
+                )
+            with open(path, "r+b") as f:
+                f.seek(start + done)
+                async for chunk in response.aiter_bytes():
+                    remaining = end - start + 1 - segment[2]
+                    if len(chunk) > remaining:
+                        chunk = chunk[:remaining]
+                    f.write(chunk)
+                    segment[2] += len(chunk)
+                    if segment[2] >= end - start + 1:
+                        break
+        if segment[2] < end - start + 1:
+            raise SegmentedDownloadError(f"Range {start}-{end} ended early at {start + segment[2]}")
+
+    @staticmethod
+    async def _write_stream(response: httpx.Response, path: str) -> int:
+        written = 0
+        with open(path, "wb") as f:
+            async for chunk in response.aiter_bytes():
+                f.write(chunk)
+                written += len(chunk)
+        return written
+
+    @staticmethod
+    def _load_state(state_path: str, url: str, total: int, validator: Optional[str]) -> Optional[dict]:
+        try:
+            with open(state_path, "r") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if state.get("url") != url or state.get("size") != total or state.get("validator") != validator:
+            return None
+        return state
+
+    @staticmethod
+    def _save_state(state_path: str, state: dict):
+        tmp_path = f"{state_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, state_path)
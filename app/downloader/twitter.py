@@ -1,23 +1,35 @@
+import asyncio
 import httpx
 import re
-import html
 import logging
 from typing import List, Dict, Any, Optional
 
+from app.core.cache import TTLCache
+from app.core.config import config
+from app.core.http import http_pool
+from app.core.metrics import stage_latency, tweet_cache
+from app.core.tracing import span
+from app.downloader.resolvers import BackendError, TweetNotFound, TweetResolver
+
 logger = logging.getLogger(__name__)
 
 class TwitterAPIError(Exception):
     pass
 
+class TweetNotFoundError(TwitterAPIError):
+    """The tweet doesn't exist or isn't public; retrying won't help."""
+
 class TwitterDownloader:
-    def __init__(self):
-        self.client = httpx.AsyncClient(
-            timeout=30.0,
-            follow_redirects=True,
-            headers={
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-            }
-        )
+    def __init__(self, client: Optional[httpx.AsyncClient] = None, resolver: Optional[TweetResolver] = None):
+        # Uses the shared connection pool unless a dedicated client is given
+        self._client = client
+        # vxtwitter/fxtwitter/... with hedging and circuit breakers
+        self.resolver = resolver or TweetResolver.from_config()
+        # Parsed media lists (or not-found errors) keyed by tweet id
+        self.cache = TTLCache(maxsize=config.TWEET_CACHE_SIZE, ttl=config.TWEET_CACHE_TTL)
+        # Upstream lookups currently running, shared by concurrent callers
+        self._inflight: Dict[str, asyncio.Future] = {}
+
         # Enhanced regex for twitter.com and x.com
         self.url_pattern = re.compile(
             r"(?:https?://)?(?:www\.)?(?:twitter\.com|x\.com)/[^/]+/status/(\d+)(?:\S*)",
@@ -28,6 +40,10 @@ class TwitterDownloader:
             re.IGNORECASE
         )
 
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return self._client if self._client is not None else http_pool.client
+
     def extract_tweet_ids(self, text: str) -> List[str]:
         ids = self.url_pattern.findall(text)
         return list(dict.fromkeys(ids))  # Deduplicate
@@ -40,34 +56,60 @@ class TwitterDownloader:
 
     async def get_tweet_media(self, tweet_id: str) -> List[Dict[str, Any]]:
         """
-        Fetch tweet media information using vxtwitter API (JSON).
+        Fetch tweet media information, served from the cache when possible.
+        Concurrent lookups of the same tweet share a single upstream request.
+        """
+        with span('api_fetch', tweet_id=tweet_id) as attrs:
+            cached = self.cache.get(tweet_id)
+            if cached is not None:
+                tweet_cache.inc(result='hit')
+                attrs['cache'] = 'hit'
+                if isinstance(cached, TwitterAPIError):
+                    raise type(cached)(str(cached))
+                return cached
+
+            task = self._inflight.get(tweet_id)
+            if task is not None:
+                tweet_cache.inc(result='coalesced')
+                attrs['cache'] = 'coalesced'
+            else:
+                tweet_cache.inc(result='miss')
+                attrs['cache'] = 'miss'
+                task = asyncio.ensure_future(self._fetch_tweet_media(tweet_id))
+                self._inflight[tweet_id] = task
+                task.add_done_callback(lambda t: self._lookup_done(tweet_id, t))
+
+            # Shield so one cancelled caller doesn't abort the lookup for the others
+            return await asyncio.shield(task)
+
+    def _lookup_done(self, tweet_id: str, task: asyncio.Future):
+        if self._inflight.get(tweet_id) is task:
+            del self._inflight[tweet_id]
+        if not task.cancelled():
+            # Mark the exception as retrieved even if every caller went away
+            task.exception()
+
+    async def _fetch_tweet_media(self, tweet_id: str) -> List[Dict[str, Any]]:
+        """
+        Fetch tweet media information (media_extended items) from the backends.
         """
-        api_url = f"https://api.vxtwitter.com/Twitter/status/{tweet_id}"
-        
         try:
-            response = await self.client.get(api_url)
-            response.raise_for_status()
-            
-            data = response.json()
-            if 'media_extended' in data:
-                return data['media_extended']
-            
-            return []
-            
-        except httpx.HTTPStatusError as e:
-            # Try to extract error message from og:description if possible
-            if e.response.status_code == 404:
-                raise TwitterAPIError("Tweet not found or is private.")
-            
-            content = e.response.text
-            match = re.search(r'<meta content="(.*?)" property="og:description" />', content)
-            if match:
-                raise TwitterAPIError(f"API Error: {html.unescape(match.group(1))}")
+            with stage_latency.time(stage='api_fetch'):
+                media = await self.resolver.resolve(self.client, tweet_id)
+            self.cache.set(tweet_id, media)
+            return media
             
-            raise TwitterAPIError(f"HTTP Error {e.response.status_code}")
+        except TweetNotFound as e:
+            error = TweetNotFoundError(str(e))
+            self.cache.set(tweet_id, error, ttl=config.TWEET_NEGATIVE_CACHE_TTL)
+            raise error
+        except BackendError as e:
+            raise TwitterAPIError(str(e))
         except Exception as e:
             logger.error(f"Error fetching tweet {tweet_id}: {str(e)}")
             raise TwitterAPIError(f"Unexpected error: {str(e)}")
 
     async def close(self):
-        await self.client.aclose()
+        # The shared pool is closed by its owner
+        if self._client is not None:
+            await self._client.aclose()
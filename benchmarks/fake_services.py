@@ -0,0 +1,642 @@
+"""
+Local stand-ins for the services the bot talks to, built on app.core.http_server.
+Each one can inject latency and failures so resolvers and pipelines can be
+exercised without touching the real APIs.
+"""
+import asyncio
+import itertools
+import json
+import random
+import time
+from email import policy
+from email.parser import BytesParser
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, parse_qsl, urlsplit
+
+import httpx
+
+from app.core.http_server import HttpServer, Request, Response
+
+# Request bodies above this are streamed and only their start is kept
+BODY_KEEP_BYTES = 1024 * 1024
+
+def sample_media(tweet_id: str, base_url: str = "https://video.twimg.com") -> List[dict]:
+    """One photo and one video in vxtwitter's media_extended shape."""
+    return [
+        {
+            "type": "image",
+            "url": f"https://pbs.twimg.com/media/{tweet_id}.jpg",
+            "thumbnail_url": f"https://pbs.twimg.com/media/{tweet_id}.jpg",
+            "size": {"width": 1200, "height": 675},
+        },
+        {
+            "type": "video",
+            "url": f"{base_url}/ext_tw_video/{tweet_id}/vid/1280x720/video.mp4",
+            "thumbnail_url": f"https://pbs.twimg.com/ext_tw_video_thumb/{tweet_id}/img/thumb.jpg",
+            "size": {"width": 1280, "height": 720},
+            "duration_millis": 12000,
+        },
+    ]
+
+def cdn_media_factory(cdn_url: str, photos: int = 1, video_bytes: int = 0) -> Callable[[str], List[dict]]:
+    """Media lists whose photos and video live on a FakeCdn."""
+    def factory(tweet_id: str) -> List[dict]:
+        media = [
+            {
+                "type": "image",
+                "url": f"{cdn_url}/photo/{tweet_id}_{i}.jpg",
+                "thumbnail_url": f"{cdn_url}/photo/{tweet_id}_{i}.jpg",
+                "size": {"width": 1200, "height": 675},
+            }
+            for i in range(photos)
+        ]
+        if video_bytes:
+            media.append({
+                "type": "video",
+                "url": f"{cdn_url}/video/{video_bytes}/{tweet_id}/1280x720/video.mp4",
+                "thumbnail_url": f"{cdn_url}/photo/{tweet_id}_thumb.jpg",
+                "size": {"width": 1280, "height": 720},
+                "duration_millis": 12000,
+            })
+        return media
+    return factory
+
+class FaultInjector:
+    """
+    Latency is a base delay plus, with slow_rate probability, slow_delay extra.
+    Failures answer with failure_status; a status of 0 drops the connection.
+    """
+
+    def __init__(self, latency: float = 0.0, slow_rate: float = 0.0, slow_delay: float = 0.0,
+                 failure_rate: float = 0.0, failure_status: int = 500, seed: Optional[int] = None):
+        self.latency = latency
+        self.slow_rate = slow_rate
+        self.slow_delay = slow_delay
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.random = random.Random(seed)
+        self.requests = 0
+
+    async def delay(self):
+        self.requests += 1
+        delay = self.latency
+        if self.slow_rate and self.random.random() < self.slow_rate:
+            delay += self.slow_delay
+        if delay:
+            await asyncio.sleep(delay)
+
+    def failure(self) -> Optional[Response]:
+        if self.failure_rate and self.random.random() < self.failure_rate:
+            if self.failure_status == 0:
+                raise ConnectionResetError("injected connection drop")
+            return Response(self.failure_status, b"injected failure")
+        return None
+
+class FakeTweetBackend:
+    """
+    vxtwitter- or fxtwitter-compatible JSON API. Tweet ids listed in missing
+    answer 404; everything else gets media_factory(tweet_id).
+    """
+
+    def __init__(self, kind: str = "vxtwitter", faults: Optional[FaultInjector] = None,
+                 media_factory: Callable[[str], List[dict]] = sample_media,
+                 missing: Optional[set] = None, host: str = "127.0.0.1", port: int = 0):
+        self.kind = kind
+        self.faults = faults or FaultInjector()
+        self.media_factory = media_factory
+        self.missing = missing or set()
+        self.server = HttpServer(host, port)
+        self.server._dispatch = self._dispatch
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.server.host}:{self.server.bound_port}"
+
+    async def start(self):
+        await self.server.start()
+        return self
+
+    async def stop(self):
+        await self.server.stop()
+
+    async def _dispatch(self, request: Request) -> Response:
+        await self.faults.delay()
+        failure = self.faults.failure()
+        if failure is not None:
+            return failure
+        tweet_id = request.path.rstrip("/").rsplit("/", 1)[-1]
+        if tweet_id in self.missing:
+            if self.kind == "fxtwitter":
+                return self._json({"code": 404, "message": "NOT_FOUND"}, 404)
+            return Response(404, b"Not Found")
+        media = self.media_factory(tweet_id)
+        if self.kind == "fxtwitter":
+            return self._json({"code": 200, "message": "OK", "tweet": {"id": tweet_id, "media": {"all": [
+                self._to_fx(m) for m in media
+            ]}}})
+        return self._json({"tweetID": tweet_id, "media_extended": media})
+
+    @staticmethod
+    def _to_fx(media: dict) -> dict:
+        item = {
+            "type": {"image": "photo"}.get(media["type"], media["type"]),
+            "url": media["url"],
+            "thumbnail_url": media.get("thumbnail_url"),
+            "width": media.get("size", {}).get("width"),
+            "height": media.get("size", {}).get("height"),
+        }
+        if media.get("duration_millis"):
+            item["duration"] = media["duration_millis"] / 1000
+        return item
+
+    @staticmethod
+    def _json(data, status: int = 200) -> Response:
+        return Response(status, json.dumps(data).encode(), "application/json")
+
+class FakeCdn:
+    """
+    Media CDN serving generated bytes: /photo/<name> (photo_size bytes) and
+    /video/<size in bytes>/<name...> of any size, including multi-GB files,
+    without holding them in memory. Supports HEAD, single Range requests and
+    keep-alive; bandwidth caps each response in bytes per second.
+
+    With ranges=False the Range header is ignored and every GET is a full 200.
+    drop_rate is the probability that a response body longer than CHUNK is cut
+    off at a random point by closing the connection; the first drop_first such
+    bodies are always cut off.
+    """
+
+    CHUNK = 64 * 1024
+
+    def __init__(self, bandwidth: float = 0.0, faults: Optional[FaultInjector] = None,
+                 photo_size: int = 300 * 1024, ranges: bool = True, drop_rate: float = 0.0,
+                 drop_first: int = 0, host: str = "127.0.0.1", port: int = 0, seed: Optional[int] = None):
+        self.bandwidth = bandwidth
+        self.faults = faults or FaultInjector()
+        self.photo_size = photo_size
+        self.ranges = ranges
+        self.drop_rate = drop_rate
+        self.drop_first = drop_first
+        self._long_bodies = 0
+        self.random = random.Random(seed)
+        self.server = HttpServer(host, port)
+        self.server._handle = self._handle
+        self._block = random.Random(0).randbytes(1024 * 1024)
+        self.bytes_served = 0
+        self.drops = 0
+
+    def content(self, start: int, length: int) -> bytes:
+        """The bytes served at [start, start + length) of any file, to check downloads against."""
+        block_size = len(self._block)
+        data = bytearray()
+        position = start
+        while len(data) < length:
+            offset = position % block_size
+            piece = self._block[offset:offset + min(length - len(data), block_size - offset)]
+            data += piece
+            position += len(piece)
+        return bytes(data)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.server.host}:{self.server.bound_port}"
+
+    async def start(self):
+        await self.server.start()
+        return self
+
+    async def stop(self):
+        await self.server.stop()
+
+    def _size(self, path: str) -> Optional[int]:
+        parts = path.strip("/").split("/")
+        if parts[0] == "photo" and len(parts) == 2:
+            return self.photo_size
+        if parts[0] == "video" and len(parts) >= 3 and parts[1].isdigit():
+            return int(parts[1])
+        return None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                head = await HttpServer._read_head(reader)
+                if head is None:
+                    return
+                method, target, headers = head
+                await self.faults.delay()
+                failure = self.faults.failure()
+                if failure is not None:
+                    await HttpServer._write_response(writer, failure, keep_alive=True)
+                    continue
+                await self._serve(method, urlsplit(target).path, headers, writer)
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _serve(self, method: str, path: str, headers: Dict[str, str], writer: asyncio.StreamWriter):
+        if path == "/_control/results":
+            body = json.dumps({"ok": True, "result": {"bytes_served": self.bytes_served, "drops": self.drops}}).encode()
+            await HttpServer._write_response(writer, Response(200, body, "application/json"), keep_alive=True)
+            return
+        size = self._size(path)
+        if size is None:
+            await HttpServer._write_response(writer, Response(404, b"Not Found"), keep_alive=True)
+            return
+        start, end, status = 0, size - 1, "200 OK"
+        range_header = headers.get("range", "") if self.ranges else ""
+        if range_header.startswith("bytes="):
+            first, _, last = range_header[6:].partition("-")
+            start = int(first) if first else max(size - int(last), 0)
+            end = min(int(last), size - 1) if first and last else size - 1
+            if start >= size:
+                writer.write(f"HTTP/1.1 416 Range Not Satisfiable\r\nContent-Range: bytes */{size}\r\n"
+                             f"Content-Length: 0\r\n\r\n".encode())
+                return
+            status = "206 Partial Content"
+        length = end - start + 1
+        content_type = "image/jpeg" if path.startswith("/photo/") else "video/mp4"
+        head = (
+            f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {length}\r\n"
+            f"ETag: \"{size}\"\r\nConnection: keep-alive\r\n"
+        )
+        if self.ranges:
+            head += "Accept-Ranges: bytes\r\n"
+        if status.startswith("206"):
+            head += f"Content-Range: bytes {start}-{end}/{size}\r\n"
+        writer.write((head + "\r\n").encode())
+        if method == "HEAD":
+            await writer.drain()
+            return
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        sent = 0
+        block_size = len(self._block)
+        position = start
+        if length > self.CHUNK:
+            self._long_bodies += 1
+            if self._long_bodies <= self.drop_first or (self.drop_rate and self.random.random() < self.drop_rate):
+                end = start + self.random.randrange(length) - 1
+                self.drops += 1
+        while position <= end:
+            offset = position % block_size
+            chunk = self._block[offset:offset + min(self.CHUNK, end - position + 1, block_size - offset)]
+            writer.write(chunk)
+            await writer.drain()
+            position += len(chunk)
+            sent += len(chunk)
+            self.bytes_served += len(chunk)
+            if self.bandwidth:
+                ahead = sent / self.bandwidth - (loop.time() - started)
+                if ahead > 0:
+                    await asyncio.sleep(ahead)
+        if sent < length:
+            raise ConnectionResetError("injected drop mid-body")
+
+async def read_streamed_request(reader: asyncio.StreamReader) -> Optional[Request]:
+    """Like HttpServer's reader but accepts any body size, keeping only the first BODY_KEEP_BYTES."""
+    head = await HttpServer._read_head(reader)
+    if head is None:
+        return None
+    method, target, headers = head
+    remaining = int(headers.get("content-length") or 0)
+    kept = bytearray()
+    while remaining:
+        chunk = await reader.read(min(remaining, 1024 * 1024))
+        if not chunk:
+            raise asyncio.IncompleteReadError(bytes(kept), remaining)
+        remaining -= len(chunk)
+        if len(kept) < BODY_KEEP_BYTES:
+            kept += chunk[:BODY_KEEP_BYTES - len(kept)]
+    url = urlsplit(target)
+    return Request(method, url.path, parse_qs(url.query), headers, bytes(kept))
+
+def parse_bot_api_params(request: Request) -> Tuple[Dict[str, object], int]:
+    """
+    Form fields of a Bot API call (values are JSON-encoded) and the number of
+    bytes uploaded. Works on bodies truncated by read_streamed_request, since
+    PTB sends the plain fields before the files.
+    """
+    content_type = request.headers.get("content-type", "")
+    fields: Dict[str, object] = {}
+    uploaded = 0
+    if content_type.startswith("multipart/form-data"):
+        uploaded = int(request.headers.get("content-length") or 0)
+        message = BytesParser(policy=policy.HTTP).parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode() + request.body)
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            payload = part.get_payload(decode=True) or b""
+            if part.get_filename():
+                fields[name] = f"attach://{name}"
+            elif name:
+                fields[name] = payload.decode()
+    elif content_type.startswith("application/json"):
+        fields = json.loads(request.body or b"{}")
+    else:
+        fields = dict(parse_qsl(request.body.decode()))
+    for key, value in list(fields.items()):
+        if isinstance(value, str):
+            try:
+                fields[key] = json.loads(value)
+            except ValueError:
+                pass
+    return fields, uploaded
+
+class FakeBotApi:
+    """
+    Minimal Bot API server for PTB's base_url. Supports getUpdates long polling
+    and setWebhook delivery of updates injected with push_message(), answers
+    send*/edit* calls with plausible Message objects and records them.
+
+    reject_url_media is the probability that a send* call passing an http(s)
+    URL as media of one of reject_kinds fails like Telegram does when it can't
+    fetch the URL.
+
+    flood_rate is the probability that a send*/edit* call trips flood control
+    for its chat: it is answered with 429 and retry_after, and so is every call
+    to that chat until retry_after seconds have passed, like Telegram does.
+
+    When run in its own process (python -m benchmarks.fake_services botapi),
+    POST /_control/push {"messages": [{"chat_id", "text"}], "rate"} injects
+    messages and GET /_control/results returns per-chat reply latencies.
+    """
+
+    MEDIA_FIELDS = ("photo", "video", "animation", "document")
+
+    def __init__(self, faults: Optional[FaultInjector] = None, reject_url_media: float = 0.0,
+                 reject_kinds: Tuple[str, ...] = ("video",), flood_rate: float = 0.0, retry_after: int = 1,
+                 host: str = "127.0.0.1", port: int = 0, seed: Optional[int] = None):
+        self.faults = faults or FaultInjector()
+        self.reject_url_media = reject_url_media
+        self.reject_kinds = reject_kinds
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        # chat_id -> monotonic time its flood control ends
+        self._flooded_until: Dict[object, float] = {}
+        # (chat_id, start, end) of every flood-control window opened
+        self.flood_windows: List[tuple] = []
+        self.flood_errors = 0
+        self.random = random.Random(seed)
+        self.server = HttpServer(host, port)
+        self.server._dispatch = self._dispatch
+        self.server._read_request = read_streamed_request
+        self.updates: List[dict] = []
+        self._new_update = asyncio.Event()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self.webhook_url: Optional[str] = None
+        self.webhook_secret: Optional[str] = None
+        self._webhook_client: Optional[httpx.AsyncClient] = None
+        # Telegram delivers webhooks over up to 40 parallel connections by default
+        self._webhook_slots = asyncio.Semaphore(40)
+        self._deliveries: set = set()
+        # (monotonic time, method, params) of every call
+        self.calls: List[tuple] = []
+        self.pushed_at: Dict[int, float] = {}
+        self.first_reply_at: Dict[int, float] = {}
+        self.uploaded_bytes = 0
+
+    @property
+    def base_url(self) -> str:
+        """Value for ApplicationBuilder.base_url()."""
+        return f"http://{self.server.host}:{self.server.bound_port}/bot"
+
+    async def start(self):
+        await self.server.start()
+        return self
+
+    async def stop(self):
+        # Answer pending long polls so their connections finish cleanly
+        self._new_update.set()
+        await asyncio.sleep(0.05)
+        await self.server.stop()
+        if self._webhook_client is not None:
+            await self._webhook_client.aclose()
+
+    async def push_message(self, chat_id: int, text: str, entities: Optional[List[dict]] = None, user_id: Optional[int] = None):
+        """Inject a private text message from a user, as getUpdates or the webhook would deliver it."""
+        user = {"id": user_id or chat_id, "is_bot": False, "first_name": "Bench"}
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": user,
+            "text": text,
+        }
+        if entities:
+            message["entities"] = entities
+        update = {"update_id": next(self._update_ids), "message": message}
+        self.pushed_at.setdefault(chat_id, time.monotonic())
+        if self.webhook_url:
+            task = asyncio.create_task(self._deliver(update))
+            self._deliveries.add(task)
+            task.add_done_callback(self._deliveries.discard)
+        else:
+            self.updates.append(update)
+            self._new_update.set()
+        return update
+
+    async def _deliver(self, update: dict):
+        if self._webhook_client is None:
+            self._webhook_client = httpx.AsyncClient(verify=False, limits=httpx.Limits(max_connections=40))
+        headers = {"X-Telegram-Bot-Api-Secret-Token": self.webhook_secret} if self.webhook_secret else {}
+        async with self._webhook_slots:
+            # Same network latency as a getUpdates response would see
+            await self.faults.delay()
+            response = await self._webhook_client.post(self.webhook_url, json=update, headers=headers)
+        response.raise_for_status()
+
+    def _message(self, chat_id, **extra) -> dict:
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+        }
+        message.update(extra)
+        return message
+
+    def _media(self, kind: str) -> dict:
+        file_id = f"{kind}-{next(self._message_ids)}"
+        item = {"file_id": file_id, "file_unique_id": file_id}
+        if kind == "photo":
+            return {"photo": [dict(item, width=1280, height=720)]}
+        if kind in ("video", "animation"):
+            return {kind: dict(item, width=1280, height=720, duration=10)}
+        return {kind: item}
+
+    def _rejects(self, kind: str, value) -> bool:
+        return (
+            kind in self.reject_kinds
+            and isinstance(value, str) and value.startswith("http")
+            and self.reject_url_media and self.random.random() < self.reject_url_media
+        )
+
+    @staticmethod
+    def _ok(result) -> Response:
+        return Response(200, json.dumps({"ok": True, "result": result}).encode(), "application/json")
+
+    @staticmethod
+    def _error(status: int, description: str, parameters: Optional[dict] = None) -> Response:
+        body = {"ok": False, "error_code": status, "description": description}
+        if parameters:
+            body["parameters"] = parameters
+        return Response(status, json.dumps(body).encode(), "application/json")
+
+    def _flood_control(self, chat_id) -> Optional[Response]:
+        """A 429 answer if chat_id is (or now gets) flood-limited."""
+        now = time.monotonic()
+        until = self._flooded_until.get(chat_id, 0.0)
+        if until <= now:
+            if not (self.flood_rate and self.random.random() < self.flood_rate):
+                return None
+            until = self._flooded_until[chat_id] = now + self.retry_after
+            self.flood_windows.append((chat_id, now, until))
+        self.flood_errors += 1
+        retry_after = max(1, round(until - now))
+        return self._error(429, f"Too Many Requests: retry after {retry_after}", {"retry_after": retry_after})
+
+    async def _inject(self, messages: List[dict], rate: float):
+        for message in messages:
+            await self.push_message(message["chat_id"], message["text"], message.get("entities"))
+            if rate:
+                await asyncio.sleep(1 / rate)
+
+    async def _control(self, request: Request) -> Response:
+        action = request.path.rsplit("/", 1)[-1]
+        if action == "push":
+            body = json.loads(request.body)
+            task = asyncio.create_task(self._inject(body["messages"], body.get("rate") or 0))
+            self._deliveries.add(task)
+            task.add_done_callback(self._deliveries.discard)
+            return self._ok(True)
+        if action == "results":
+            latencies = {
+                chat_id: self.first_reply_at[chat_id] - pushed
+                for chat_id, pushed in self.pushed_at.items()
+                if chat_id in self.first_reply_at
+            }
+            return self._ok({
+                "webhook_url": self.webhook_url,
+                "pushed": len(self.pushed_at),
+                "latencies": list(latencies.values()),
+                "uploaded_bytes": self.uploaded_bytes,
+                "flood_errors": self.flood_errors,
+            })
+        if action == "reset":
+            self.pushed_at.clear()
+            self.first_reply_at.clear()
+            self.calls.clear()
+            self.updates.clear()
+            self._flooded_until.clear()
+            self.flood_windows.clear()
+            self.flood_errors = 0
+            return self._ok(True)
+        return self._error(404, "Not Found")
+
+    async def _dispatch(self, request: Request) -> Response:
+        if request.path.startswith("/_control/"):
+            return await self._control(request)
+        method = request.path.rsplit("/", 1)[-1]
+        params, uploaded = parse_bot_api_params(request)
+        self.uploaded_bytes += uploaded
+        self.calls.append((time.monotonic(), method, params))
+        if method == "getUpdates":
+            return await self._get_updates(params)
+
+        await self.faults.delay()
+        failure = self.faults.failure()
+        if failure is not None:
+            return failure
+
+        chat_id = params.get("chat_id")
+        if method.startswith(("send", "edit")) and chat_id is not None:
+            flooded = self._flood_control(chat_id)
+            if flooded is not None:
+                return flooded
+            self.first_reply_at.setdefault(chat_id, time.monotonic())
+        if method == "getMe":
+            return self._ok({"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot",
+                             "can_join_groups": True, "can_read_all_group_messages": False,
+                             "supports_inline_queries": False})
+        if method == "setWebhook":
+            self.webhook_url = params.get("url") or None
+            self.webhook_secret = params.get("secret_token")
+            return self._ok(True)
+        if method == "deleteWebhook":
+            self.webhook_url = None
+            return self._ok(True)
+        if method in ("sendMessage", "editMessageText"):
+            return self._ok(self._message(chat_id, text=str(params.get("text", ""))))
+        if method == "sendMediaGroup":
+            media = params.get("media") or []
+            if any(self._rejects(item.get("type"), item.get("media")) for item in media):
+                return self._error(400, "Bad Request: failed to get HTTP URL content")
+            return self._ok([self._message(chat_id, **self._media(item.get("type", "photo"))) for item in media])
+        if method.startswith("send"):
+            kind = method[4:].lower()
+            value = params.get(kind)
+            if self._rejects(kind, value):
+                return self._error(400, "Bad Request: wrong file identifier/HTTP URL specified")
+            extra = self._media(kind) if kind in self.MEDIA_FIELDS else {}
+            return self._ok(self._message(chat_id, caption=params.get("caption"), **extra))
+        # setMyCommands, deleteMessage, sendChatAction, ...
+        return self._ok(True)
+
+    async def _get_updates(self, params: dict) -> Response:
+        offset = int(params.get("offset") or 0)
+        timeout = float(params.get("timeout") or 0)
+        self.updates = [u for u in self.updates if u["update_id"] >= offset]
+        if not self.updates and timeout:
+            self._new_update.clear()
+            try:
+                await asyncio.wait_for(self._new_update.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        limit = int(params.get("limit") or 100)
+        batch = self.updates[:limit]
+        if batch:
+            await self.faults.delay()
+        return self._ok(batch)
+
+async def _serve(args):
+    faults = FaultInjector(latency=args.latency, failure_rate=args.failure_rate)
+    if args.service == "botapi":
+        service = FakeBotApi(faults, reject_url_media=args.reject_url_media,
+                             reject_kinds=tuple(args.reject_kinds.split(",")), flood_rate=args.flood_rate,
+                             retry_after=args.retry_after)
+    elif args.service == "cdn":
+        service = FakeCdn(args.bandwidth_mbps * 1024 * 1024 / 8, faults, ranges=not args.no_ranges,
+                          drop_rate=args.drop_rate)
+    else:
+        media_factory = sample_media
+        if args.cdn_url:
+            media_factory = cdn_media_factory(args.cdn_url, args.photos, int(args.video_mb * 1024 * 1024))
+        service = FakeTweetBackend(args.service, faults, media_factory=media_factory)
+    service.server.port = args.port
+    await service.start()
+    print(f"READY {service.server.bound_port}", flush=True)
+    await asyncio.Event().wait()
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run one fake service in this process")
+    parser.add_argument("service", choices=["botapi", "cdn", "vxtwitter", "fxtwitter"])
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0, help="added to every request (s)")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--reject-url-media", type=float, default=0.0, help="botapi: URL sends rejected")
+    parser.add_argument("--reject-kinds", default="video", help="botapi: media kinds URL rejection applies to")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="botapi: sends that trip flood control (429)")
+    parser.add_argument("--retry-after", type=int, default=1, help="botapi: retry_after of flood-control errors (s)")
+    parser.add_argument("--bandwidth-mbps", type=float, default=0.0, help="cdn: per-response cap, 0 = unlimited")
+    parser.add_argument("--no-ranges", action="store_true", help="cdn: ignore Range, always answer 200")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="cdn: responses cut off mid-body")
+    parser.add_argument("--cdn-url", help="vxtwitter/fxtwitter: serve media from this FakeCdn")
+    parser.add_argument("--photos", type=int, default=1, help="photos per tweet with --cdn-url")
+    parser.add_argument("--video-mb", type=float, default=0.0, help="video size per tweet with --cdn-url")
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
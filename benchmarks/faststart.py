@@ -0,0 +1,155 @@
+"""
+Faststart remuxer on synthetic MP4s, no network needed.
+
+Writes MP4s with moov after mdat (the layout of many downloaded twimg videos)
+whose chunks each start with a marker naming their track and index, moves moov
+to the front in place and checks that every rewritten stco/co64 offset still
+points at its own chunk. Layouts cover a plain file, co64 tables, a box after
+moov and two mdat boxes around moov. Prints time, throughput and peak RSS per
+file as JSON; pass a real MP4 path with --file to time that too (it is copied
+first, the original isn't touched).
+
+    python -m benchmarks.faststart --size-mb 256
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import struct
+import tempfile
+import time
+
+from app.downloader.faststart import faststart, parse_boxes, read_top_level
+
+MARKER = b"CHNK"
+
+def box(box_type: bytes, payload: bytes = b"") -> bytes:
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+def chunk_offset_box(offsets, co64: bool) -> bytes:
+    width = "Q" if co64 else "I"
+    return box(b"co64" if co64 else b"stco", struct.pack(f">4xI{len(offsets)}{width}", len(offsets), *offsets))
+
+def moov_box(track_offsets, co64: bool) -> bytes:
+    traks = b""
+    for offsets in track_offsets:
+        stbl = box(b"stbl", box(b"stsd", bytes(16)) + box(b"stsz", bytes(12)) + chunk_offset_box(offsets, co64))
+        minf = box(b"minf", box(b"vmhd", bytes(12)) + stbl)
+        mdia = box(b"mdia", box(b"mdhd", bytes(24)) + box(b"hdlr", bytes(25)) + minf)
+        traks += box(b"trak", box(b"tkhd", bytes(84)) + mdia)
+    return box(b"moov", box(b"mvhd", bytes(100)) + traks)
+
+def write_sample(path: str, size: int, tracks: int, chunks: int, co64=False, tail=False, split_mdat=False) -> dict:
+    """Write a moov-at-end MP4 of about `size` bytes; returns the expected marker of every chunk."""
+    filler = os.urandom(1024 * 1024)
+    chunk_size = max(size // (tracks * chunks), 16)
+    track_offsets = [[] for _ in range(tracks)]
+    with open(path, "wb") as f:
+        f.write(box(b"ftyp", b"isom" + bytes(4) + b"isomiso2avc1mp41"))
+
+        def write_mdat(chunk_range):
+            start = f.tell()
+            f.write(struct.pack(">I4s", 0, b"mdat"))
+            for k in chunk_range:
+                for t in range(tracks):
+                    track_offsets[t].append(f.tell())
+                    data = MARKER + struct.pack(">II", t, k)
+                    remaining = chunk_size - len(data)
+                    f.write(data)
+                    while remaining > 0:
+                        f.write(filler[:remaining])
+                        remaining -= len(filler)
+            end = f.tell()
+            f.seek(start)
+            f.write(struct.pack(">I", end - start))
+            f.seek(end)
+
+        if split_mdat:
+            write_mdat(range(chunks // 2))
+            placeholder = f.tell()
+            # Second mdat goes after moov; write moov last once all offsets are known
+            moov_size = len(moov_box([[0] * chunks for _ in range(tracks)], co64))
+            f.seek(placeholder + moov_size)
+            write_mdat(range(chunks // 2, chunks))
+            end = f.tell()
+            f.seek(placeholder)
+            f.write(moov_box(track_offsets, co64))
+            f.seek(end)
+        else:
+            write_mdat(range(chunks))
+            f.write(moov_box(track_offsets, co64))
+        if tail:
+            f.write(box(b"free", bytes(4096)))
+    return {(t, k) for t in range(tracks) for k in range(chunks)}
+
+def verify(path: str, expected) -> str:
+    with open(path, "rb") as f:
+        top = read_top_level(f, os.path.getsize(path))
+        types = [b.type for b in top]
+        if types.index(b"moov") > types.index(b"mdat"):
+            return "moov still after mdat"
+        moov = top[types.index(b"moov")]
+        f.seek(moov.offset)
+        (root,) = parse_boxes(f.read(moov.size))
+        found = set()
+        for track, table in enumerate(b for b in root.walk() if b.type in (b"stco", b"co64")):
+            width = "Q" if table.type == b"co64" else "I"
+            count = struct.unpack(">I", table.payload[4:8])[0]
+            for offset in struct.unpack(f">{count}{width}", table.payload[8:]):
+                f.seek(offset)
+                data = f.read(12)
+                if data[:4] != MARKER or struct.unpack(">I", data[4:8])[0] != track:
+                    return f"offset {offset} of track {track} points at {data!r}"
+                found.add(struct.unpack(">II", data[4:]))
+    return "ok" if found == expected else "chunks missing"
+
+def run(name: str, path: str, expected=None) -> dict:
+    size = os.path.getsize(path)
+    started = time.perf_counter()
+    moved = faststart(path)
+    elapsed = time.perf_counter() - started
+    result = {
+        "file": name,
+        "size_mb": round(size / 2**20, 1),
+        "moved": moved,
+        "seconds": round(elapsed, 3),
+        "mb_per_s": round(size / 2**20 / elapsed, 1) if elapsed else None,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    if expected is not None:
+        result["check"] = verify(path, expected)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=float, default=64)
+    parser.add_argument("--chunks", type=int, default=2000, help="chunks per track")
+    parser.add_argument("--file", help="also time a real MP4 (a copy of it)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="tgdl_faststart_")
+    size = int(args.size_mb * 2**20)
+    layouts = {
+        "plain": {},
+        "co64": dict(co64=True),
+        "box_after_moov": dict(tail=True),
+        "mdat_moov_mdat": dict(split_mdat=True),
+    }
+    results = []
+    try:
+        for name, options in layouts.items():
+            path = os.path.join(workdir, f"{name}.mp4")
+            expected = write_sample(path, size, tracks=2, chunks=args.chunks, **options)
+            results.append(run(name, path, expected))
+            os.remove(path)
+        if args.file:
+            path = os.path.join(workdir, "real.mp4")
+            shutil.copyfile(args.file, path)
+            results.append(run(os.path.basename(args.file), path))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
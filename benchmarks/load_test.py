@@ -0,0 +1,267 @@
+"""
+End-to-end load test of the tweet pipeline against local stand-ins.
+
+Starts a fake media CDN, a fake vxtwitter API serving tweets whose media live
+on that CDN, and a fake Bot API (each in its own process), then feeds a stream
+of synthetic tweet-link messages through the real handlers (handle_message ->
+reply_media, including probing, the download/re-upload fallback and the
+file_id cache). Reports throughput, latency percentiles from enqueue to handler
+completion, peak RSS, peak disk usage of the download directory and transfer
+counters as JSON.
+
+    python -m benchmarks.load_test --updates 200 --rate 20 --video-mb 8
+    python -m benchmarks.load_test --updates 20 --video-mb 2048 --reject-url-media 1 --local-bot-api
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import httpx
+
+TOKEN = "123456:bench"
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=100, help="messages to send")
+    parser.add_argument("--rate", type=float, default=0, help="messages per second, 0 = all at once")
+    parser.add_argument("--chats", type=int, default=50, help="distinct chats the messages come from")
+    parser.add_argument("--unique-tweets", type=int, default=0, help="distinct tweets, 0 = one per message")
+    parser.add_argument("--photos", type=int, default=1, help="photos per tweet")
+    parser.add_argument("--video-mb", type=float, default=0, help="video size per tweet, 0 = no video")
+    parser.add_argument("--cdn-bandwidth-mbps", type=float, default=0, help="per-response cap, 0 = unlimited")
+    parser.add_argument("--cdn-latency", type=float, default=0.0)
+    parser.add_argument("--api-latency", type=float, default=0.02, help="vxtwitter and Bot API latency (s)")
+    parser.add_argument("--reject-url-media", type=float, default=0.0, help="share of URL sends the Bot API rejects")
+    parser.add_argument("--reject-kinds", default="video", help="media kinds the URL rejection applies to, e.g. video,photo")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="share of sends the Bot API answers with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after of those 429 answers (s)")
+    parser.add_argument("--local-bot-api", action="store_true", help="send fallback files by path (shared dir)")
+    parser.add_argument("--rate-limiter", action="store_true", help="enable the outbound rate limiter")
+    parser.add_argument("--timeout", type=float, default=600, help="give up waiting after this many seconds")
+    parser.add_argument("--output", help="also write the JSON result to this file")
+    return parser.parse_args()
+
+async def start_service(*args: str):
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "benchmarks.fake_services", *args, stdout=asyncio.subprocess.PIPE,
+    )
+    line = (await process.stdout.readline()).decode()
+    if not line.startswith("READY"):
+        process.kill()
+        raise RuntimeError(f"Fake service {args[0]} didn't start")
+    return process, f"http://127.0.0.1:{line.split()[1]}"
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+def current_rss() -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+def directory_size(path: str) -> int:
+    total = 0
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False):
+                    total += entry.stat().st_blocks * 512
+    except FileNotFoundError:
+        pass
+    return total
+
+def make_update(update_id: int, chat_id: int, tweet_id: str) -> dict:
+    url = f"https://x.com/bench/status/{tweet_id}"
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Bench"},
+            "text": url,
+            "entities": [{"type": "url", "offset": 0, "length": len(url)}],
+        },
+    }
+
+async def run(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="tgdl_bench_")
+    media_path = os.path.join(workdir, "media")
+    os.makedirs(media_path)
+    processes = []
+    try:
+        cdn, cdn_url = await start_service(
+            "cdn", "--latency", str(args.cdn_latency), "--bandwidth-mbps", str(args.cdn_bandwidth_mbps),
+        )
+        processes.append(cdn)
+        vx, vx_url = await start_service(
+            "vxtwitter", "--latency", str(args.api_latency), "--cdn-url", cdn_url,
+            "--photos", str(args.photos), "--video-mb", str(args.video_mb),
+        )
+        processes.append(vx)
+        api, api_url = await start_service(
+            "botapi", "--latency", str(args.api_latency), "--reject-url-media", str(args.reject_url_media),
+            "--reject-kinds", args.reject_kinds, "--flood-rate", str(args.flood_rate),
+            "--retry-after", str(args.retry_after),
+        )
+        processes.append(api)
+
+        os.environ.update({
+            "TWEET_BACKENDS": "vxtwitter",
+            "VXTWITTER_API_URL": vx_url,
+            "IS_BOT_PRIVATE": "False",
+            "METRICS_PATH": os.path.join(workdir, "stats.json"),
+            "TRACE_PATH": os.path.join(workdir, "traces.jsonl"),
+            "METRICS_PORT": "0",
+            "FILE_ID_CACHE_PATH": os.path.join(workdir, "file_ids.sqlite3"),
+            "TRANSFER_MIN_FREE_MB": "0",
+        })
+        if args.local_bot_api:
+            os.environ.update({"BOT_API_BASE_URL": f"{api_url}/bot", "LOCAL_BOT_API_SHARED_DIR": media_path})
+        # Imported only now so the settings above take effect
+        from telegram import Update
+        from telegram.ext import ApplicationBuilder, MessageHandler, filters
+        from app.bot import handlers
+        from app.bot.filters import tweet_links
+        from app.bot.rate_limiter import TelegramRateLimiter
+        from app.bot.update_processor import ChatSerializingUpdateProcessor
+        from app.core.config import config
+        from app.core.http import http_pool
+        from app.core.media_dir import MediaDirectory
+        from app.core.metrics import photo_sends, video_sends
+
+        if not args.local_bot_api:
+            handlers.media_dir = MediaDirectory(media_path)
+            handlers.transfer_scheduler.directory = media_path
+
+        builder = (
+            ApplicationBuilder()
+            .token(TOKEN)
+            .base_url(f"{api_url}/bot")
+            .updater(None)
+            .concurrent_updates(ChatSerializingUpdateProcessor(config.MAX_CONCURRENT_UPDATES))
+        )
+        if args.local_bot_api:
+            builder.local_mode(True)
+        if args.rate_limiter:
+            builder.rate_limiter(TelegramRateLimiter())
+        application = builder.build()
+
+        enqueued, latencies = {}, []
+        errors = 0
+        finished = asyncio.Event()
+
+        async def timed_handle_message(update, context):
+            nonlocal errors
+            try:
+                await handlers.handle_message(update, context)
+            except Exception:
+                errors += 1
+                logging.exception("handle_message failed")
+            finally:
+                latencies.append(time.monotonic() - enqueued[update.update_id])
+                if len(latencies) >= args.updates:
+                    finished.set()
+
+        application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND & tweet_links, timed_handle_message))
+
+        peak = {"rss": current_rss(), "disk": 0}
+
+        async def sample():
+            while True:
+                peak["rss"] = max(peak["rss"], current_rss())
+                peak["disk"] = max(peak["disk"], directory_size(media_path))
+                await asyncio.sleep(0.05)
+
+        await http_pool.open()
+        await application.initialize()
+        await application.start()
+        sampler = asyncio.create_task(sample())
+        unique = args.unique_tweets or args.updates
+        started = time.monotonic()
+        for i in range(args.updates):
+            update = Update.de_json(make_update(i + 1, 10_000 + i % args.chats, str(1_000_000 + i % unique)), application.bot)
+            enqueued[update.update_id] = time.monotonic()
+            await application.update_queue.put(update)
+            if args.rate:
+                await asyncio.sleep(1 / args.rate)
+        try:
+            await asyncio.wait_for(finished.wait(), args.timeout)
+        except asyncio.TimeoutError:
+            logging.error(f"Timed out with {len(latencies)}/{args.updates} messages handled")
+        duration = time.monotonic() - started
+        sampler.cancel()
+
+        async with httpx.AsyncClient() as control:
+            api_stats = (await control.get(f"{api_url}/_control/results")).json()["result"]
+            cdn_stats = (await control.get(f"{cdn_url}/_control/results")).json()["result"]
+
+        await application.stop()
+        await application.shutdown()
+        await handlers.downloader.close()
+        await http_pool.close()
+        handlers.file_id_cache.close()
+    finally:
+        for process in processes:
+            process.terminate()
+            await process.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "config": {
+            "updates": args.updates,
+            "rate_per_s": args.rate or "burst",
+            "chats": args.chats,
+            "unique_tweets": unique,
+            "photos": args.photos,
+            "video_mb": args.video_mb,
+            "cdn_bandwidth_mbps": args.cdn_bandwidth_mbps,
+            "api_latency_ms": args.api_latency * 1000,
+            "reject_url_media": args.reject_url_media,
+            "reject_kinds": args.reject_kinds,
+            "flood_rate": args.flood_rate,
+            "local_bot_api": args.local_bot_api,
+            "rate_limiter": args.rate_limiter,
+        },
+        "handled": len(latencies),
+        "errors": errors,
+        "duration_s": round(duration, 3),
+        "throughput_per_s": round(len(latencies) / duration, 2) if duration else None,
+        "latency_ms": {
+            "p50": round(statistics.median(latencies) * 1000, 1) if latencies else None,
+            "p95": round(percentile(latencies, 0.95) * 1000, 1) if latencies else None,
+            "p99": round(percentile(latencies, 0.99) * 1000, 1) if latencies else None,
+            "max": round(max(latencies) * 1000, 1) if latencies else None,
+        },
+        "peak_rss_mb": round(max(peak["rss"], resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024) / 2**20, 1),
+        "peak_disk_mb": round(peak["disk"] / 2**20, 1),
+        "cdn_bytes_served_mb": round(cdn_stats["bytes_served"] / 2**20, 1),
+        "bot_api_uploaded_mb": round(api_stats["uploaded_bytes"] / 2**20, 1),
+        "bot_api_flood_errors": api_stats["flood_errors"],
+        "video_sends": {key[0]: value for key, value in video_sends.values.items()},
+        "photo_sends": {key[0]: value for key, value in photo_sends.values.items()},
+    }
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.ERROR, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    result = asyncio.run(run(args))
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+if __name__ == "__main__":
+    main()
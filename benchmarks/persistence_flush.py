@@ -0,0 +1,98 @@
+"""
+Flush latency of PicklePersistence vs SQLitePersistence.
+
+Fills bot_data with N entries, then repeatedly modifies a few keys plus one
+chat's data and calls update_bot_data/update_chat_data the way Application
+does on every persistence interval: with a deepcopy of the bot_data that
+get_bot_data returned. PicklePersistence rewrites the whole file on any chat
+or user data change, so that is what it pays for each round. Reports wall time
+per flush (the deepcopy, which Application also does on the loop, separately)
+and the longest event-loop stall observed while flushing, as JSON.
+
+    python -m benchmarks.persistence_flush --entries 10000 100000
+"""
+import argparse
+import asyncio
+import copy
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from telegram.ext import ContextTypes, PicklePersistence
+
+from app.core.persistence import SQLitePersistence, TrackingDict
+
+def make_value(i: int) -> dict:
+    return {"user": i, "links": [f"https://x.com/u/status/{i}{j}" for j in range(3)], "count": i % 17}
+
+async def loop_lag(stop: asyncio.Event, samples: list, interval: float = 0.001):
+    """Record how late a tight sleep loop wakes up while flushes run."""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        samples.append(max(loop.time() - expected, 0.0))
+
+async def run(backend: str, entries: int, rounds: int, changed: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        if backend == "pickle":
+            persistence = PicklePersistence(os.path.join(tmp, "persistence"))
+        else:
+            persistence = SQLitePersistence(
+                os.path.join(tmp, "persistence.sqlite3"), context_types=ContextTypes(bot_data=TrackingDict)
+            )
+        bot_data = await persistence.get_bot_data()
+        for i in range(entries):
+            bot_data[f"key{i}"] = make_value(i)
+
+        # Initial full write isn't what we're measuring
+        await persistence.update_bot_data(copy.deepcopy(bot_data))
+        await persistence.flush()
+
+        durations, copies, lag = [], [], []
+        stop = asyncio.Event()
+        lag_task = asyncio.create_task(loop_lag(stop, lag))
+        for r in range(rounds):
+            for j in range(changed):
+                bot_data[f"key{(r * changed + j) % entries}"]["count"] += 1
+            started = time.perf_counter()
+            data = copy.deepcopy(bot_data)
+            copied = time.perf_counter()
+            await persistence.update_bot_data(data)
+            await persistence.update_chat_data(1, {"round": r})
+            copies.append(copied - started)
+            durations.append(time.perf_counter() - copied)
+            await asyncio.sleep(0.01)
+        stop.set()
+        await lag_task
+        await persistence.flush()
+
+    durations.sort()
+    return {
+        "backend": backend,
+        "entries": entries,
+        "changed_keys": changed,
+        "rounds": rounds,
+        "flush_p50_ms": round(statistics.median(durations) * 1000, 3),
+        "flush_max_ms": round(durations[-1] * 1000, 3),
+        "deepcopy_p50_ms": round(statistics.median(copies) * 1000, 3),
+        "loop_lag_max_ms": round(max(lag, default=0.0) * 1000, 3),
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--changed", type=int, default=5, help="keys modified between flushes")
+    args = parser.parse_args()
+
+    results = []
+    for entries in args.entries:
+        for backend in ("pickle", "sqlite"):
+            results.append(await run(backend, entries, args.rounds, args.changed))
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,88 @@
+"""
+Photo album fallback download against a local fake CDN, no network needed.
+
+Fetches albums of --photos originals from a FakeCdn with per-request latency,
+occasional slow responses and a per-response bandwidth cap, once photo after
+photo and once through PhotoDownloader (all photos of the album at once), and
+reports the album time next to the slowest single photo, the split into media
+groups and the album byte budget check. Prints JSON.
+
+    python -m benchmarks.photo_album --photos 10 --photo-kb 2048 --bandwidth-mbps 40
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from app.downloader.photos import PhotoDownloadError, PhotoDownloader, split_groups
+from benchmarks.fake_services import FakeCdn, FaultInjector
+
+def ignore_cancelled(loop, context):
+    # Stopping the in-process CDN cancels responses cut short by the budget check
+    if not isinstance(context.get("exception"), asyncio.CancelledError):
+        loop.default_exception_handler(context)
+
+async def run(args) -> dict:
+    asyncio.get_running_loop().set_exception_handler(ignore_cancelled)
+    faults = FaultInjector(latency=args.latency, slow_rate=args.slow_rate, slow_delay=args.slow_delay, seed=1)
+    cdn = await FakeCdn(args.bandwidth_mbps * 1024 * 1024 / 8, faults, photo_size=args.photo_kb * 1024).start()
+    client = httpx.AsyncClient(limits=httpx.Limits(max_connections=100, max_keepalive_connections=20))
+    downloader = PhotoDownloader(client, max_album_bytes=args.photos * args.photo_kb * 1024)
+    try:
+        sequential, concurrent, slowest = [], [], []
+        for album in range(args.rounds):
+            urls = [f"{cdn.base_url}/photo/{album}_{i}.jpg?name=orig" for i in range(args.photos)]
+            started = time.perf_counter()
+            singles = []
+            for url in urls:
+                single_started = time.perf_counter()
+                await downloader.download([url])
+                singles.append(time.perf_counter() - single_started)
+            sequential.append(time.perf_counter() - started)
+            slowest.append(max(singles))
+
+            started = time.perf_counter()
+            buffers = await downloader.download(urls)
+            concurrent.append(time.perf_counter() - started)
+            assert all(len(buffer.getbuffer()) == args.photo_kb * 1024 for buffer in buffers)
+
+        small = PhotoDownloader(client, max_album_bytes=args.photos * args.photo_kb * 1024 - 1)
+        try:
+            await small.download(urls)
+            budget = "not enforced"
+        except PhotoDownloadError as e:
+            budget = f"rejected: {e}"
+    finally:
+        await client.aclose()
+        await cdn.stop()
+
+    def ms(values):
+        return round(sum(values) / len(values) * 1000, 1)
+
+    return {
+        "photos": args.photos,
+        "photo_kb": args.photo_kb,
+        "groups": [len(group) for group in split_groups(list(range(args.photos)))],
+        "sequential_ms": ms(sequential),
+        "concurrent_ms": ms(concurrent),
+        "slowest_single_ms": ms(slowest),
+        "speedup": round(sum(sequential) / sum(concurrent), 2),
+        "budget_one_byte_short": budget,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--photos", type=int, default=10)
+    parser.add_argument("--photo-kb", type=int, default=2048)
+    parser.add_argument("--bandwidth-mbps", type=float, default=40, help="per-response cap, 0 = unlimited")
+    parser.add_argument("--latency", type=float, default=0.05, help="CDN latency per request (s)")
+    parser.add_argument("--slow-rate", type=float, default=0.1, help="share of requests delayed by --slow-delay")
+    parser.add_argument("--slow-delay", type=float, default=0.3)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+if __name__ == "__main__":
+    main()
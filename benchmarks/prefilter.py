@@ -0,0 +1,137 @@
+"""
+Per-message cost of the tweet link pre-filter on a synthetic group chat corpus.
+
+The corpus is mostly chatter: plain text, messages with mentions/hashtags and
+messages linking elsewhere, plus a small share of tweet links, half of them
+hidden behind text_link entities. Compares the work done per message before
+the pre-filter (TEXT & ~COMMAND, then the handler's privacy check, url/tag
+regex scans and counter update for every message) with the pre-filtered path,
+and reports how many tweets each one finds. Prints JSON.
+
+    python -m benchmarks.prefilter --messages 100000 --link-share 0.01
+"""
+import argparse
+import json
+import random
+import time
+
+from telegram import Update
+from telegram.ext import filters
+
+from app.bot.filters import tweet_link_text, tweet_links
+from app.bot.handlers import downloader
+from app.core.config import config
+from app.core.metrics import messages_handled, messages_skipped
+
+WORDS = "the a bot meeting lunch tomorrow please ok thanks lol what when why deploy build release".split()
+OTHER_URLS = ["https://www.youtube.com/watch?v=dQw4w9WgXcQ", "https://github.com/python/cpython/pull/1",
+              "https://example.org/box.html", "https://news.ycombinator.com/item?id=1"]
+
+def sentence(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 25)))
+
+def make_message(i: int, rng: random.Random, link_share: float) -> dict:
+    text, entities = sentence(rng), []
+    roll = rng.random()
+    if roll < link_share:
+        url = f"https://x.com/user{i % 97}/status/{10**18 + i}"
+        if rng.random() < 0.5:
+            entities.append({"type": "url", "offset": len(text) + 1, "length": len(url)})
+            text = f"{text} {url}"
+        else:
+            label = "this thread"
+            entities.append({"type": "text_link", "offset": len(text) + 1, "length": len(label), "url": url})
+            text = f"{text} {label}"
+    elif roll < 0.15:
+        url = rng.choice(OTHER_URLS)
+        entities.append({"type": "url", "offset": len(text) + 1, "length": len(url)})
+        text = f"{text} {url}"
+    elif roll < 0.30:
+        entities.append({"type": "mention", "offset": 0, "length": 6})
+        text = f"@alice {text} #release"
+        entities.append({"type": "hashtag", "offset": len(text) - 8, "length": 8})
+    message = {
+        "message_id": i,
+        "date": 0,
+        "chat": {"id": -100, "type": "supergroup", "title": "Bench"},
+        "from": {"id": 1000 + i % 500, "is_bot": False, "first_name": "Bench"},
+        "text": text,
+    }
+    if entities:
+        message["entities"] = entities
+    return {"update_id": i, "message": message}
+
+def old_path(updates, base_filter):
+    """What every text message cost before: the handler's work up to the first reply."""
+    found = 0
+    for update in updates:
+        if not base_filter.check_update(update):
+            continue
+        if config.IS_BOT_PRIVATE and update.effective_user.id != config.DEVELOPER_ID:
+            continue
+        text = update.message.text
+        ids = downloader.extract_tweet_ids(text)
+        downloader.extract_tweet_tag(text)
+        messages_handled.inc()
+        found += len(ids)
+    return found
+
+def new_path(updates, prefiltered):
+    found = 0
+    for update in updates:
+        if not prefiltered.check_update(update):
+            continue
+        if config.IS_BOT_PRIVATE and update.effective_user.id != config.DEVELOPER_ID:
+            continue
+        text = tweet_link_text(update.message)
+        ids = downloader.extract_tweet_ids(text)
+        downloader.extract_tweet_tag(text)
+        messages_handled.inc()
+        found += len(ids)
+    return found
+
+def timed(func, *args, rounds: int):
+    best, result = None, None
+    for _ in range(rounds):
+        started = time.perf_counter_ns()
+        result = func(*args)
+        elapsed = time.perf_counter_ns() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--link-share", type=float, default=0.01, help="share of messages with a tweet link")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    config.IS_BOT_PRIVATE = False
+    rng = random.Random(1)
+    updates = [Update.de_json(make_message(i, rng, args.link_share), None) for i in range(args.messages)]
+    base_filter = filters.TEXT & ~filters.COMMAND
+    prefiltered = base_filter & tweet_links
+
+    old_ns, old_found = timed(old_path, updates, base_filter, rounds=args.rounds)
+    messages_skipped.reset()
+    new_ns, new_found = timed(new_path, updates, prefiltered, rounds=args.rounds)
+    filter_ns, _ = timed(lambda: [prefiltered.check_update(u) for u in updates], rounds=args.rounds)
+    text_ns, _ = timed(lambda: [base_filter.check_update(u) for u in updates], rounds=args.rounds)
+
+    print(json.dumps({
+        "messages": args.messages,
+        "link_share": args.link_share,
+        "before_ns_per_message": round(old_ns / args.messages),
+        "prefiltered_ns_per_message": round(new_ns / args.messages),
+        "text_filter_ns_per_message": round(text_ns / args.messages),
+        "filter_only_ns_per_message": round(filter_ns / args.messages),
+        "speedup": round(old_ns / new_ns, 2),
+        "tweets_found_before": old_found,
+        "tweets_found_prefiltered": new_found,
+        "skipped_per_round": {
+            key[0]: int(value / (2 * args.rounds)) for key, value in messages_skipped.values.items()
+        },
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+TelegramRateLimiter against a local fake Bot API that enforces flood control.
+
+Two checks, no network needed:
+
+- flood: messages to a few chats while the fake API answers a share of sends
+  with 429 and retry_after, then keeps answering 429 for that chat until the
+  time is up. Every message must arrive, and no chat may be called again
+  before its retry_after has passed.
+- priority: photos queue up behind one chat's bucket, then text messages for
+  the same chat are sent. The text must reach the API before the queued photos.
+
+Prints JSON and exits non-zero if a check fails.
+
+    python -m benchmarks.rate_limiter --messages 60 --chats 3 --flood-rate 0.2
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+
+from telegram.ext import ExtBot
+
+from app.bot.rate_limiter import TelegramRateLimiter
+from benchmarks.fake_services import FakeBotApi
+
+TOKEN = "123456:bench"
+PHOTO_URL = "https://pbs.twimg.com/media/bench.jpg"
+
+async def check_flood(args) -> dict:
+    api = await FakeBotApi(flood_rate=args.flood_rate, retry_after=args.retry_after, seed=1).start()
+    limiter = TelegramRateLimiter(private_chat_rate=args.chat_rate, private_chat_burst=1, max_retries=args.max_retries)
+    bot = ExtBot(TOKEN, base_url=api.base_url, rate_limiter=limiter)
+    chats = [1000 + i for i in range(args.chats)]
+    try:
+        await bot.initialize()
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *(bot.send_message(chats[i % len(chats)], f"message {i}") for i in range(args.messages)),
+            return_exceptions=True,
+        )
+        duration = time.perf_counter() - started
+        await bot.shutdown()
+    finally:
+        await api.stop()
+
+    # A call to a chat inside one of its flood windows was retried too early
+    calls = [(at, params["chat_id"]) for at, method, params in api.calls if method == "sendMessage"]
+    early, waits = 0, []
+    for chat_id, opened, until in api.flood_windows:
+        later = [at for at, chat in calls if chat == chat_id and at > opened]
+        early += sum(1 for at in later if at < until)
+        if later:
+            waits.append(min(later) - opened)
+
+    failed = [r for r in results if isinstance(r, Exception)]
+    return {
+        "messages": args.messages,
+        "chats": args.chats,
+        "flood_rate": args.flood_rate,
+        "retry_after_s": args.retry_after,
+        "flood_errors": api.flood_errors,
+        "delivered": len(results) - len(failed),
+        "failed": [repr(e) for e in failed],
+        "retried_before_retry_after": early,
+        "min_wait_after_429_s": round(min(waits), 3) if waits else None,
+        "duration_s": round(duration, 3),
+        "ok": not failed and not early and api.flood_errors > 0,
+    }
+
+async def check_priority(args) -> dict:
+    api = await FakeBotApi(seed=1).start()
+    limiter = TelegramRateLimiter(private_chat_rate=args.chat_rate, private_chat_burst=1)
+    bot = ExtBot(TOKEN, base_url=api.base_url, rate_limiter=limiter)
+    chat_id = 2000
+    try:
+        await bot.initialize()
+        photos = [asyncio.ensure_future(bot.send_photo(chat_id, PHOTO_URL)) for _ in range(args.photos)]
+        # Let the photos take the burst and queue up behind the chat's bucket
+        await asyncio.sleep(0.5 / args.chat_rate)
+        texts = [asyncio.ensure_future(bot.send_message(chat_id, f"text {i}")) for i in range(args.texts)]
+        await asyncio.gather(*photos, *texts)
+        await bot.shutdown()
+    finally:
+        await api.stop()
+
+    order = [method for _, method, params in api.calls if method in ("sendPhoto", "sendMessage")]
+    sent_before = order.index("sendMessage")
+    last_text = len(order) - order[::-1].index("sendMessage") - 1
+    photos_overtaken = order[last_text + 1:].count("sendPhoto")
+    return {
+        "photos": args.photos,
+        "texts": args.texts,
+        "chat_rate_per_s": args.chat_rate,
+        "order": "".join("P" if method == "sendPhoto" else "T" for method in order),
+        "photos_before_first_text": sent_before,
+        "queued_photos_overtaken": photos_overtaken,
+        # Only the photo(s) already granted may go first; all texts beat the rest
+        "ok": photos_overtaken == args.photos - sent_before,
+    }
+
+async def run(args) -> dict:
+    return {"flood": await check_flood(args), "priority": await check_priority(args)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=60)
+    parser.add_argument("--chats", type=int, default=3)
+    parser.add_argument("--flood-rate", type=float, default=0.2, help="share of sends answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after of those answers (s)")
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument("--chat-rate", type=float, default=20, help="per-chat limiter rate (messages/s)")
+    parser.add_argument("--photos", type=int, default=10)
+    parser.add_argument("--texts", type=int, default=3)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    result = asyncio.run(run(args))
+    print(json.dumps(result, indent=2))
+    if not all(check["ok"] for check in result.values()):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Tweet resolver behaviour against local vxtwitter/fxtwitter stand-ins.
+
+Scenarios: both backends healthy, a heavy latency tail on the primary, and
+the primary failing outright (its circuit breaker should open). For each,
+resolves many tweets with and without hedging and prints latency percentiles
+and per-backend request counts as JSON.
+
+    python -m benchmarks.resolver_hedging --lookups 300
+"""
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import time
+
+import httpx
+
+from app.downloader.resolvers import CircuitBreaker, FxTwitterBackend, TweetResolver, VxTwitterBackend
+from benchmarks.fake_services import FakeTweetBackend, FaultInjector
+
+SCENARIOS = {
+    "healthy": dict(latency=0.02),
+    "slow_tail": dict(latency=0.02, slow_rate=0.1, slow_delay=1.5),
+    "failing": dict(latency=0.02, failure_rate=1.0),
+}
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+async def run(scenario: str, hedged: bool, lookups: int, concurrency: int) -> dict:
+    primary = await FakeTweetBackend("vxtwitter", FaultInjector(seed=1, **SCENARIOS[scenario])).start()
+    secondary = await FakeTweetBackend("fxtwitter", FaultInjector(latency=0.03, seed=2)).start()
+    backends = [
+        VxTwitterBackend(primary.base_url, timeout=5, breaker=CircuitBreaker(5, 30)),
+        FxTwitterBackend(secondary.base_url, timeout=5, breaker=CircuitBreaker(5, 30)),
+    ]
+    # Without hedging the secondary is only asked after the primary fails
+    resolver = TweetResolver(backends, max_hedge_delay=0.5 if hedged else 3600.0,
+                             min_hedge_delay=0.05 if hedged else 3600.0)
+
+    latencies, errors = [], 0
+    semaphore = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(limits=httpx.Limits(max_connections=concurrency * 2)) as client:
+        async def lookup(i: int):
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    await resolver.resolve(client, str(1000 + i))
+                except Exception:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        await asyncio.gather(*(lookup(i) for i in range(lookups)))
+
+    await primary.stop()
+    await secondary.stop()
+    return {
+        "scenario": scenario,
+        "hedged": hedged,
+        "lookups": lookups,
+        "errors": errors,
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "primary_requests": primary.faults.requests,
+        "secondary_requests": secondary.faults.requests,
+        "primary_breaker": backends[0].breaker.state,
+    }
+
+async def main():
+    logging.basicConfig(level=logging.ERROR)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lookups", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+
+    results = []
+    for scenario in SCENARIOS:
+        for hedged in (False, True):
+            results.append(await run(scenario, hedged, args.lookups, args.concurrency))
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    asyncio.run(main())
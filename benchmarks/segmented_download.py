@@ -0,0 +1,117 @@
+"""
+SegmentedDownloader against a local fake CDN, with and without Range support.
+
+Downloads one video per mode from a FakeCdn and compares every byte of the
+result with what the CDN served:
+
+- ranges: 206 answers, parallel segments
+- ranges+drops: connections cut off mid-segment, resumed from the progress file
+- no-ranges: Range ignored, the probe's 200 is streamed in one piece
+- no-ranges+drops: a cut-off plain stream must raise rather than leave a short
+  file behind (there is nothing to resume from)
+- retries=0: a clean ranged download must succeed without any retry
+- last-retry: the first segment response is cut off and the only retry
+  completes the file, which must count as a success
+
+Prints JSON and exits non-zero if a check fails.
+
+    python -m benchmarks.segmented_download --size-mb 32 --drop-rate 0.3
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from typing import Optional
+
+import httpx
+
+from app.downloader.segmented import SegmentedDownloader
+from benchmarks.fake_services import FakeCdn
+
+def ignore_dropped(loop, context):
+    # Connections the CDN cuts off on purpose
+    if not isinstance(context.get("exception"), ConnectionResetError):
+        loop.default_exception_handler(context)
+
+def matches(cdn: FakeCdn, path: str, size: int, chunk: int = 4 * 1024 * 1024) -> bool:
+    if os.path.getsize(path) != size:
+        return False
+    with open(path, "rb") as f:
+        for start in range(0, size, chunk):
+            if f.read(chunk) != cdn.content(start, min(chunk, size - start)):
+                return False
+    return True
+
+async def run_mode(args, mode: str, ranges: bool = True, drop_rate: float = 0.0, drop_first: int = 0,
+                   retries: Optional[int] = None, segments: Optional[int] = None) -> dict:
+    size = int(args.size_mb * 1024 * 1024)
+    cdn = await FakeCdn(args.bandwidth_mbps * 1024 * 1024 / 8, ranges=ranges, drop_rate=drop_rate,
+                        drop_first=drop_first, seed=1).start()
+    client = httpx.AsyncClient(http2=False)
+    downloader = SegmentedDownloader(
+        client,
+        segments=segments or args.segments,
+        min_segment_size=1024 * 1024,
+        retries=args.retries if retries is None else retries,
+    )
+    error = None
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "video.mp4")
+        started = time.perf_counter()
+        try:
+            await downloader.download(f"{cdn.base_url}/video/{size}/bench/video.mp4", path)
+        except Exception as e:
+            error = e
+        duration = time.perf_counter() - started
+        complete = error is None and matches(cdn, path, size)
+        leftover_state = os.path.exists(f"{path}.parts")
+    await client.aclose()
+    await cdn.stop()
+
+    if ranges or not (drop_rate or drop_first):
+        ok = complete and not leftover_state
+    else:
+        ok = complete or isinstance(error, httpx.HTTPError)
+    return {
+        "mode": mode,
+        "size_mb": args.size_mb,
+        "requests": cdn.faults.requests,
+        "drops": cdn.drops,
+        "served_mb": round(cdn.bytes_served / 2**20, 1),
+        "duration_s": round(duration, 3),
+        "bytes_match": complete,
+        "error": repr(error) if error else None,
+        "ok": ok,
+    }
+
+async def run(args) -> list:
+    asyncio.get_running_loop().set_exception_handler(ignore_dropped)
+    return [
+        await run_mode(args, "ranges"),
+        await run_mode(args, "ranges+drops", drop_rate=args.drop_rate),
+        await run_mode(args, "no-ranges", ranges=False),
+        await run_mode(args, "no-ranges+drops", ranges=False, drop_rate=args.drop_rate),
+        await run_mode(args, "retries=0", retries=0),
+        await run_mode(args, "last-retry", drop_first=1, retries=1, segments=1),
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=float, default=32)
+    parser.add_argument("--segments", type=int, default=4)
+    parser.add_argument("--retries", type=int, default=5)
+    parser.add_argument("--drop-rate", type=float, default=0.3, help="share of responses cut off mid-body")
+    parser.add_argument("--bandwidth-mbps", type=float, default=400, help="per-response cap, 0 = unlimited")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    results = asyncio.run(run(args))
+    print(json.dumps(results, indent=2))
+    if not all(result["ok"] for result in results):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
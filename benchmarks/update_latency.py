@@ -0,0 +1,131 @@
+"""
+Update-to-first-reply latency, polling vs webhook, against a local fake Bot API.
+
+The fake Bot API runs in its own process so it doesn't compete with the bot
+for the event loop. The bot runs a trivial echo handler, so the numbers reflect
+how quickly updates reach the application. Messages are injected at a steady
+rate or as a single burst (a busy bot), each from its own chat; latency is the
+time from injection until the fake API receives the reply. Prints JSON.
+
+    python -m benchmarks.update_latency --messages 200 --rate 50
+"""
+import argparse
+import asyncio
+import json
+import logging
+import socket
+import statistics
+import sys
+
+import httpx
+from telegram import Update
+from telegram.ext import ApplicationBuilder, ContextTypes, MessageHandler, filters
+
+from app.bot.update_processor import ChatSerializingUpdateProcessor
+from app.core.config import config
+from app.bot.webhook import WebhookServer, run_webhook
+
+TOKEN = "123456:bench"
+
+async def echo(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text("pong")
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+async def start_fake_api(api_latency: float):
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "benchmarks.fake_services", "botapi", "--latency", str(api_latency),
+        stdout=asyncio.subprocess.PIPE,
+    )
+    line = (await process.stdout.readline()).decode()
+    if not line.startswith("READY"):
+        process.kill()
+        raise RuntimeError("Fake Bot API didn't start")
+    return process, f"http://127.0.0.1:{line.split()[1]}"
+
+async def measure(control: httpx.AsyncClient, messages: int, rate: float) -> list:
+    await control.post("/_control/reset")
+    await control.post("/_control/push", json={
+        "messages": [{"chat_id": 10_000 + i, "text": f"ping {i}"} for i in range(messages)],
+        "rate": rate,
+    })
+    for _ in range(6000):
+        result = (await control.get("/_control/results")).json()["result"]
+        if len(result["latencies"]) >= messages:
+            break
+        await asyncio.sleep(0.01)
+    return result["latencies"]
+
+async def run(mode: str, messages: int, rate: float, api_latency: float) -> dict:
+    process, api_url = await start_fake_api(api_latency)
+    control = httpx.AsyncClient(base_url=api_url)
+    builder = (
+        ApplicationBuilder()
+        .token(TOKEN)
+        .base_url(f"{api_url}/bot")
+        .concurrent_updates(ChatSerializingUpdateProcessor(config.MAX_CONCURRENT_UPDATES))
+    )
+    if mode == "webhook":
+        builder.updater(None)
+    application = builder.build()
+    application.add_handler(MessageHandler(filters.TEXT, echo))
+
+    try:
+        if mode == "webhook":
+            port = free_port()
+            server = WebhookServer(application, "127.0.0.1", port, "/telegram", secret_token="bench-secret")
+            stop = asyncio.Event()
+            runner = asyncio.create_task(
+                run_webhook(application, server, f"http://127.0.0.1:{port}/telegram", stop_event=stop)
+            )
+            while not (await control.get("/_control/results")).json()["result"]["webhook_url"]:
+                await asyncio.sleep(0.01)
+            latencies = await measure(control, messages, rate)
+            stop.set()
+            await runner
+        else:
+            async with application:
+                await application.updater.start_polling(poll_interval=0, timeout=10)
+                await application.start()
+                latencies = await measure(control, messages, rate)
+                await application.updater.stop()
+                await application.stop()
+    finally:
+        await control.aclose()
+        process.terminate()
+        await process.wait()
+
+    return {
+        "mode": mode,
+        "messages": messages,
+        "rate_per_s": rate or "burst",
+        "api_latency_ms": api_latency * 1000,
+        "replied": len(latencies),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+    }
+
+async def main():
+    logging.basicConfig(level=logging.ERROR)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=50, help="messages per second for the steady run")
+    parser.add_argument("--api-latency", type=float, default=0.02, help="simulated Bot API round trip (s)")
+    args = parser.parse_args()
+
+    results = []
+    for rate in (args.rate, 0):
+        for mode in ("polling", "webhook"):
+            results.append(await run(mode, args.messages, rate, args.api_latency))
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    asyncio.run(main())
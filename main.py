@@ -1,23 +1,42 @@
+import asyncio
 import logging
 import os
+import sys
 from telegram import BotCommand, BotCommandScopeChat
 from telegram.ext import (
     ApplicationBuilder,
     CommandHandler,
+    ContextTypes,
     MessageHandler,
     PicklePersistence,
     filters,
 )
 
 from app.core.config import config
+from app.bot.rate_limiter import TelegramRateLimiter
+from app.bot.update_processor import ChatSerializingUpdateProcessor
+from app.bot.webhook import WebhookServer, make_ssl_context, run_webhook
+from app.bot.batch import batch_command, handle_document
+from app.bot.filters import tweet_links
+from app.bot.worker import QueueWorker, run_worker
 from app.bot.handlers import (
     start,
     help_command,
     stats_command,
     reset_stats_command,
+    profile_command,
     handle_message,
     error_handler,
+    downloader,
+    file_id_cache,
+    media_dir,
+    work_queue,
 )
+from app.core.http import http_pool
+from app.core.http_server import HttpServer, Response
+from app.core.metrics import metrics, media_sent, messages_handled
+from app.core.persistence import SQLitePersistence, TrackingDict, migrate_pickle
+from app.core.tracing import tracer
 
 # Enable logging
 logging.basicConfig(
@@ -27,15 +46,47 @@ logging.basicConfig(
 logging.getLogger("httpx").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
+metrics_server = HttpServer(config.METRICS_HOST, config.METRICS_PORT)
+worker_metrics_server = HttpServer(config.METRICS_HOST, config.WORKER_METRICS_PORT)
+
 async def post_init(application):
-    """Set up commands after application is initialized."""
+    """Set up commands and shared resources after application is initialized."""
+    await http_pool.open()
+
+    metrics.load()
+    # Counters used to live in bot_data; carry them over once
+    legacy_stats = application.bot_data.pop('stats', None)
+    if legacy_stats:
+        messages_handled.inc(legacy_stats.get('messages_handled', 0))
+        media_sent.inc(legacy_stats.get('media_downloaded', 0), type="legacy")
+    if application.job_queue:
+        application.job_queue.run_repeating(
+            flush_metrics, interval=config.METRICS_FLUSH_INTERVAL, name="flush_metrics"
+        )
+    if config.METRICS_PORT:
+        metrics_server.route("GET", "/metrics", serve_metrics)
+        await metrics_server.start()
+
+    if work_queue:
+        # Workers on this host may be downloading into the same directory
+        media_dir.sweep_orphans(max_age=config.SHARED_DIR_ORPHAN_AGE)
+    else:
+        # Nothing is in flight yet, so every leftover fallback file is an orphan
+        media_dir.sweep_orphans()
+    if application.job_queue:
+        application.job_queue.run_repeating(
+            sweep_media_dir, interval=3600, first=3600, name="sweep_media_dir"
+        )
+
     public_commands = [
         BotCommand("start", "Start the bot"),
         BotCommand("help", "Help message"),
+        BotCommand("batch", "Download every tweet in a list of links"),
     ]
     dev_commands = public_commands + [
         BotCommand("stats", "Get bot statistics"),
         BotCommand("resetstats", "Reset bot statistics"),
+        BotCommand("profile", "Profile the event loop for N seconds"),
     ]
     
     await application.bot.set_my_commands(public_commands)
@@ -49,15 +100,54 @@ async def post_init(application):
         except Exception as e:
             logger.warning(f"Couldn't set commands for developer: {e}")
 
-def main():
-    """Start the bot."""
-    # Ensure data directory exists for persistence
-    os.makedirs(os.path.dirname(config.PERSISTENCE_PATH), exist_ok=True)
-    
-    persistence = PicklePersistence(filepath=config.PERSISTENCE_PATH)
-    
-    builder = ApplicationBuilder().token(config.BOT_TOKEN).persistence(persistence)
-    
+async def serve_metrics(request):
+    return Response(200, metrics.render().encode(), "text/plain; version=0.0.4; charset=utf-8")
+
+async def flush_metrics(context):
+    """Write the in-memory metrics to disk in one batch."""
+    # Snapshot on the loop, where the metrics are updated; only the file I/O runs in a thread
+    await asyncio.to_thread(metrics.write, metrics.dump())
+
+async def sweep_media_dir(context):
+    """Remove fallback files that outlived any transfer (e.g. after upload timeouts)."""
+    media_dir.sweep_orphans(max_age=config.SHARED_DIR_ORPHAN_AGE)
+
+async def post_shutdown(application):
+    """Release shared resources when the application stops."""
+    await metrics_server.stop()
+    metrics.flush()
+    await downloader.close()
+    await http_pool.close()
+    file_id_cache.close()
+    tracer.close()
+    if work_queue:
+        await work_queue.close()
+
+async def worker_post_init(application):
+    """Set up shared resources of a worker process."""
+    await http_pool.open()
+    # Metrics stay in memory; METRICS_PATH belongs to the front end
+    if tracer.enabled:
+        stem, ext = os.path.splitext(tracer.path)
+        tracer.path = f"{stem}.worker-{os.getpid()}{ext}"
+    if config.WORKER_METRICS_PORT:
+        worker_metrics_server.route("GET", "/metrics", serve_metrics)
+        await worker_metrics_server.start()
+    media_dir.sweep_orphans(max_age=config.SHARED_DIR_ORPHAN_AGE)
+
+async def worker_post_shutdown(application):
+    """Release the resources of a worker process."""
+    await worker_metrics_server.stop()
+    await downloader.close()
+    await http_pool.close()
+    file_id_cache.close()
+    tracer.close()
+    await work_queue.close()
+
+def bot_builder():
+    """ApplicationBuilder with the Bot API settings shared by the bot and its workers."""
+    builder = ApplicationBuilder().token(config.BOT_TOKEN)
+
     # Increase timeouts for large file uploads
     builder.read_timeout(3600).write_timeout(3600).connect_timeout(120)
     
@@ -67,22 +157,109 @@ def main():
         builder.base_url(config.BOT_API_BASE_URL)
         builder.local_mode(True)
 
-    application = builder.post_init(post_init).build()
+    if config.RATE_LIMITER:
+        builder.rate_limiter(
+            TelegramRateLimiter(
+                global_rate=config.RATE_LIMIT_GLOBAL,
+                private_chat_rate=config.RATE_LIMIT_PRIVATE_CHAT,
+                group_rate_per_minute=config.RATE_LIMIT_GROUP_PER_MINUTE,
+                max_retries=config.RATE_LIMIT_MAX_RETRIES,
+            )
+        )
+    return builder
+
+def main():
+    """Start the bot."""
+    # Ensure data directory exists for persistence
+    os.makedirs(os.path.dirname(config.PERSISTENCE_PATH), exist_ok=True)
+    
+    if config.PERSISTENCE_BACKEND == "sqlite":
+        if not os.path.exists(config.SQLITE_PERSISTENCE_PATH) and os.path.exists(config.PERSISTENCE_PATH):
+            logger.info(f"Importing {config.PERSISTENCE_PATH} into {config.SQLITE_PERSISTENCE_PATH}")
+            asyncio.run(migrate_pickle(config.PERSISTENCE_PATH, config.SQLITE_PERSISTENCE_PATH))
+        # bot_data remembers which keys were touched so only those are written
+        context_types = ContextTypes(bot_data=TrackingDict)
+        persistence = SQLitePersistence(config.SQLITE_PERSISTENCE_PATH, context_types=context_types)
+    else:
+        context_types = ContextTypes()
+        persistence = PicklePersistence(filepath=config.PERSISTENCE_PATH)
+    
+    builder = bot_builder().persistence(persistence).context_types(context_types)
+
+    if config.CONCURRENT_UPDATES:
+        logger.info(f"Processing updates concurrently (max {config.MAX_CONCURRENT_UPDATES} chats at once)")
+        builder.concurrent_updates(
+            ChatSerializingUpdateProcessor(
+                config.MAX_CONCURRENT_UPDATES,
+                max_pending=config.MAX_PENDING_UPDATES,
+            )
+        )
+
+    if config.UPDATE_MODE == "webhook":
+        if not config.WEBHOOK_URL:
+            raise SystemExit("UPDATE_MODE=webhook requires WEBHOOK_URL")
+        # Updates arrive through our own server, no getUpdates loop needed
+        builder.updater(None)
+
+    application = builder.post_init(post_init).post_shutdown(post_shutdown).build()
 
     # Add handlers
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))
     application.add_handler(CommandHandler("stats", stats_command, filters=filters.Chat(config.DEVELOPER_ID)))
     application.add_handler(CommandHandler("resetstats", reset_stats_command, filters=filters.Chat(config.DEVELOPER_ID)))
+    application.add_handler(CommandHandler("profile", profile_command, filters=filters.Chat(config.DEVELOPER_ID)))
     
-    # Message handler for tweet links
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    application.add_handler(CommandHandler("batch", batch_command))
+
+    # Message handler for tweet links; the entity pre-filter drops messages without one
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND & tweet_links, handle_message))
+    # Uploaded link lists run as a batch
+    application.add_handler(
+        MessageHandler(filters.Document.FileExtension("txt") | filters.Document.FileExtension("csv"), handle_document)
+    )
     
     # Error handler
     application.add_error_handler(error_handler)
 
     logger.info("Bot started. Press Ctrl+C to stop.")
-    application.run_polling()
+    if config.UPDATE_MODE == "webhook":
+        server = WebhookServer(
+            application,
+            config.WEBHOOK_LISTEN,
+            config.WEBHOOK_PORT,
+            config.WEBHOOK_PATH,
+            secret_token=config.WEBHOOK_SECRET_TOKEN,
+            ssl_context=make_ssl_context(config.WEBHOOK_TLS_CERT, config.WEBHOOK_TLS_KEY),
+            health_path=config.WEBHOOK_HEALTH_PATH,
+        )
+        asyncio.run(run_webhook(application, server, config.WEBHOOK_URL, certificate=config.WEBHOOK_TLS_CERT))
+    else:
+        application.run_polling()
+
+def worker_main():
+    """Run a download worker that takes tweet jobs from the work queue."""
+    if work_queue is None:
+        raise SystemExit("python main.py worker requires WORK_QUEUE_BACKEND")
+    # No persistence or update fetching, the front end owns both
+    application = (
+        bot_builder()
+        .updater(None)
+        .post_init(worker_post_init)
+        .post_shutdown(worker_post_shutdown)
+        .build()
+    )
+    worker = QueueWorker(
+        application,
+        work_queue,
+        concurrency=config.WORKER_CONCURRENCY,
+        poll_interval=config.WORK_QUEUE_POLL_INTERVAL,
+        retry_delay=config.WORK_QUEUE_RETRY_DELAY,
+    )
+    asyncio.run(run_worker(application, worker))
 
 if __name__ == "__main__":
-    main()
+    if sys.argv[1:2] == ["worker"]:
+        worker_main()
+    else:
+        main()